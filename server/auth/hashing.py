@@ -0,0 +1,100 @@
+# server/auth/hashing.py
+"""
+Хэширование паролей (bcrypt) вне event loop.
+
+bcrypt тратит 100–300 мс CPU на вызов; прямо в async-обработчике это
+замораживает все запросы и WebSocket'ы воркера. PasswordHasher отдаёт
+работу в отдельный пул потоков (bcrypt отпускает GIL) фиксированного
+размера и ограничивает очередь: если ждущих больше max_queue, вызов сразу
+получает HasherBusy (обработчики отвечают 503), а не копит хвост.
+
+workers=0 — считать прямо в event loop (только для сравнения в бенчмарке).
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import bcrypt
+
+from core import metrics
+
+_seconds = metrics.histogram("auth_hash_seconds", "bcrypt call duration (CPU)", ("op",))
+_wait = metrics.histogram("auth_hash_wait_seconds", "Time spent waiting for a hashing worker", ("op",))
+_rejected = metrics.counter("auth_hash_rejected_total", "Hashing calls rejected because the pool is saturated")
+
+
+class HasherBusy(Exception):
+    """Пул хэширования переполнен."""
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = 2, max_queue: int = 32, rounds: int = 12):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self.pending = 0  # выполняются + ждут
+        self._executor = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt") if workers > 0 else None
+        )
+        metrics.gauge("auth_hash_pending", "Hashing calls running or queued", fn=lambda: self.pending)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self._hash, password)
+
+    async def check(self, password: str, hashed: str) -> bool:
+        return await self._run("check", self._check, password, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "name": "auth_hasher",
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            "rejected": _rejected.value(),
+        }
+
+    # ---------- internals ----------
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.rounds)).decode()
+
+    @staticmethod
+    def _check(password: str, hashed: str) -> bool:
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+
+    async def _run(self, op: str, fn: Callable, *args):
+        if self._executor is None:
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                _seconds.observe(time.perf_counter() - started, op=op)
+
+        if self.pending >= self.workers + self.max_queue:
+            _rejected.inc()
+            raise HasherBusy("Сервер авторизации перегружен, попробуйте позже")
+
+        queued_at = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            _wait.observe(started - queued_at, op=op)
+            try:
+                return fn(*args)
+            finally:
+                _seconds.observe(time.perf_counter() - started, op=op)
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self.pending -= 1
+
+
+hasher = PasswordHasher(
+    workers=int(os.getenv("AUTH_HASH_WORKERS", "2")),
+    max_queue=int(os.getenv("AUTH_HASH_MAX_QUEUE", "32")),
+)
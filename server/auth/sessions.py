@@ -0,0 +1,143 @@
+# server/auth/sessions.py
+"""
+Сессии SMART AUTH в памяти воркера.
+
+- session_cache — token -> {session_id, user}; срок записи — не дольше TTL
+  кэша и не дольше жизни самой сессии. logout сбрасывает запись только
+  в своём воркере: в остальных отозванный токен продолжает работать,
+  пока запись не истечёт. Это окно и есть AUTH_SESSION_CACHE_TTL
+  (по умолчанию 5 с); 0 — без кэша, каждый запрос проверяет сессию в БД.
+- last_used     — write-behind для smart_sessions.last_used_at: отметки
+  копятся в памяти и пишутся одним UPDATE ... FROM unnest(...) раз
+  в flush_interval (по последней отметке на сессию).
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+import db
+from core import metrics
+from core.cache import MISSING, TTLCache, on_user_changed
+
+log = logging.getLogger("auth.sessions")
+
+_flushed = metrics.counter("auth_last_used_flushed_total", "last_used_at values written")
+
+# TTL = сколько отозванная сессия живёт в других воркерах, держать коротким
+SESSION_CACHE_TTL = float(os.getenv("AUTH_SESSION_CACHE_TTL", "5"))
+
+session_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_SESSION_CACHE_SIZE", "10000")),
+    ttl=SESSION_CACHE_TTL,
+    name="auth_sessions",
+)
+
+
+async def lookup_session(token: Optional[str]) -> Optional[dict]:
+    """
+    {"session_id", "user": {id, email, name, level}} активной сессии или None.
+    Промах — один запрос (сессия + пользователь), попадание — ни одного.
+    Пул БД ещё не готов — HTTPException 503.
+    """
+    if not token:
+        return None
+
+    cached = session_cache.get(token)
+    if cached is not MISSING:
+        return cached
+
+    if db.pool is None:
+        raise HTTPException(503, "Database connection not initialized")
+
+    row = await db.pool.fetchrow(
+        """
+        SELECT s.id AS session_id,
+               EXTRACT(EPOCH FROM (s.expires_at - now()))::float8 AS remaining,
+               u.id, u.email, u.name, u.level
+        FROM smart_sessions s
+        JOIN smart_users u ON u.id = s.user_id
+        WHERE s.token = $1 AND s.expires_at > now()
+        LIMIT 1
+        """,
+        token
+    )
+    if not row:
+        return None
+
+    session = {
+        "session_id": row["session_id"],
+        "user": {"id": row["id"], "email": row["email"], "name": row["name"], "level": row["level"]},
+    }
+    if SESSION_CACHE_TTL > 0:
+        session_cache.set(token, session, ttl=min(SESSION_CACHE_TTL, row["remaining"]))
+    return session
+
+
+def invalidate_session(token: str) -> None:
+    session_cache.invalidate(token)
+
+
+@on_user_changed
+def invalidate_user_sessions(user_id: str) -> None:
+    # в записях лежат email/name/level — после правки профиля перечитываем
+    session_cache.invalidate_values(lambda s: str(s["user"]["id"]) == user_id)
+
+
+class LastUsedWriter:
+    def __init__(self, flush_interval: float = 30.0):
+        self.flush_interval = flush_interval
+        self._pending: Dict = {}  # session_id -> datetime (naive UTC, как expires_at)
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, session_id) -> None:
+        self._pending[session_id] = datetime.utcnow()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="auth-last-used")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending or db.pool is None:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await db.pool.execute(
+                """
+                UPDATE smart_sessions s
+                SET last_used_at = v.ts
+                FROM unnest($1::uuid[], $2::timestamp[]) AS v(id, ts)
+                WHERE s.id = v.id
+                  AND (s.last_used_at IS NULL OR s.last_used_at < v.ts)
+                """,
+                list(batch.keys()),
+                list(batch.values()),
+            )
+            _flushed.inc(len(batch))
+        except Exception as e:
+            log.warning("last_used_at flush of %d sessions failed: %s", len(batch), e)
+            # более свежие отметки, пришедшие за время записи, не затираем
+            for sid, ts in batch.items():
+                self._pending.setdefault(sid, ts)
+
+    def stats(self) -> dict:
+        return {"name": "auth_last_used", "pending": len(self._pending), "flushed": _flushed.value()}
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+last_used = LastUsedWriter(flush_interval=float(os.getenv("AUTH_LAST_USED_INTERVAL", "30")))
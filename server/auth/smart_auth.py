@@ -2,12 +2,15 @@ from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta
-import bcrypt
+from typing import Optional
 import secrets
 import os
 
 # ❗ Правильный импорт пула
 import db
+from core.cache import user_changed
+from auth.hashing import HasherBusy, hasher
+from auth.sessions import invalidate_session, last_used, lookup_session
 
 router = APIRouter()
 
@@ -38,12 +41,20 @@ SESSION_COOKIE = "smart_session"
 SESSION_LIFETIME_DAYS = 7
 
 
-def make_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+# bcrypt считается в пуле auth.hashing, не в event loop;
+# соединение с БД на время хэширования не держим.
+async def make_hash(password: str) -> str:
+    try:
+        return await hasher.hash(password)
+    except HasherBusy as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": "1"})
 
 
-def check_hash(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+async def check_hash(password: str, hashed: str) -> bool:
+    try:
+        return await hasher.check(password, hashed)
+    except HasherBusy as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": "1"})
 
 
 def generate_token() -> str:
@@ -54,6 +65,18 @@ def expire_time():
     return datetime.utcnow() + timedelta(days=SESSION_LIFETIME_DAYS)
 
 
+async def get_session_user(token: Optional[str]) -> Optional[dict]:
+    """
+    Пользователь активной сессии по токену (id, email, name, level) или None.
+    Для проверки доступа в других модулях; last_used_at не трогает.
+    """
+    if not token or db.pool is None:
+        return None
+
+    session = await lookup_session(token)
+    return session["user"] if session else None
+
+
 # ===============================
 # REGISTER
 # ===============================
@@ -66,26 +89,27 @@ async def register(req: RegisterRequest):
     if db.pool is None:
         raise HTTPException(500, "Database connection not initialized")
 
-    async with db.pool.acquire() as conn:
-        user = await conn.fetchrow(
-            "SELECT id FROM smart_users WHERE email = $1",
-            email
-        )
-        if user:
-            raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
-
-        password_hash = make_hash(req.password)
-
-        new_user = await conn.fetchrow(
-            """
-            INSERT INTO smart_users (email, name, password_hash, level)
-            VALUES ($1, $2, $3, 2)
-            RETURNING id, email, name, level
-            """,
-            email, req.name, password_hash
-        )
+    user = await db.pool.fetchrow(
+        "SELECT id FROM smart_users WHERE email = $1",
+        email
+    )
+    if user:
+        raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
+
+    password_hash = await make_hash(req.password)
+
+    new_user = await db.pool.fetchrow(
+        """
+        INSERT INTO smart_users (email, name, password_hash, level)
+        VALUES ($1, $2, $3, 2)
+        RETURNING id, email, name, level
+        """,
+        email, req.name, password_hash
+    )
+    # «нет такого пользователя» могло остаться в кэшах
+    user_changed(new_user["id"])
 
-        return {"ok": True, "user": dict(new_user)}
+    return {"ok": True, "user": dict(new_user)}
 
 
 # ===============================
@@ -100,37 +124,36 @@ async def login(req: LoginRequest):
     if db.pool is None:
         raise HTTPException(500, "Database connection not initialized")
 
-    async with db.pool.acquire() as conn:
-        user = await conn.fetchrow(
-            "SELECT * FROM smart_users WHERE email = $1 LIMIT 1",
-            email
-        )
-
-        if not user or not check_hash(req.password, user["password_hash"]):
-            raise HTTPException(status_code=401, detail="Неверный email или пароль")
-
-        token = generate_token()
-        expires = expire_time()
-
-        await conn.execute(
-            """
-            INSERT INTO smart_sessions (user_id, token, expires_at, user_agent, last_used_at)
-            VALUES ($1, $2, $3, $4, now())
-            """,
-            user["id"], token, expires, "browser"
-        )
-
-        resp = JSONResponse({"ok": True, "user_id": str(user["id"])})
-
-        resp.set_cookie(
-            key=SESSION_COOKIE,
-            value=token,
-            httponly=True,
-            samesite="lax",
-            max_age=60 * 60 * 24 * SESSION_LIFETIME_DAYS,
-            secure=True
-        )
-        return resp
+    user = await db.pool.fetchrow(
+        "SELECT id, password_hash FROM smart_users WHERE email = $1 LIMIT 1",
+        email
+    )
+
+    if not user or not user["password_hash"] or not await check_hash(req.password, user["password_hash"]):
+        raise HTTPException(status_code=401, detail="Неверный email или пароль")
+
+    token = generate_token()
+    expires = expire_time()
+
+    await db.pool.execute(
+        """
+        INSERT INTO smart_sessions (user_id, token, expires_at, user_agent, last_used_at)
+        VALUES ($1, $2, $3, $4, now())
+        """,
+        user["id"], token, expires, "browser"
+    )
+
+    resp = JSONResponse({"ok": True, "user_id": str(user["id"])})
+
+    resp.set_cookie(
+        key=SESSION_COOKIE,
+        value=token,
+        httponly=True,
+        samesite="lax",
+        max_age=60 * 60 * 24 * SESSION_LIFETIME_DAYS,
+        secure=True
+    )
+    return resp
 
 
 # ===============================
@@ -147,34 +170,20 @@ async def me(request: Request):
     if db.pool is None:
         raise HTTPException(500, "Database connection not initialized")
 
-    async with db.pool.acquire() as conn:
-        session = await conn.fetchrow(
-            """
-            SELECT * FROM smart_sessions
-            WHERE token = $1 AND expires_at > now()
-            LIMIT 1
-            """,
-            token
-        )
-
-        if not session:
-            return {"loggedIn": False, "level": 1, "user": None}
-
-        await conn.execute(
-            "UPDATE smart_sessions SET last_used_at = now() WHERE id = $1",
-            session["id"]
-        )
+    # сессия + пользователь из кэша (на промахе — один запрос)
+    session = await lookup_session(token)
+    if not session:
+        return {"loggedIn": False, "level": 1, "user": None}
 
-        user = await conn.fetchrow(
-            "SELECT id, email, name, level FROM smart_users WHERE id = $1",
-            session["user_id"]
-        )
+    # last_used_at пишется пачкой в фоне (auth.sessions.last_used)
+    last_used.touch(session["session_id"])
 
-        return {
-            "loggedIn": True,
-            "level": user["level"],
-            "user": dict(user)
-        }
+    user = session["user"]
+    return {
+        "loggedIn": True,
+        "level": user["level"],
+        "user": dict(user)
+    }
 
 
 # ===============================
@@ -201,6 +210,8 @@ async def logout(request: Request):
             token
         )
 
+    invalidate_session(token)
+
     return resp
 
 
@@ -216,26 +227,26 @@ async def reset_password(req: ResetPasswordRequest):
     if db.pool is None:
         raise HTTPException(500, "Database connection not initialized")
 
-    async with db.pool.acquire() as conn:
-        user = await conn.fetchrow(
-            "SELECT id FROM smart_users WHERE email = $1 LIMIT 1",
-            email
-        )
-
-        if not user:
-            raise HTTPException(status_code=404, detail="Пользователь с таким email не найден")
-
-        new_pass = secrets.token_hex(3)
-        new_hash = make_hash(new_pass)
-
-        await conn.execute(
-            "UPDATE smart_users SET password_hash = $1, password = NULL WHERE id = $2",
-            new_hash,
-            user["id"]
-        )
-
-        return {
-            "ok": True,
-            "email": email,
-            "new_password": new_pass
-        }
+    user = await db.pool.fetchrow(
+        "SELECT id FROM smart_users WHERE email = $1 LIMIT 1",
+        email
+    )
+
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь с таким email не найден")
+
+    new_pass = secrets.token_hex(3)
+    new_hash = await make_hash(new_pass)
+
+    await db.pool.execute(
+        "UPDATE smart_users SET password_hash = $1, password = NULL WHERE id = $2",
+        new_hash,
+        user["id"]
+    )
+    user_changed(user["id"])
+
+    return {
+        "ok": True,
+        "email": email,
+        "new_password": new_pass
+    }
@@ -0,0 +1,145 @@
+# server/auth/sweeper.py
+"""
+Фоновая чистка протухших smart_sessions.
+
+login добавляет строку на каждый вход, а удаляет их только logout, поэтому
+таблица растёт без ограничений. SessionSweeper раз в interval удаляет
+сессии с expires_at < now() пачками по batch_size (не больше max_batches
+за проход, с паузой между пачками), чтобы не держать долгих блокировок.
+Несколько воркеров не мешают друг другу: строки берутся через SKIP LOCKED.
+
+Индексы по token и expires_at создаёт migrations/006 (CONCURRENTLY, вручную);
+на старте задача проверяет, что они есть и валидны, и предупреждает в лог,
+если нет: без них и lookup_session, и чистка идут полным сканом.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import List, Optional
+
+import db
+from core import metrics
+
+log = logging.getLogger("auth.sweeper")
+
+_purged = metrics.counter("auth_sessions_purged_total", "Expired sessions deleted")
+_sweep_seconds = metrics.histogram("auth_session_sweep_seconds", "Duration of one sweep")
+
+# migrations/006
+INDEXES = ("smart_sessions_token_key", "smart_sessions_expires_at_idx")
+
+
+class SessionSweeper:
+    def __init__(self,
+                 interval: float = 3600.0,
+                 batch_size: int = 1000,
+                 max_batches: int = 100,
+                 pause: float = 0.05):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.pause = pause
+
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[dict] = None
+        self.missing_indexes: Optional[List[str]] = None
+
+    def start(self) -> None:
+        """Запускает чистку; первым делом задача проверяет индексы (check_indexes)."""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop(), name="auth-session-sweeper")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def check_indexes(self) -> List[str]:
+        """Индексы из INDEXES, которых нет или которые INVALID (прерванный CONCURRENTLY)."""
+        rows = await db.pool.fetch(
+            """
+            SELECT c.relname AS name
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = 'public.smart_sessions'::regclass
+              AND i.indisvalid
+              AND c.relname = ANY($1::text[])
+            """,
+            list(INDEXES),
+        )
+        present = {r["name"] for r in rows}
+        self.missing_indexes = [name for name in INDEXES if name not in present]
+        if self.missing_indexes:
+            log.warning("smart_sessions indexes missing or invalid: %s — apply migrations/006",
+                        ", ".join(self.missing_indexes))
+        return self.missing_indexes
+
+    async def sweep(self) -> dict:
+        """Один проход. Возвращает {"purged", "batches", "seconds"}."""
+        started = time.monotonic()
+        purged = 0
+        batches = 0
+
+        while batches < self.max_batches:
+            status = await db.pool.execute(
+                """
+                DELETE FROM smart_sessions
+                WHERE id IN (
+                    SELECT id FROM smart_sessions
+                    WHERE expires_at < now()
+                    ORDER BY expires_at
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                """,
+                self.batch_size,
+            )
+            deleted = int(status.split()[-1])
+            purged += deleted
+            batches += 1
+            if deleted < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+
+        elapsed = time.monotonic() - started
+        _purged.inc(purged)
+        _sweep_seconds.observe(elapsed)
+
+        self.last_run = {"purged": purged, "batches": batches, "seconds": round(elapsed, 3)}
+        if purged:
+            log.info("expired sessions purged: %d in %d batches, %.2fs", purged, batches, elapsed)
+        return self.last_run
+
+    def stats(self) -> dict:
+        return {
+            "name": "auth_session_sweeper",
+            "interval": self.interval,
+            "purged_total": _purged.value(),
+            "last_run": self.last_run,
+            "missing_indexes": self.missing_indexes,
+        }
+
+    async def _loop(self) -> None:
+        try:
+            await self.check_indexes()
+        except Exception as e:
+            log.warning("smart_sessions index check failed: %s", e)
+        # разносим проходы воркеров во времени
+        await asyncio.sleep(random.uniform(0, min(self.interval, 60)))
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                log.exception("session sweep failed")
+            await asyncio.sleep(self.interval)
+
+
+session_sweeper = SessionSweeper(
+    interval=float(os.getenv("AUTH_SESSION_SWEEP_INTERVAL", "3600")),
+    batch_size=int(os.getenv("AUTH_SESSION_SWEEP_BATCH", "1000")),
+    max_batches=int(os.getenv("AUTH_SESSION_SWEEP_MAX_BATCHES", "100")),
+)
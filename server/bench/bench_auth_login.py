@@ -0,0 +1,127 @@
+# server/bench/bench_auth_login.py
+"""
+Бенчмарк: всплеск логинов и латентность постороннего эндпоинта.
+
+Внутри процесса поднимается приложение с роутером smart_auth и пустым
+GET /ping. --concurrency клиентов без пауз логинятся --seconds секунд,
+параллельно /ping запрашивается по расписанию каждые 10 мс (латентность —
+от запланированного момента, чтобы блокировка loop не пряталась из замера);
+печатаются p50/p99 /ping
+и пропускная способность логинов в двух режимах:
+  inline — bcrypt прямо в event loop (как было);
+  pool   — bcrypt в пуле auth.hashing (AUTH_HASH_WORKERS / AUTH_HASH_MAX_QUEUE).
+
+Запуск из папки server/ (создаёт и удаляет своего пользователя):
+    DATABASE_URL=postgres://... python -m bench.bench_auth_login --concurrency 16 --seconds 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI
+
+import db
+import auth.smart_auth as smart_auth
+from auth.hashing import PasswordHasher
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(smart_auth.router, prefix="/api/auth")
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def pct(samples, q):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+async def run(app, email: str, password: str, concurrency: int, seconds: float):
+    transport = httpx.ASGITransport(app=app)
+    deadline = time.perf_counter() + seconds
+    logins = {"ok": 0, "busy": 0}
+    probes = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="https://bench") as client:
+        async def login_loop():
+            while time.perf_counter() < deadline:
+                r = await client.post("/api/auth/login", json={"email": email, "password": password})
+                if r.status_code == 200:
+                    logins["ok"] += 1
+                elif r.status_code == 503:
+                    logins["busy"] += 1
+                    await asyncio.sleep(0.05)
+                else:
+                    raise RuntimeError(f"login failed: {r.status_code} {r.text}")
+
+        async def probe_loop():
+            # латентность считается от запланированного момента запроса:
+            # если event loop заблокирован, задержка старта тоже входит в замер
+            scheduled = time.perf_counter()
+            while scheduled < deadline:
+                await asyncio.sleep(max(scheduled - time.perf_counter(), 0))
+                await client.get("/ping")
+                probes.append((time.perf_counter() - scheduled) * 1000)
+                scheduled += 0.01
+
+        await asyncio.gather(probe_loop(), *(login_loop() for _ in range(concurrency)))
+
+    return {
+        "ping_p50": statistics.median(probes),
+        "ping_p99": pct(probes, 0.99),
+        "ping_max": max(probes),
+        "logins_per_s": logins["ok"] / seconds,
+        "busy": logins["busy"],
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--workers", type=int, default=int(os.getenv("AUTH_HASH_WORKERS", "2")))
+    ap.add_argument("--max-queue", type=int, default=int(os.getenv("AUTH_HASH_MAX_QUEUE", "32")))
+    args = ap.parse_args()
+
+    await db.init_db()
+    email = f"bench-login-{uuid.uuid4().hex[:8]}@example.com"
+    password = "bench-password"
+    password_hash = await PasswordHasher(workers=0).hash(password)
+    await db.pool.execute(
+        "INSERT INTO smart_users (email, name, password_hash, level) VALUES ($1, 'bench', $2, 2)",
+        email, password_hash,
+    )
+
+    app = make_app()
+    modes = {
+        "inline": PasswordHasher(workers=0),
+        "pool": PasswordHasher(workers=args.workers, max_queue=args.max_queue),
+    }
+    try:
+        print(f"concurrency={args.concurrency} seconds={args.seconds} workers={args.workers} max_queue={args.max_queue}")
+        for name, h in modes.items():
+            smart_auth.hasher = h
+            r = await run(app, email, password, args.concurrency, args.seconds)
+            print(
+                f"{name:<7} /ping p50={r['ping_p50']:.1f}ms p99={r['ping_p99']:.1f}ms max={r['ping_max']:.1f}ms"
+                f"  | logins/s={r['logins_per_s']:.1f} 503={r['busy']}"
+            )
+    finally:
+        await db.pool.execute(
+            "DELETE FROM smart_sessions WHERE user_id IN (SELECT id FROM smart_users WHERE email = $1)", email
+        )
+        await db.pool.execute("DELETE FROM smart_users WHERE email = $1", email)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+# server/bench/bench_auth_queries.py
+"""
+Бенчмарк запросов login / me: пул без кэша prepared statements
+(statement_cache_size=0, как за transaction-пулером) против именованных
+prepared statements (direct / session).
+
+Гоняются настоящие пути smart_auth.login и auth.sessions.lookup_session
+(кэш сессий сбрасывается перед каждым me, bcrypt — с минимальной стоимостью
+и inline, чтобы в замер попадали запросы). Печатаются p50/p99 вызова и
+среднее по каждому запросу из метрики db_query_seconds.
+
+Запуск из папки server/ на тестовой базе (создаёт и удаляет своего пользователя):
+    DATABASE_URL=postgres://... python -m bench.bench_auth_queries --iterations 2000 --concurrency 4
+
+За transaction-пулером режим direct не запустится — сравнивать на прямом
+подключении или через session-пулер.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import db
+import auth.smart_auth as smart_auth
+from auth.hashing import PasswordHasher
+from auth.sessions import lookup_session, session_cache
+
+SITES = ("auth.smart_auth.login", "auth.sessions.lookup_session")
+
+
+def pct(samples, q):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+def query_totals():
+    """{(site, op): (count, sum)} из гистограммы db_query_seconds."""
+    out = {}
+    n = len(db._query_seconds.buckets)
+    for (site, op), data in db._query_seconds._data.items():
+        if site in SITES:
+            out[(site, op)] = (data[n], data[n + 1])
+    return out
+
+
+async def run(email: str, password: str, iterations: int, concurrency: int):
+    req = smart_auth.LoginRequest(email=email, password=password)
+    timings = {"login": [], "me": []}
+    left = iterations
+
+    async def worker():
+        nonlocal left
+        while left > 0:
+            left -= 1
+            t0 = time.perf_counter()
+            resp = await smart_auth.login(req)
+            timings["login"].append((time.perf_counter() - t0) * 1000)
+
+            token = resp.headers["set-cookie"].split("=", 1)[1].split(";", 1)[0]
+            session_cache.invalidate(token)
+            t0 = time.perf_counter()
+            assert await lookup_session(token)
+            timings["me"].append((time.perf_counter() - t0) * 1000)
+
+    before = query_totals()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    after = query_totals()
+
+    per_query = {}
+    for key, (count, total) in after.items():
+        c0, s0 = before.get(key, (0, 0.0))
+        if count > c0:
+            per_query[key] = (total - s0) / (count - c0) * 1000
+    return timings, per_query
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iterations", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--warmup", type=int, default=200)
+    args = ap.parse_args()
+
+    smart_auth.hasher = PasswordHasher(workers=0, rounds=4)
+    db.pool = await db.create_pool("transaction")
+
+    email = f"bench-queries-{uuid.uuid4().hex[:8]}@example.com"
+    password = "bench-password"
+    await db.pool.execute(
+        "INSERT INTO smart_users (email, name, password_hash, level) VALUES ($1, 'bench', $2, 2)",
+        email, await smart_auth.hasher.hash(password),
+    )
+
+    try:
+        print(f"iterations={args.iterations} concurrency={args.concurrency} warmup={args.warmup}")
+        for mode in ("transaction", "direct"):
+            if db.pool.mode != mode:
+                await db.pool.close()
+                db.pool = await db.create_pool(mode)
+            await run(email, password, args.warmup, args.concurrency)
+            timings, per_query = await run(email, password, args.iterations, args.concurrency)
+
+            label = f"{mode} (prepared={db.pool.prepared})"
+            for name, samples in timings.items():
+                print(
+                    f"{label:<26} {name:<5} p50={statistics.median(samples):.3f}ms"
+                    f" p99={pct(samples, 0.99):.3f}ms"
+                )
+            for (site, op), mean in sorted(per_query.items()):
+                print(f"{'':<26}   {site}.{op}: mean={mean:.3f}ms")
+    finally:
+        await db.pool.execute(
+            "DELETE FROM smart_sessions WHERE user_id IN (SELECT id FROM smart_users WHERE email = $1)", email
+        )
+        await db.pool.execute("DELETE FROM smart_users WHERE email = $1", email)
+        await db.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,270 @@
+# server/bench/bench_get_vision.py
+"""
+Бенчмарк GET /vision/{vision_id}: read model одним запросом
+(repository.get_vision_full) против прежней последовательности из 6 запросов.
+
+Варианты:
+  - asyncpg, 6 queries — прежняя последовательность (роль -> визия -> шаги ->
+    авторы -> участники -> их имена) через тот же пул asyncpg; отличается от
+    read model только числом round-trip'ов;
+  - supabase, 6 http (--supabase) — исходный путь до переезда на asyncpg:
+    те же 6 запросов через PostgREST синхронным supabase-клиентом. Нужны
+    SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY того же проекта, что и
+    DATABASE_URL (данные сидируются через DATABASE_URL);
+  - asyncpg, 1 query — read model.
+
+Запуск из папки server/ на тестовой базе (создаёт и удаляет свои данные):
+    DATABASE_URL=postgres://... python -m bench.bench_get_vision --steps 200 --runs 200
+
+На локальной базе (RTT ~0.1 мс) варианты asyncpg близки: выигрыш read model —
+в числе сетевых round-trip'ов. --rtt-ms N ставит между пулом и Postgres
+локальный TCP-прокси, который задерживает данные на N/2 мс в каждую сторону,
+так что задержка удалённой базы измеряется, а не досчитывается. На путь
+supabase прокси не влияет: у него настоящий RTT до проекта Supabase.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import db
+from vision import repository as repo
+
+
+# ------------------------ ПРОКСИ С ЗАДЕРЖКОЙ ------------------------
+
+class LatencyProxy:
+    """
+    TCP-прокси 127.0.0.1:<port> -> Postgres из DSN, добавляет задержку
+    delay секунд в каждую сторону (RTT = 2 * delay). Пропускная способность
+    не ограничивается: каждый кусок данных уходит через delay после прихода.
+    Байты передаются как есть, так что TLS проходит насквозь.
+    """
+
+    def __init__(self, dsn: str, delay: float):
+        self.dsn = dsn
+        self.delay = delay
+        self._server = None
+
+    def _target(self):
+        parts = urlsplit(self.dsn)
+        query = dict(parse_qsl(parts.query))
+        host = query.get("host") or parts.hostname or "localhost"
+        port = parts.port or int(query.get("port", 5432))
+        return host, port
+
+    async def _open_target(self):
+        host, port = self._target()
+        if host.startswith("/"):
+            return await asyncio.open_unix_connection(f"{host}/.s.PGSQL.{port}")
+        return await asyncio.open_connection(host, port)
+
+    async def _pipe(self, reader, writer):
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def deliver():
+            while True:
+                at, data = await queue.get()
+                if data is None:
+                    break
+                await asyncio.sleep(max(0.0, at - time.monotonic()))
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        sender = asyncio.create_task(deliver())
+        try:
+            while data := await reader.read(65536):
+                queue.put_nowait((time.monotonic() + self.delay, data))
+        except ConnectionError:
+            pass
+        finally:
+            queue.put_nowait((0.0, None))
+            try:
+                await sender
+            except ConnectionError:
+                pass
+
+    async def _handle(self, client_reader, client_writer):
+        server_reader, server_writer = await self._open_target()
+        await asyncio.gather(
+            self._pipe(client_reader, server_writer),
+            self._pipe(server_reader, client_writer),
+        )
+
+    async def start(self) -> str:
+        """Запускает прокси и возвращает DSN, смотрящий на него."""
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        parts = urlsplit(self.dsn)
+        query = [(k, v) for k, v in parse_qsl(parts.query) if k not in ("host", "port")]
+        userinfo = parts.netloc.rpartition("@")[0]
+        netloc = f"{userinfo}@127.0.0.1:{port}" if userinfo else f"127.0.0.1:{port}"
+        return urlunsplit(parts._replace(netloc=netloc, query=urlencode(query)))
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+
+
+async def legacy_get_vision(vision_id, user_id):
+    # повторяет прежний get_vision: ensure_access -> visions -> steps -> users -> participants -> users
+    role = await repo.get_participant_role(vision_id, user_id)
+    assert role
+    vision = await repo.get_vision(vision_id)
+
+    steps = await repo.list_steps(vision_id)
+    users = await repo.get_users({s["user_id"] for s in steps})
+    u_map = {u["id"]: u for u in users}
+    for s in steps:
+        s["user_name"] = u_map.get(s["user_id"], {}).get("name")
+        s["user_email"] = u_map.get(s["user_id"], {}).get("email")
+
+    participants = await repo.list_participants(vision_id)
+    await repo.get_users([p["user_id"] for p in participants])
+
+    return {"vision": vision, "steps": steps, "participants": participants}
+
+
+def _supabase_get_vision(admin, vision_id, user_id):
+    # исходный get_vision: те же 6 запросов через PostgREST
+    def rows(q):
+        return q.execute().data
+
+    role = rows(admin.table("vision_participants").select("role")
+                .eq("vision_id", vision_id).eq("user_id", user_id))
+    assert role
+    vision = rows(admin.table("visions").select("*").eq("id", vision_id).single())
+
+    steps = rows(admin.table("vision_steps")
+                 .select("id,vision_id,user_id,user_text,ai_text,created_at")
+                 .eq("vision_id", vision_id).order("created_at", desc=False))
+    users = rows(admin.table("smart_users").select("id,email,name")
+                 .in_("id", list({s["user_id"] for s in steps})))
+    u_map = {u["id"]: u for u in users}
+    for s in steps:
+        s["user_name"] = u_map.get(s["user_id"], {}).get("name")
+        s["user_email"] = u_map.get(s["user_id"], {}).get("email")
+
+    participants = rows(admin.table("vision_participants")
+                        .select("vision_id,user_id,role,added_at").eq("vision_id", vision_id))
+    rows(admin.table("smart_users").select("id,email,name")
+         .in_("id", [p["user_id"] for p in participants]))
+
+    return {"vision": vision, "steps": steps, "participants": participants}
+
+
+def supabase_get_vision(admin):
+    async def run(vision_id, user_id):
+        # исходный код звал клиент прямо в event loop; здесь — в потоке,
+        # на время одного вызова это не влияет
+        return await asyncio.to_thread(_supabase_get_vision, admin, str(vision_id), str(user_id))
+    return run
+
+
+async def single_query_get_vision(vision_id, user_id):
+    full = await repo.get_vision_full(vision_id, user_id)
+    assert full and full["role"]
+    return full
+
+
+async def seed(n_steps: int):
+    tag = uuid.uuid4().hex[:8]
+    async with db.pool.acquire() as conn:
+        owner = await conn.fetchval(
+            "INSERT INTO smart_users (email, name) VALUES ($1, 'bench owner') RETURNING id",
+            f"bench-owner-{tag}@bench.local",
+        )
+        guest = await conn.fetchval(
+            "INSERT INTO smart_users (email, name) VALUES ($1, 'bench guest') RETURNING id",
+            f"bench-guest-{tag}@bench.local",
+        )
+        vision = await conn.fetchval(
+            "INSERT INTO visions (owner_id, title, archived) VALUES ($1, 'bench', false) RETURNING id",
+            owner,
+        )
+        await conn.executemany(
+            "INSERT INTO vision_participants (vision_id, user_id, role) VALUES ($1, $2, $3)",
+            [(vision, owner, "owner"), (vision, guest, "participant")],
+        )
+        await conn.executemany(
+            "INSERT INTO vision_steps (vision_id, user_id, user_text, ai_text) VALUES ($1, $2, $3, $4)",
+            [
+                (vision, owner if i % 2 else guest, f"шаг {i} " * 20, f"ответ {i} " * 40)
+                for i in range(n_steps)
+            ],
+        )
+    return vision, owner, guest
+
+
+async def cleanup(vision, owner, guest):
+    await repo.delete_vision(vision)
+    await db.pool.execute("DELETE FROM smart_users WHERE id = ANY($1::uuid[])", [owner, guest])
+
+
+async def measure(fn, vision_id, user_id, runs: int):
+    for _ in range(min(10, runs)):
+        await fn(vision_id, user_id)
+
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        await fn(vision_id, user_id)
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "mean": statistics.fmean(samples),
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--steps", type=int, default=200)
+    ap.add_argument("--runs", type=int, default=200)
+    ap.add_argument("--rtt-ms", type=float, default=0.0,
+                    help="добавленный RTT до Postgres (через прокси), 0 — без прокси")
+    ap.add_argument("--supabase", action="store_true",
+                    help="замерить и исходный путь через PostgREST")
+    args = ap.parse_args()
+
+    variants = [("asyncpg, 6 queries", legacy_get_vision)]
+    if args.supabase:
+        from database.supabase_client import get_clients
+        _public, admin = get_clients()
+        if admin is None:
+            ap.error("--supabase: нужны SUPABASE_URL и SUPABASE_SERVICE_ROLE_KEY")
+        variants.append(("supabase, 6 http", supabase_get_vision(admin)))
+    variants.append(("asyncpg, 1 query", single_query_get_vision))
+
+    proxy = None
+    if args.rtt_ms > 0:
+        proxy = LatencyProxy(db.DB_CONN, args.rtt_ms / 2000)
+        db.DB_CONN = await proxy.start()
+
+    await db.init_db()
+    results = []
+    vision, owner, guest = await seed(args.steps)
+    try:
+        for name, fn in variants:
+            results.append((name, await measure(fn, vision, guest, args.runs)))
+    finally:
+        await cleanup(vision, owner, guest)
+        await db.pool.close()
+        if proxy is not None:
+            await proxy.close()
+
+    print(f"steps={args.steps} runs={args.runs} added rtt to postgres={args.rtt_ms}ms (measured)")
+    for name, r in results:
+        print(f"{name:<20} p50={r['p50']:.2f}ms p95={r['p95']:.2f}ms mean={r['mean']:.2f}ms")
+    if not args.supabase:
+        print("исходный путь через Supabase/PostgREST не замерялся (--supabase)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,156 @@
+# server/bench/bench_tokens_usage.py
+"""
+Бенчмарк /api/tokens/usage: агрегаты (tokenscount_daily) против
+сырого скана tokenscount с GROUP BY.
+
+Данные синтетические, в отдельной схеме bench_tokens (удаляется в конце):
+--rows строк лога за --days дней по --clients клиентам и 4 моделям.
+У сырой таблицы есть индексы по createdat и (clientid, createdat),
+чтобы сравнение было честным.
+
+Запуск из папки server/:
+    DATABASE_URL=postgres://... python -m bench.bench_tokens_usage --rows 3000000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import db
+
+SCHEMA = "bench_tokens"
+
+# те же запросы, что строит tokenscount.rollups.query_usage, и их аналоги по логу
+QUERIES = {
+    "all clients, 30 days": (
+        f"""
+        SELECT day, clientid, clienttype, model,
+               sum(calls), sum(prompttokens), sum(completiontokens), sum(totaltokens)
+        FROM {SCHEMA}.tokenscount_daily
+        WHERE day >= (now() - interval '30 days')::date AND day <= now()::date
+        GROUP BY 1, 2, 3, 4
+        """,
+        f"""
+        SELECT (createdat AT TIME ZONE 'UTC')::date, clientid, clienttype, model,
+               count(*), sum(prompttokens), sum(completiontokens), sum(totaltokens)
+        FROM {SCHEMA}.tokenscount
+        WHERE createdat >= date_trunc('day', now() - interval '30 days')
+        GROUP BY 1, 2, 3, 4
+        """,
+    ),
+    "one client, 30 days": (
+        f"""
+        SELECT day, model,
+               sum(calls), sum(prompttokens), sum(completiontokens), sum(totaltokens)
+        FROM {SCHEMA}.tokenscount_daily
+        WHERE clientid = 'client-7'
+          AND day >= (now() - interval '30 days')::date AND day <= now()::date
+        GROUP BY 1, 2
+        """,
+        f"""
+        SELECT (createdat AT TIME ZONE 'UTC')::date, model,
+               count(*), sum(prompttokens), sum(completiontokens), sum(totaltokens)
+        FROM {SCHEMA}.tokenscount
+        WHERE clientid = 'client-7'
+          AND createdat >= date_trunc('day', now() - interval '30 days')
+        GROUP BY 1, 2
+        """,
+    ),
+}
+
+
+async def seed(conn, rows: int, days: int, clients: int) -> None:
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    for table in ("tokenscount", "tokenscount_hourly", "tokenscount_daily"):
+        await conn.execute(f"CREATE TABLE {SCHEMA}.{table} (LIKE public.{table} INCLUDING ALL)")
+
+    t0 = time.perf_counter()
+    await conn.execute(
+        f"""
+        INSERT INTO {SCHEMA}.tokenscount
+            (clientid, clienttype, provider, model, prompttokens, completiontokens, totaltokens, createdat)
+        SELECT 'client-' || (i % $2),
+               CASE WHEN i % $2 < $2 / 5 THEN 'visitor' ELSE 'user' END,
+               'openai',
+               (ARRAY['gpt-4o-mini', 'gpt-4o', 'gpt-4.1', 'gpt-4.1-mini'])[1 + i % 4],
+               p, c, p + c,
+               now() - (random() * $3) * interval '1 day'
+        FROM generate_series(1, $1) AS i,
+             LATERAL (SELECT (random() * 2000)::int AS p, (random() * 500)::int AS c) t
+        """,
+        rows, clients, days,
+    )
+    await conn.execute(f"CREATE INDEX ON {SCHEMA}.tokenscount (createdat)")
+    await conn.execute(f"CREATE INDEX ON {SCHEMA}.tokenscount (clientid, createdat)")
+
+    # агрегаты — как в migrations/004
+    await conn.execute(
+        f"""
+        INSERT INTO {SCHEMA}.tokenscount_hourly
+        SELECT date_trunc('hour', createdat AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+               COALESCE(clientid, ''), COALESCE(clienttype, ''), COALESCE(model, ''),
+               count(*), COALESCE(sum(prompttokens), 0), COALESCE(sum(completiontokens), 0),
+               COALESCE(sum(totaltokens), 0)
+        FROM {SCHEMA}.tokenscount
+        GROUP BY 1, 2, 3, 4
+        """
+    )
+    await conn.execute(
+        f"""
+        INSERT INTO {SCHEMA}.tokenscount_daily
+        SELECT (bucket AT TIME ZONE 'UTC')::date, clientid, clienttype, model,
+               sum(calls), sum(prompttokens), sum(completiontokens), sum(totaltokens)
+        FROM {SCHEMA}.tokenscount_hourly
+        GROUP BY 1, 2, 3, 4
+        """
+    )
+    await conn.execute(f"ANALYZE {SCHEMA}.tokenscount")
+    await conn.execute(f"ANALYZE {SCHEMA}.tokenscount_daily")
+
+    daily = await conn.fetchval(f"SELECT count(*) FROM {SCHEMA}.tokenscount_daily")
+    print(f"seeded {rows} log rows -> {daily} daily rollup rows in {time.perf_counter() - t0:.1f}s")
+
+
+async def measure(conn, sql: str, runs: int):
+    await conn.fetch(sql)  # прогрев кэша
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        await conn.fetch(sql)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[max(int(len(samples) * 0.95) - 1, 0)],
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=3_000_000)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--clients", type=int, default=500)
+    ap.add_argument("--runs", type=int, default=10)
+    args = ap.parse_args()
+
+    await db.init_db()
+    async with db.pool.acquire() as conn:
+        try:
+            await seed(conn, args.rows, args.days, args.clients)
+            print(f"rows={args.rows} days={args.days} clients={args.clients} runs={args.runs}")
+            for name, (rollup_sql, raw_sql) in QUERIES.items():
+                raw = await measure(conn, raw_sql, args.runs)
+                rollup = await measure(conn, rollup_sql, args.runs)
+                print(
+                    f"{name:<22} raw p50={raw['p50']:.1f}ms p95={raw['p95']:.1f}ms"
+                    f"  | rollup p50={rollup['p50']:.2f}ms p95={rollup['p95']:.2f}ms"
+                    f"  | x{raw['p50'] / max(rollup['p50'], 1e-6):.0f}"
+                )
+        finally:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+# server/core/cache.py
+"""
+Небольшой in-process кэш с TTL и LRU-вытеснением.
+
+Живёт в памяти одного воркера uvicorn: при нескольких воркерах каждый держит
+свою копию, поэтому устаревание между воркерами ограничено только TTL.
+
+on_user_changed / user_changed — общие хуки инвалидации: кэши, где лежат
+данные пользователя (сессии auth, справочник svid-пользователей deps,
+роли участников визий), регистрируют сброс, а код, пишущий smart_users
+(register, reset, создание пользователя в vision.repository), вызывает
+user_changed(user_id). Роли в визиях сбрасываются ещё и точечно
+(vision_server.invalidate_roles) — при добавлении / удалении участника.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Возвращает значение или default (по умолчанию MISSING), считая hit/miss."""
+        item = self._data.get(key)
+        if item is not None:
+            expires, value = item
+            if expires > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        keys = [k for k in self._data if predicate(k)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    def invalidate_values(self, predicate: Callable[[Any], bool]) -> int:
+        keys = [k for k, (_, v) in self._data.items() if predicate(v)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# =====================================================
+#  ИНВАЛИДАЦИЯ ПО ПОЛЬЗОВАТЕЛЮ
+# =====================================================
+
+_user_hooks: List[Callable[[str], None]] = []
+
+
+def on_user_changed(hook: Callable[[str], None]) -> Callable[[str], None]:
+    """Регистрирует сброс кэша для user_id (можно как декоратор)."""
+    _user_hooks.append(hook)
+    return hook
+
+
+def user_changed(user_id) -> None:
+    """Профиль пользователя изменён (email, имя, уровень) — сбросить все его кэши."""
+    for hook in _user_hooks:
+        hook(str(user_id))
@@ -0,0 +1,49 @@
+# server/core/http.py
+"""
+Общий HTTP-клиент процесса (httpx, HTTP/2 если установлен h2).
+
+Один пул соединений на всё время жизни приложения: без TLS-рукопожатия
+на каждый исходящий запрос. Закрывается в main.shutdown.
+"""
+
+import logging
+import os
+from typing import Optional
+
+import httpx
+
+log = logging.getLogger("core.http")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = _http2_available()
+        _client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(float(os.getenv("HTTP_CLIENT_TIMEOUT", "8")), connect=5.0),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "50")),
+                max_keepalive_connections=int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=60.0,
+            ),
+        )
+        log.info("shared HTTP client created (http2=%s)", http2)
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
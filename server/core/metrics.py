@@ -0,0 +1,157 @@
+# server/core/metrics.py
+"""
+Минимальный реестр метрик процесса в формате Prometheus text.
+
+Counter / Gauge / Histogram с метками; render() отдаёт текстовую выдачу.
+Без внешних зависимостей и без синхронизации между воркерами uvicorn:
+каждый процесс отдаёт свои значения.
+"""
+
+import bisect
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: Dict[str, "_Metric"] = {}
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels_str(names: Tuple[str, ...], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [(n, str(v)) for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '%s="%s"' % (n, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in pairs
+    )
+    return "{" + body + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        return [f"{self.name}{_labels_str(self.labelnames, k)} {_fmt(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Значение задаётся set()/inc()/dec() или вычисляется функцией при выдаче."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._fn = fn
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._fn is not None:
+            return [f"{self.name} {_fmt(self._fn())}"]
+        return [f"{self.name}{_labels_str(self.labelnames, k)} {_fmt(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [counts по бакетам..., count, sum]
+        self._data: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        data = self._data.get(key)
+        if data is None:
+            data = self._data[key] = [0] * len(self.buckets) + [0, 0.0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            data[i] += 1
+        data[-2] += 1
+        data[-1] += value
+
+    def samples(self):
+        out = []
+        n = len(self.buckets)
+        for key, data in self._data.items():
+            cumulative = 0
+            for i, le in enumerate(self.buckets):
+                cumulative += data[i]
+                out.append(f"{self.name}_bucket{_labels_str(self.labelnames, key, ('le', _fmt(le)))} {cumulative}")
+            out.append(f"{self.name}_bucket{_labels_str(self.labelnames, key, ('le', '+Inf'))} {data[n]}")
+            out.append(f"{self.name}_count{_labels_str(self.labelnames, key)} {data[n]}")
+            out.append(f"{self.name}_sum{_labels_str(self.labelnames, key)} {_fmt(data[n + 1])}")
+        return out
+
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+    existing = _registry.get(name)
+    return existing if isinstance(existing, Counter) else Counter(name, help, labelnames)
+
+
+def gauge(name: str, help: str, labelnames: Iterable[str] = (), fn: Optional[Callable[[], float]] = None) -> Gauge:
+    existing = _registry.get(name)
+    return existing if isinstance(existing, Gauge) else Gauge(name, help, labelnames, fn)
+
+
+def histogram(name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    existing = _registry.get(name)
+    return existing if isinstance(existing, Histogram) else Histogram(name, help, labelnames, buckets)
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in _registry.values()) + "\n"
@@ -0,0 +1,173 @@
+# server/core/querytrace.py
+"""
+Учёт обращений к БД в рамках одного HTTP-запроса (поиск N+1).
+
+QueryTraceMiddleware кладёт в contextvar объект RequestTrace, а обёртки
+доступа к данным вызывают record():
+  - db.InstrumentedConnection — каждый запрос через asyncpg (db.pool);
+  - trace_httpx() — хуки на httpx-сессиях Supabase (PostgREST / Storage),
+    см. database.supabase_client.create_traced_client.
+
+Вне запроса (фоновые воркеры, WebSocket) record() ничего не делает.
+
+По каждому запросу считаются: число обращений, суммарное время в БД и
+повторы одного и того же запроса (тот же SQL / тот же путь PostgREST с
+другими параметрами — типичный N+1).
+  - dev (QUERY_TRACE_HEADERS, по умолчанию при ENV != production):
+    заголовки X-DB-Queries / X-DB-Time-Ms / X-DB-Duplicates;
+  - всегда: метрики http_request_db_* по маршруту и warning в лог, если
+    запросов больше QUERY_TRACE_WARN или один запрос повторён
+    QUERY_TRACE_DUP_WARN раз и больше.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from core import metrics
+
+log = logging.getLogger("core.querytrace")
+
+QUERY_TRACE_HEADERS = os.getenv(
+    "QUERY_TRACE_HEADERS", "0" if os.getenv("ENV", "dev") == "production" else "1"
+) == "1"
+QUERY_TRACE_WARN = int(os.getenv("QUERY_TRACE_WARN", "20"))
+QUERY_TRACE_DUP_WARN = int(os.getenv("QUERY_TRACE_DUP_WARN", "3"))
+
+_queries = metrics.histogram(
+    "http_request_db_queries", "DB round-trips per HTTP request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 20, 50, 100),
+)
+_db_seconds = metrics.histogram("http_request_db_seconds", "DB time per HTTP request", ("route",))
+_warnings = metrics.counter("http_request_db_warnings_total", "Requests over DB query thresholds", ("route", "reason"))
+
+
+class RequestTrace:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Counter = Counter()
+        self.closed = False
+        # supabase-клиент синхронный и вызывается из потоков
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, statement: str, seconds: float) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self.count += 1
+            self.seconds += seconds
+            self.statements[f"{kind}: {statement}"] += 1
+
+    def duplicates(self) -> dict:
+        """{запрос: сколько раз} для запросов, выполненных больше одного раза."""
+        return {s: n for s, n in self.statements.items() if n > 1}
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("query_trace", default=None)
+
+
+def current() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def record(kind: str, statement: str, seconds: float) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.record(kind, statement, seconds)
+
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(str(sql).split())[:200]
+
+
+# ------------------------ SUPABASE (httpx) ------------------------
+
+def _on_request(request) -> None:
+    request.extensions["query_trace_started"] = time.perf_counter()
+
+
+def _on_response(response) -> None:
+    # время до заголовков ответа: тело читается уже после хука
+    request = response.request
+    started = request.extensions.get("query_trace_started")
+    if started is None:
+        return
+    keys = ",".join(sorted({k for k, _ in request.url.params.multi_items()}))
+    record("rest", f"{request.method} {request.url.path}?{keys}", time.perf_counter() - started)
+
+
+def trace_httpx(session) -> None:
+    """Подключает учёт к httpx.Client (сессии PostgREST / Storage)."""
+    hooks = session.event_hooks
+    if _on_request not in hooks["request"]:
+        hooks["request"].append(_on_request)
+        hooks["response"].append(_on_response)
+    session.event_hooks = hooks
+
+
+# ------------------------ MIDDLEWARE ------------------------
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class QueryTraceMiddleware:
+    """ASGI-middleware: один RequestTrace на HTTP-запрос."""
+
+    def __init__(self, app, headers: bool = QUERY_TRACE_HEADERS,
+                 warn_queries: int = QUERY_TRACE_WARN, warn_duplicates: int = QUERY_TRACE_DUP_WARN):
+        self.app = app
+        self.headers = headers
+        self.warn_queries = warn_queries
+        self.warn_duplicates = warn_duplicates
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = RequestTrace()
+        token = _current.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and self.headers:
+                dups = trace.duplicates()
+                headers = list(message.get("headers", []))
+                headers += [
+                    (b"x-db-queries", str(trace.count).encode()),
+                    (b"x-db-time-ms", f"{trace.seconds * 1000:.1f}".encode()),
+                    (b"x-db-duplicates", str(sum(n - 1 for n in dups.values())).encode()),
+                ]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            with trace._lock:
+                trace.closed = True
+            self._report(scope, trace)
+
+    def _report(self, scope, trace: RequestTrace) -> None:
+        route = _route_label(scope)
+        _queries.observe(trace.count, route=route)
+        _db_seconds.observe(trace.seconds, route=route)
+
+        dups = {s: n for s, n in trace.duplicates().items() if n >= self.warn_duplicates}
+        if trace.count > self.warn_queries:
+            _warnings.inc(route=route, reason="queries")
+        if dups:
+            _warnings.inc(route=route, reason="duplicates")
+        if trace.count > self.warn_queries or dups:
+            top = sorted(dups.items(), key=lambda kv: -kv[1])[:5]
+            log.warning(
+                "%s %s: %d DB queries, %.1f ms; repeated: %s",
+                scope.get("method"), route, trace.count, trace.seconds * 1000,
+                "; ".join(f"{n}x {s}" for s, n in top) or "-",
+            )
@@ -1,8 +1,14 @@
 # server/database/deps.py
 
+import asyncio
 import os
+import time
 from fastapi import Header, HTTPException
-import httpx
+import jwt
+
+from core.cache import MISSING, TTLCache, on_user_changed
+from core.http import get_http_client
+from .supabase_jwt import InvalidToken, SupabaseJWTVerifier
 
 DEV_BYPASS_AUTH = os.environ.get("DEV_BYPASS_AUTH", "false").lower() in ("1", "true", "yes")
 DEV_USER_ID = os.environ.get("DEV_USER_ID", "00000000-0000-0000-0000-000000000000")
@@ -10,6 +16,85 @@ DEV_EMAIL = os.environ.get("DEV_EMAIL", "dev@local")
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "").rstrip("/")
 SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY") or os.environ.get("SUPABASE_ANON_PUBLIC_KEY")
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
+
+# Локальная проверка JWT (секрет / JWKS); Supabase Auth — только если она не может решить.
+_verifier = SupabaseJWTVerifier(
+    SUPABASE_URL,
+    jwt_secret=SUPABASE_JWT_SECRET,
+    jwks_ttl=float(os.environ.get("SUPABASE_JWKS_TTL", "600")),
+) if SUPABASE_URL else None
+
+# token -> {"id", "email"}; запись живёт не дольше exp токена
+verified_tokens = TTLCache(
+    maxsize=int(os.environ.get("SUPABASE_TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("SUPABASE_TOKEN_CACHE_TTL", "300")),
+    name="supabase_tokens",
+)
+
+# Справочник пользователей для svid-токенов: user_id -> {"id", "email"} | None.
+# None (пользователя нет) кэшируется на короткий SVID_USER_NEGATIVE_TTL.
+user_directory = TTLCache(
+    maxsize=int(os.environ.get("SVID_USER_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("SVID_USER_CACHE_TTL", "300")),
+    name="svid_users",
+)
+USER_NEGATIVE_TTL = float(os.environ.get("SVID_USER_NEGATIVE_TTL", "30"))
+
+_user_inflight: dict = {}   # user_id -> Task: один запрос на user_id одновременно
+_user_invalidations = 0     # результат запроса, начатого до сброса, в кэш не кладём
+
+
+@on_user_changed
+def invalidate_user(user_id: str) -> None:
+    global _user_invalidations
+    _user_invalidations += 1
+    user_directory.invalidate(user_id)
+
+
+def _fetch_directory_user(user_id: str):
+    # синхронный supabase-клиент — вызывается в потоке
+    from .supabase_client import get_clients
+    _pub, admin = get_clients()
+    if not admin:
+        return None
+    res = admin.table("USER").select("id, email").eq("id", user_id).limit(1).execute()
+    rows = res.data or []
+    return rows[0] if rows else None
+
+
+async def _load_directory_user(user_id: str):
+    """Общий запрос для всех ждущих user_id; живёт отдельной задачей."""
+    generation = _user_invalidations
+    try:
+        user = await asyncio.to_thread(_fetch_directory_user, user_id)
+        if generation == _user_invalidations:
+            user_directory.set(user_id, user, ttl=None if user else USER_NEGATIVE_TTL)
+        return user
+    finally:
+        if _user_inflight.get(user_id) is asyncio.current_task():
+            del _user_inflight[user_id]
+
+
+async def lookup_directory_user(user_id: str):
+    """
+    {"id", "email"} из таблицы USER или None. Кэш с LRU/TTL, отрицательный
+    кэш, и одновременные промахи по одному user_id делят один запрос.
+    Запрос — отдельная задача под shield: отмена того, кто его начал
+    (обрыв клиента), не оставляет остальных ждать вечно.
+    """
+    cached = user_directory.get(user_id)
+    if cached is not MISSING:
+        return cached
+
+    task = _user_inflight.get(user_id)
+    if task is None:
+        task = asyncio.create_task(_load_directory_user(user_id))
+        # ожидающих может не остаться — исключение не шумит в лог
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        _user_inflight[user_id] = task
+    return await asyncio.shield(task)
+
 
 def _parse_svid_token(token: str) -> str | None:
     """
@@ -25,8 +110,19 @@ def _parse_svid_token(token: str) -> str | None:
     except ValueError:
         return None
 
-async def fetch_user_from_token(token: str):
-    """Supabase Auth: достаём user (id/email) по реальному Supabase-JWT."""
+def _token_ttl(token: str, exp=None) -> float:
+    if exp is None:
+        try:
+            exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        except jwt.PyJWTError:
+            exp = None
+    if exp is None:
+        return verified_tokens.ttl
+    return min(verified_tokens.ttl, exp - time.time())
+
+
+async def _fetch_user_remote(token: str) -> dict:
+    """Supabase Auth /auth/v1/user через общий пул соединений."""
     if not SUPABASE_URL or not SUPABASE_ANON_KEY:
         raise HTTPException(503, "Supabase auth not configured (URL/ANON KEY)")
 
@@ -35,13 +131,41 @@ async def fetch_user_from_token(token: str):
         "apikey": SUPABASE_ANON_KEY,
         "Authorization": f"Bearer {token}",
     }
-    async with httpx.AsyncClient(timeout=8) as client:
-        r = await client.get(url, headers=headers)
+    r = await get_http_client().get(url, headers=headers)
     if r.status_code != 200:
         raise HTTPException(401, f"Invalid token: {r.text}")
     data = r.json()
     return {"id": data.get("id"), "email": data.get("email")}
 
+
+async def fetch_user_from_token(token: str):
+    """
+    Supabase-JWT -> user (id/email).
+    Сначала кэш проверенных токенов, затем локальная проверка подписи,
+    и только если она не может решить — запрос в Supabase Auth.
+    """
+    cached = verified_tokens.get(token)
+    if cached is not MISSING:
+        return cached
+
+    claims = None
+    if _verifier is not None:
+        try:
+            claims = await _verifier.verify(token)
+        except InvalidToken as e:
+            raise HTTPException(401, f"Invalid token: {e}")
+
+    if claims is not None:
+        user = {"id": claims["sub"], "email": claims.get("email")}
+        ttl = _token_ttl(token, claims["exp"])
+    else:
+        user = await _fetch_user_remote(token)
+        ttl = _token_ttl(token)
+
+    if ttl > 0:
+        verified_tokens.set(token, user, ttl=ttl)
+    return user
+
 async def get_user_context(authorization: str = Header(default="")) -> dict:
     """
     Единая точка:
@@ -59,17 +183,10 @@ async def get_user_context(authorization: str = Header(default="")) -> dict:
     # 1) Наш DEV-токен от SVID
     user_id = _parse_svid_token(token)
     if user_id:
-        # (опционально) Проверим, что такой USER существует у нас в БД:
+        # (опционально) email из таблицы USER — через кэш справочника
         try:
-            # локальный импорт, чтобы не плодить зависимостей на модульный уровень
-            from .supabase_client import get_clients
-            _pub, admin = get_clients()
-            if admin:
-                res = admin.table("USER").select("id, email").eq("id", user_id).limit(1).execute()
-                rows = res.data or []
-                email = rows[0]["email"] if rows else None
-            else:
-                email = None
+            user = await lookup_directory_user(user_id)
+            email = user["email"] if user else None
         except Exception:
             email = None
 
@@ -1,18 +1,46 @@
 # server/database/supabase_client.py
 import os
-from supabase import create_client, Client
+from supabase import Client
+
+from core.querytrace import trace_httpx
 
 _SUPABASE_URL = os.environ.get("SUPABASE_URL")
 _SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY") or os.environ.get("SUPABASE_ANON_PUBLIC_KEY")
 _SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 
+
+
+class TracedClient(Client):
+    """
+    Supabase-клиент, чьи запросы PostgREST / Storage учитываются в
+    core.querytrace (число обращений и повторы на HTTP-запрос).
+    Сессии пересоздаются клиентом при смене auth — хуки ставятся заново.
+    """
+
+    @staticmethod
+    def _init_postgrest_client(*args, **kwargs):
+        client = Client._init_postgrest_client(*args, **kwargs)
+        trace_httpx(client.session)
+        return client
+
+    @staticmethod
+    def _init_storage_client(*args, **kwargs):
+        client = Client._init_storage_client(*args, **kwargs)
+        trace_httpx(client.session)
+        return client
+
+
+def create_traced_client(url: str, key: str) -> Client:
+    return TracedClient.create(url, key)
+
+
 _public: Client | None = None
 _admin: Client | None = None
 
 def get_clients():
     global _public, _admin
     if _SUPABASE_URL and _SUPABASE_ANON_KEY and _public is None:
-        _public = create_client(_SUPABASE_URL, _SUPABASE_ANON_KEY)
+        _public = create_traced_client(_SUPABASE_URL, _SUPABASE_ANON_KEY)
     if _SUPABASE_URL and _SUPABASE_SERVICE_ROLE_KEY and _admin is None:
-        _admin = create_client(_SUPABASE_URL, _SUPABASE_SERVICE_ROLE_KEY)
+        _admin = create_traced_client(_SUPABASE_URL, _SUPABASE_SERVICE_ROLE_KEY)
     return _public, _admin
@@ -0,0 +1,115 @@
+# server/database/supabase_jwt.py
+"""
+Локальная проверка Supabase JWT (без запроса к /auth/v1/user).
+
+- HS256 — по секрету проекта (SUPABASE_JWT_SECRET);
+- RS256 / ES256 — по JWKS проекта ({SUPABASE_URL}/auth/v1/.well-known/jwks.json),
+  который кэшируется и перечитывается раз в jwks_ttl или при незнакомом kid
+  (не чаще раза в jwks_min_refresh).
+
+verify() возвращает claims, бросает InvalidToken, если токен точно
+недействителен (подпись, срок, aud/iss), и возвращает None, если решить
+локально нельзя (нет секрета, JWKS недоступен, неизвестный kid) —
+тогда вызывающий код идёт в Supabase Auth.
+"""
+
+import logging
+import time
+from typing import Optional
+
+import jwt
+
+from core.http import get_http_client
+
+log = logging.getLogger("database.supabase_jwt")
+
+ASYMMETRIC_ALGS = ("RS256", "ES256")
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class SupabaseJWTVerifier:
+    def __init__(self,
+                 supabase_url: str,
+                 jwt_secret: Optional[str] = None,
+                 audience: str = "authenticated",
+                 leeway: float = 30.0,
+                 jwks_ttl: float = 600.0,
+                 jwks_min_refresh: float = 60.0):
+        self.supabase_url = supabase_url.rstrip("/")
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.leeway = leeway
+        self.jwks_ttl = jwks_ttl
+        self.jwks_min_refresh = jwks_min_refresh
+
+        self._keys: dict = {}        # kid -> PyJWK
+        self._jwks_loaded_at = 0.0
+        self._jwks_tried_at = 0.0
+
+    @property
+    def issuer(self) -> str:
+        return f"{self.supabase_url}/auth/v1"
+
+    async def verify(self, token: str) -> Optional[dict]:
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise InvalidToken(f"malformed token: {e}")
+
+        alg = header.get("alg")
+        if alg == "HS256":
+            if not self.jwt_secret:
+                return None
+            return self._decode(token, self.jwt_secret, alg)
+
+        if alg in ASYMMETRIC_ALGS:
+            key = await self._key(header.get("kid"))
+            if key is None:
+                return None
+            return self._decode(token, key.key, alg)
+
+        raise InvalidToken(f"unsupported alg: {alg}")
+
+    # ---------- internals ----------
+
+    def _decode(self, token: str, key, alg: str) -> dict:
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[alg],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={"require": ["exp", "sub"]},
+            )
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+    async def _key(self, kid: Optional[str]):
+        now = time.monotonic()
+        stale = now - self._jwks_loaded_at > self.jwks_ttl
+        unknown = kid not in self._keys
+        if (stale or unknown) and now - self._jwks_tried_at > self.jwks_min_refresh:
+            await self._load_jwks()
+        return self._keys.get(kid)
+
+    async def _load_jwks(self) -> None:
+        self._jwks_tried_at = time.monotonic()
+        try:
+            r = await get_http_client().get(f"{self.issuer}/.well-known/jwks.json")
+            r.raise_for_status()
+            keys = {}
+            for jwk in r.json().get("keys", []):
+                try:
+                    keys[jwk.get("kid")] = jwt.PyJWK(jwk)
+                except jwt.PyJWTError as e:
+                    log.warning("skip JWK %s: %s", jwk.get("kid"), e)
+            self._keys = keys
+            self._jwks_loaded_at = time.monotonic()
+        except Exception as e:
+            # оставляем прежние ключи; без них решение уйдёт в Supabase Auth
+            log.warning("JWKS refresh failed: %s", e)
@@ -1,17 +1,259 @@
 import asyncpg
+import logging
 import os
+import sys
+import time
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from core import metrics, querytrace
 
 DB_CONN = os.getenv("DATABASE_URL")
 
+# Размер пула — из окружения (по умолчанию как было: 1..5)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "0")) or None
+
+# Через что подключены: transaction | direct | session | auto.
+# transaction (по умолчанию, как было: PgBouncer / Supabase pooler) — без кэша
+# prepared statements: соединение к Postgres меняется между транзакциями,
+# prepared statement с другого бэкенда там не найдётся.
+# direct / session — именованные prepared statements (кэш asyncpg на
+# соединение); включаются явно, когда известно, что между приложением и
+# Postgres нет transaction-пулера. auto угадывает по DSN (порт 6543,
+# ?pgbouncer=true) и PgBouncer на другом порту не распознает — тоже только явно.
+DB_POOLER_MODE = os.getenv("DB_POOLER_MODE", "transaction").lower()
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# порт transaction-пулера Supabase
+TRANSACTION_POOLER_PORTS = {6543}
+
+log = logging.getLogger("db")
+
 pool = None
 
+
+# ------------------------ МЕТРИКИ ------------------------
+
+_acquire_seconds = metrics.histogram(
+    "db_pool_acquire_seconds",
+    "Time waiting for a pooled connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+_query_seconds = metrics.histogram("db_query_seconds", "Statement latency by call site", ("site", "op"))
+_query_errors = metrics.counter("db_query_errors_total", "Failed statements by call site", ("site", "op"))
+_waiting = metrics.gauge("db_pool_waiting", "Callers waiting for a connection")
+
+# модули, которые пропускаем при поиске места вызова
+_SKIP_MODULES = {__name__, "contextlib", "asyncio"}
+
+
+def _call_site() -> str:
+    """'module.function' первого кадра вне db.py — метка для метрик."""
+    f = sys._getframe(2)
+    while f is not None and f.f_globals.get("__name__") in _SKIP_MODULES:
+        f = f.f_back
+    if f is None:
+        return "unknown"
+    return f"{f.f_globals.get('__name__')}.{f.f_code.co_name}"
+
+
+# ------------------------ ИНСТРУМЕНТИРОВАННЫЙ ПУЛ ------------------------
+
+class InstrumentedConnection:
+    """Прокси соединения: замеряет fetch*/execute*/copy, остальное — как есть."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def _timed(self, op, fn, *args, **kwargs):
+        site = _call_site()
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            _query_errors.inc(site=site, op=op)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _query_seconds.observe(elapsed, site=site, op=op)
+            # учёт на HTTP-запрос (core.querytrace); ключ — текст SQL / имя таблицы для COPY
+            statement = querytrace.normalize_sql(args[0]) if args else op
+            querytrace.record("pg", f"{op} {statement}" if op == "copy" else statement, elapsed)
+
+    async def fetch(self, *args, **kwargs):
+        return await self._timed("fetch", self._conn.fetch, *args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        return await self._timed("fetchrow", self._conn.fetchrow, *args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        return await self._timed("fetchval", self._conn.fetchval, *args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        return await self._timed("execute", self._conn.execute, *args, **kwargs)
+
+    async def executemany(self, *args, **kwargs):
+        return await self._timed("executemany", self._conn.executemany, *args, **kwargs)
+
+    async def copy_records_to_table(self, *args, **kwargs):
+        return await self._timed("copy", self._conn.copy_records_to_table, *args, **kwargs)
+
+
+class _AcquireContext:
+    def __init__(self, pool: "InstrumentedPool", timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn = None
+
+    async def _acquire(self):
+        _waiting.inc()
+        started = time.perf_counter()
+        try:
+            raw = await self._pool.raw.acquire(timeout=self._timeout)
+        finally:
+            _waiting.dec()
+            _acquire_seconds.observe(time.perf_counter() - started)
+        return InstrumentedConnection(raw)
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+    async def __aenter__(self):
+        self._conn = await self._acquire()
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        await self._pool.release(self._conn)
+
+
+class InstrumentedPool:
+    """
+    Обёртка над asyncpg.Pool с тем же интерфейсом (acquire / fetch* / execute*):
+    время ожидания соединения, занятые/свободные соединения и латентность
+    запросов по месту вызова (метка site = 'module.function').
+    """
+
+    def __init__(self, raw: asyncpg.Pool, mode: str = "direct", prepared: bool = False):
+        self.raw = raw
+        self.mode = mode
+        self.prepared = prepared
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def acquire(self, *, timeout=None) -> _AcquireContext:
+        return _AcquireContext(self, timeout)
+
+    async def release(self, conn, *, timeout=None):
+        if isinstance(conn, InstrumentedConnection):
+            conn = conn._conn
+        await self.raw.release(conn, timeout=timeout)
+
+    async def fetch(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.fetch(*args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(*args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.fetchval(*args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.execute(*args, **kwargs)
+
+    async def executemany(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.executemany(*args, **kwargs)
+
+    def stats(self) -> dict:
+        size = self.raw.get_size()
+        idle = self.raw.get_idle_size()
+        return {
+            "name": "db_pool",
+            "mode": self.mode,
+            "prepared_statements": self.prepared,
+            "min_size": self.raw.get_min_size(),
+            "max_size": self.raw.get_max_size(),
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "waiting": _waiting.value(),
+        }
+
+
+def _pool_stat(key: str):
+    return lambda: pool.stats()[key] if pool is not None else 0
+
+
+metrics.gauge("db_pool_size", "Open connections in the pool", fn=_pool_stat("size"))
+metrics.gauge("db_pool_idle", "Idle connections in the pool", fn=_pool_stat("idle"))
+metrics.gauge("db_pool_in_use", "Connections checked out of the pool", fn=_pool_stat("in_use"))
+metrics.gauge("db_pool_max_size", "Configured pool max_size", fn=_pool_stat("max_size"))
+
+
+# ------------------------ РЕЖИМ PREPARED STATEMENTS ------------------------
+
+def detect_pooler_mode(dsn: Optional[str], configured: str = DB_POOLER_MODE) -> str:
+    """
+    Режим из DB_POOLER_MODE; при auto — по DSN:
+    порт 6543 или ?pgbouncer=true -> transaction, иначе direct.
+    """
+    if configured in ("direct", "session", "transaction"):
+        return configured
+    if configured != "auto":
+        raise ValueError(f"DB_POOLER_MODE: unknown mode {configured!r}")
+    if not dsn:
+        return "direct"
+    parts = urlsplit(dsn)
+    query = dict(parse_qsl(parts.query))
+    if query.get("pgbouncer", "").lower() in ("1", "true"):
+        return "transaction"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port in TRANSACTION_POOLER_PORTS:
+        return "transaction"
+    return "direct"
+
+
+def _strip_pgbouncer_flag(dsn: Optional[str]) -> Optional[str]:
+    # asyncpg передал бы неизвестный параметр серверу как настройку сессии
+    if not dsn or "pgbouncer=" not in dsn:
+        return dsn
+    parts = urlsplit(dsn)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "pgbouncer"]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+async def create_pool(mode: Optional[str] = None) -> InstrumentedPool:
+    """Новый инструментированный пул; mode — как DB_POOLER_MODE (None — из окружения)."""
+    mode = detect_pooler_mode(DB_CONN, mode or DB_POOLER_MODE)
+    prepared = mode != "transaction"
+    raw = await asyncpg.create_pool(
+        dsn=_strip_pgbouncer_flag(DB_CONN),
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        # 0 обязателен за transaction-пулером
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE if prepared else 0,
+    )
+    log.info("db pool: mode=%s prepared_statements=%s", mode, prepared)
+    return InstrumentedPool(raw, mode=mode, prepared=prepared)
+
+
 async def init_db():
     global pool
     if pool is None:
-        pool = await asyncpg.create_pool(
-            dsn=DB_CONN,
-            min_size=1,
-            max_size=5,
-            # Единственный параметр, который ОБЯЗАТЕЛЬНО должен быть:
-            statement_cache_size=0
-        )
+        pool = await create_pool()
@@ -0,0 +1,25 @@
+from .gateway import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMBusyError,
+    LLMError,
+    LLMGateway,
+    LLMResult,
+    ProviderError,
+    StreamChunk,
+    get_gateway,
+    set_gateway,
+)
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "LLMBusyError",
+    "LLMError",
+    "LLMGateway",
+    "LLMResult",
+    "ProviderError",
+    "StreamChunk",
+    "get_gateway",
+    "set_gateway",
+]
@@ -0,0 +1,416 @@
+# server/llm/gateway.py
+"""
+Общий асинхронный шлюз к LLM.
+
+Все вызовы модели идут через LLMGateway:
+  - глобальный и per-user семафоры (ограничение параллелизма);
+  - таймаут на вызов; для потока — таймаут простоя между кусками и общий
+    потолок на попытку (отсчёт — после получения слота);
+  - повтор с джиттером на 429 / 5xx / сетевые ошибки (с учётом Retry-After);
+  - circuit breaker: при серии отказов провайдера быстро отвечаем ошибкой,
+    а не копим висящие запросы;
+  - метрики: число вызовов, латентность, токены, повторы (core.metrics).
+
+Провайдер — объект с методами complete() и stream() (см. providers.py).
+Для тестов и локальной разработки есть FakeProvider (LLM_PROVIDER=fake).
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from core import metrics
+
+log = logging.getLogger("llm.gateway")
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+# =====================================================
+#  ОШИБКИ И РЕЗУЛЬТАТ
+# =====================================================
+
+class LLMError(Exception):
+    """Базовая ошибка шлюза."""
+
+
+class ProviderError(LLMError):
+    """Ошибка провайдера в нейтральном виде (провайдеры переводят свои исключения в неё)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code is None or self.status_code in RETRY_STATUSES
+
+
+class CircuitOpenError(LLMError):
+    """Провайдер считается деградировавшим — вызов отклонён без обращения к нему."""
+
+
+class LLMBusyError(LLMError):
+    """Не дождались свободного слота (глобального или пользовательского)."""
+
+
+@dataclass
+class LLMResult:
+    text: str
+    model: str
+    usage: Optional[Dict[str, Any]] = None
+    latency: float = 0.0
+    attempts: int = 1
+
+
+@dataclass
+class StreamChunk:
+    """Кусок потока: text — очередная порция ответа, usage — итог (последний кусок)."""
+    text: str = ""
+    usage: Optional[Dict[str, Any]] = None
+
+
+# =====================================================
+#  CIRCUIT BREAKER
+# =====================================================
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        # HALF_OPEN: пропускаем один пробный вызов
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """
+        Вызов прерван без исхода (отмена задачи, обрыв клиента): пробный
+        слот освобождается, состояние не меняется — следующий вызов снова проба.
+        """
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                log.warning("LLM circuit opened after %d failures", self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+# =====================================================
+#  МЕТРИКИ
+# =====================================================
+
+_calls = metrics.counter("llm_calls_total", "LLM calls by outcome", ("model", "outcome"))
+_retries = metrics.counter("llm_retries_total", "LLM call retries", ("model",))
+_latency = metrics.histogram("llm_call_seconds", "LLM call latency (including retries)", ("model",))
+_tokens = metrics.counter("llm_tokens_total", "LLM tokens by kind", ("model", "kind"))
+_inflight = metrics.gauge("llm_inflight", "LLM calls in flight")
+
+
+def _record_usage(model: str, usage: Optional[dict]) -> None:
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        if usage.get(kind):
+            _tokens.inc(usage[kind], model=model, kind=kind)
+
+
+# =====================================================
+#  GATEWAY
+# =====================================================
+
+class LLMGateway:
+    def __init__(self,
+                 provider,
+                 max_concurrency: int = 16,
+                 per_user_concurrency: int = 2,
+                 acquire_timeout: float = 30.0,
+                 call_timeout: float = 60.0,
+                 stream_idle_timeout: float = 30.0,
+                 stream_timeout: float = 300.0,
+                 max_retries: int = 3,
+                 retry_base: float = 0.5,
+                 retry_cap: float = 8.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.acquire_timeout = acquire_timeout
+        self.call_timeout = call_timeout
+        self.stream_idle_timeout = stream_idle_timeout
+        self.stream_timeout = stream_timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.breaker = breaker or CircuitBreaker()
+        self.per_user_concurrency = per_user_concurrency
+
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._users: Dict[str, List] = {}  # user_id -> [semaphore, refcount]
+
+    # ---------- слоты ----------
+
+    @asynccontextmanager
+    async def _slot(self, user_id: Optional[str]):
+        user_sem = None
+        if user_id:
+            entry = self._users.setdefault(user_id, [asyncio.Semaphore(self.per_user_concurrency), 0])
+            entry[1] += 1
+            user_sem = entry[0]
+        try:
+            try:
+                if user_sem:
+                    await asyncio.wait_for(user_sem.acquire(), self.acquire_timeout)
+                try:
+                    await asyncio.wait_for(self._global.acquire(), self.acquire_timeout)
+                except BaseException:
+                    if user_sem:
+                        user_sem.release()
+                    raise
+            except asyncio.TimeoutError:
+                raise LLMBusyError("LLM перегружен, попробуйте позже")
+
+            _inflight.inc()
+            try:
+                yield
+            finally:
+                _inflight.dec()
+                self._global.release()
+                if user_sem:
+                    user_sem.release()
+        finally:
+            if user_id:
+                entry = self._users[user_id]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._users[user_id]
+
+    # ---------- повторы ----------
+
+    def _backoff(self, attempt: int, error: ProviderError) -> float:
+        if error.retry_after:
+            return min(error.retry_after, self.retry_cap)
+        # full jitter
+        return random.uniform(0, min(self.retry_cap, self.retry_base * (2 ** attempt)))
+
+    def _check_breaker(self, model: str) -> None:
+        if not self.breaker.allow():
+            _calls.inc(model=model, outcome="circuit_open")
+            raise CircuitOpenError("LLM circuit open")
+
+    # ---------- API ----------
+
+    async def complete(self,
+                       messages: List[dict],
+                       *,
+                       model: str,
+                       user_id: Optional[str] = None,
+                       **params) -> LLMResult:
+        started = time.monotonic()
+        attempt = 0
+
+        async with self._slot(user_id):
+            while True:
+                self._check_breaker(model)
+                try:
+                    result = await asyncio.wait_for(
+                        self.provider.complete(messages, model=model, **params),
+                        self.call_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    error = ProviderError("LLM timeout", status_code=None)
+                except ProviderError as e:
+                    error = e
+                except BaseException:
+                    # отмена / чужая ошибка: ни успех, ни отказ провайдера,
+                    # но пробный вызов half-open не должен «висеть» навсегда
+                    self.breaker.release_probe()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    result.latency = time.monotonic() - started
+                    result.attempts = attempt + 1
+                    _calls.inc(model=model, outcome="ok")
+                    _latency.observe(result.latency, model=model)
+                    _record_usage(model, result.usage)
+                    return result
+
+                if error.retryable:
+                    self.breaker.record_failure()
+                else:
+                    # ошибка запроса (4xx) — провайдер жив
+                    self.breaker.record_success()
+                if not error.retryable or attempt >= self.max_retries:
+                    _calls.inc(model=model, outcome="error")
+                    _latency.observe(time.monotonic() - started, model=model)
+                    raise error
+
+                delay = self._backoff(attempt, error)
+                attempt += 1
+                _retries.inc(model=model)
+                log.info("LLM retry %d in %.2fs: %s", attempt, delay, error)
+                await asyncio.sleep(delay)
+
+    async def stream(self,
+                     messages: List[dict],
+                     *,
+                     model: str,
+                     user_id: Optional[str] = None,
+                     **params) -> AsyncIterator[StreamChunk]:
+        """
+        Потоковый вызов. Повтор возможен только до первого куска текста:
+        начатый ответ уже ушёл клиенту и не может быть «переигран».
+
+        Каждый кусок ждём не дольше stream_idle_timeout, всю попытку — не
+        дольше stream_timeout; отсчёт идёт с начала попытки, поэтому
+        ожидание слота и прошлые попытки не съедают время ответа.
+        """
+        started = time.monotonic()
+        attempt = 0
+
+        async with self._slot(user_id):
+            while True:
+                self._check_breaker(model)
+                got_text = False
+                deadline = time.monotonic() + self.stream_timeout
+                stream = self.provider.stream(messages, model=model, **params)
+                try:
+                    while True:
+                        timeout = min(self.stream_idle_timeout, deadline - time.monotonic())
+                        try:
+                            chunk = await asyncio.wait_for(stream.__anext__(), max(timeout, 0.001))
+                        except StopAsyncIteration:
+                            break
+                        if chunk.usage:
+                            _record_usage(model, chunk.usage)
+                        if chunk.text:
+                            got_text = True
+                        yield chunk
+                except asyncio.TimeoutError:
+                    error = ProviderError("LLM timeout", status_code=None)
+                except ProviderError as e:
+                    error = e
+                except BaseException:
+                    # обрыв клиента посреди потока (GeneratorExit / CancelledError)
+                    self.breaker.release_probe()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    _calls.inc(model=model, outcome="ok")
+                    _latency.observe(time.monotonic() - started, model=model)
+                    return
+                finally:
+                    await stream.aclose()
+
+                if error.retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if got_text or not error.retryable or attempt >= self.max_retries:
+                    _calls.inc(model=model, outcome="error")
+                    _latency.observe(time.monotonic() - started, model=model)
+                    raise error
+
+                delay = self._backoff(attempt, error)
+                attempt += 1
+                _retries.inc(model=model)
+                await asyncio.sleep(delay)
+
+    def max_duration(self) -> float:
+        """
+        Худший случай complete(): ожидание обоих слотов, все попытки по
+        call_timeout и паузы между ними (не больше retry_cap каждая).
+        """
+        return (2 * self.acquire_timeout
+                + (self.max_retries + 1) * self.call_timeout
+                + self.max_retries * self.retry_cap)
+
+    def stats(self) -> dict:
+        return {
+            "name": "llm_gateway",
+            "circuit": self.breaker.state,
+            "failures": self.breaker.failures,
+            "active_users": len(self._users),
+        }
+
+
+# =====================================================
+#  SINGLETON
+# =====================================================
+
+_gateway: Optional[LLMGateway] = None
+_configured = False
+
+
+def get_gateway() -> Optional[LLMGateway]:
+    """
+    Общий шлюз процесса. Провайдер выбирается по окружению:
+      LLM_PROVIDER=fake  -> FakeProvider (без сети);
+      OPENAI_API_KEY     -> OpenAIProvider;
+      иначе              -> None (AI недоступен).
+    """
+    global _gateway, _configured
+    if _configured:
+        return _gateway
+
+    from llm.providers import FakeProvider, OpenAIProvider
+
+    if os.getenv("LLM_PROVIDER", "").lower() == "fake":
+        provider = FakeProvider()
+    elif os.getenv("OPENAI_API_KEY"):
+        provider = OpenAIProvider(os.getenv("OPENAI_API_KEY"))
+    else:
+        provider = None
+
+    if provider is not None:
+        _gateway = LLMGateway(
+            provider,
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+            per_user_concurrency=int(os.getenv("LLM_PER_USER_CONCURRENCY", "2")),
+            call_timeout=float(os.getenv("LLM_CALL_TIMEOUT", "60")),
+            stream_idle_timeout=float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "30")),
+            stream_timeout=float(os.getenv("LLM_STREAM_TIMEOUT", "300")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30")),
+            ),
+        )
+    _configured = True
+    return _gateway
+
+
+def set_gateway(gateway: Optional[LLMGateway]) -> None:
+    """Подменяет общий шлюз (тесты, локальные прогоны с FakeProvider)."""
+    global _gateway, _configured
+    _gateway = gateway
+    _configured = True
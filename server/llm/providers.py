@@ -0,0 +1,135 @@
+# server/llm/providers.py
+"""
+Провайдеры для LLMGateway.
+
+Провайдер реализует (name — метка для учёта токенов):
+    async complete(messages, *, model, **params) -> LLMResult
+    stream(messages, *, model, **params) -> AsyncIterator[StreamChunk]
+и переводит свои исключения в ProviderError(status_code, retry_after).
+"""
+
+import asyncio
+from typing import AsyncIterator, Iterable, List, Optional
+
+from llm.gateway import LLMResult, ProviderError, StreamChunk
+
+
+# =====================================================
+#  OPENAI
+# =====================================================
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self, api_key: str):
+        from openai import AsyncOpenAI
+
+        # повторы и таймауты — на стороне шлюза
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+
+    @staticmethod
+    def _error(e: Exception) -> ProviderError:
+        import openai
+
+        if isinstance(e, openai.APIStatusError):
+            retry_after = None
+            try:
+                retry_after = float(e.response.headers.get("retry-after"))
+            except (TypeError, ValueError, AttributeError):
+                pass
+            return ProviderError(str(e), status_code=e.status_code, retry_after=retry_after)
+        if isinstance(e, (openai.APIConnectionError, openai.APITimeoutError)):
+            return ProviderError(str(e), status_code=None)
+        return ProviderError(str(e), status_code=400)
+
+    @staticmethod
+    def _usage(usage) -> Optional[dict]:
+        return usage.model_dump() if usage is not None else None
+
+    async def complete(self, messages, *, model, **params) -> LLMResult:
+        import openai
+
+        try:
+            resp = await self.client.chat.completions.create(model=model, messages=messages, **params)
+        except openai.OpenAIError as e:
+            raise self._error(e)
+
+        text = resp.choices[0].message.content if resp.choices else None
+        return LLMResult(text=(text or "").strip(), model=resp.model or model, usage=self._usage(resp.usage))
+
+    async def stream(self, messages, *, model, **params) -> AsyncIterator[StreamChunk]:
+        import openai
+
+        try:
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **params,
+            )
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    yield StreamChunk(usage=self._usage(chunk.usage))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield StreamChunk(text=chunk.choices[0].delta.content)
+        except openai.OpenAIError as e:
+            raise self._error(e)
+
+
+# =====================================================
+#  FAKE (тесты / локальная разработка)
+# =====================================================
+
+class FakeProvider:
+    """
+    Локальный провайдер без сети.
+
+    reply       — текст ответа (по умолчанию эхо последнего сообщения);
+    latency     — задержка ответа, сек;
+    failures    — список кодов ошибок, которые вернут первые вызовы
+                  (например [429, 503] — два отказа, потом успех).
+    """
+
+    name = "fake"
+
+    def __init__(self,
+                 reply: Optional[str] = None,
+                 latency: float = 0.0,
+                 failures: Iterable[int] = (),
+                 chunk_size: int = 8):
+        self.reply = reply
+        self.latency = latency
+        self.failures: List[int] = list(failures)
+        self.chunk_size = chunk_size
+        self.calls: List[List[dict]] = []
+
+    def _answer(self, messages) -> str:
+        self.calls.append(messages)
+        if self.failures:
+            status = self.failures.pop(0)
+            raise ProviderError(f"fake error {status}", status_code=status)
+        if self.reply is not None:
+            return self.reply
+        return f"echo: {messages[-1]['content']}" if messages else "echo"
+
+    @staticmethod
+    def _usage(messages, text: str) -> dict:
+        prompt = sum(len(m.get("content") or "") for m in messages) // 4 + 1
+        completion = len(text) // 4 + 1
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    async def complete(self, messages, *, model, **params) -> LLMResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self._answer(messages)
+        return LLMResult(text=text, model=model, usage=self._usage(messages, text))
+
+    async def stream(self, messages, *, model, **params) -> AsyncIterator[StreamChunk]:
+        text = self._answer(messages)
+        step = self.latency / max(1, len(text) // self.chunk_size) if self.latency else 0
+        for i in range(0, len(text), self.chunk_size):
+            if step:
+                await asyncio.sleep(step)
+            yield StreamChunk(text=text[i:i + self.chunk_size])
+        yield StreamChunk(usage=self._usage(messages, text))
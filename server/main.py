@@ -2,20 +2,30 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from starlette.responses import JSONResponse
-import logging, os
+from starlette.responses import JSONResponse, PlainTextResponse
+from fastapi import Header, HTTPException
+import asyncio, logging, os
 from pathlib import Path
 
 # ------------------------ DB INIT ------------------------
 from db import init_db
+from vision.context import load_tokenizer
+from tokenscount import quotas, usage_recorder
 
 
 # ------------------------ ROUTERS ------------------------
 # ❗️ ТУТ АККУРАТНАЯ ПРАВКА — подключаем НОВЫЙ vision_server.py
-from vision.vision_server import router as vision_router
+from vision.vision_server import router as vision_router, ai_jobs
 from voicerecorder.voicerecorder_server import router as vr_router
 
 import auth.smart_auth as smart_auth
+from auth.sessions import last_used
+from auth.sweeper import session_sweeper
+from core.http import close_http_client
+from core.querytrace import QueryTraceMiddleware
+from voicerecorder.workers import decode_pool, io_pool
+from voicerecorder.journal import journal_sweeper
+from voicerecorder.budget import budget as voice_budget
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 log = logging.getLogger("server")
@@ -26,10 +36,38 @@ app = FastAPI(title="SMART Backend", version="0.2.0")
 @app.on_event("startup")
 async def startup():
     await init_db()
+    # словарь токенайзера для контекста AI грузим в фоне (может качаться из сети)
+    asyncio.get_running_loop().run_in_executor(None, load_tokenizer)
+    ai_jobs.start()
+    usage_recorder.start()
+    # квоты AI засеваются из tokenscount_hourly и дальше сверяются в фоне
+    await quotas.start()
+    last_used.start()
+    # чистка протухших smart_sessions (и проверка индексов) — в фоне
+    session_sweeper.start()
+    # брошенные журналы диктовок (и остатки после падения) — в фоне
+    journal_sweeper.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await ai_jobs.stop()
+    await quotas.stop()
+    await last_used.stop()
+    await session_sweeper.stop()
+    await journal_sweeper.stop()
+    await close_http_client()
+    decode_pool.shutdown()
+    io_pool.shutdown()
+    # после остановки воркеров: их учёт токенов тоже должен попасть в БД
+    await usage_recorder.stop()
 
 # ------------------------ MIDDLEWARE ------------------------
 app.add_middleware(GZipMiddleware)
 
+# число запросов к БД на HTTP-запрос (заголовки X-DB-* в dev, метрики и warning — всегда)
+app.add_middleware(QueryTraceMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -42,6 +80,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "X-DB-Time-Ms", "X-DB-Duplicates"],
 )
 
 # ------------------------ API ROUTES ------------------------
@@ -69,6 +108,10 @@ except Exception as e:
     log.warning(f"voicerecorder_server not mounted: {e}")
 
 
+# ⭐ Учёт токенов (агрегаты tokenscount)
+from tokenscount.api import router as tokens_router
+app.include_router(tokens_router, prefix="/api/tokens", tags=["tokens"])
+
 # Database routers
 try:
     from database.api_db import router as db_router
@@ -99,6 +142,51 @@ def info():
         "env": os.environ.get("ENV", "dev"),
     })
 
+# ------------------------ OPS AUTH ------------------------
+# /metrics и /api/debug/caches: если задан METRICS_TOKEN — нужен заголовок
+# Authorization: Bearer <token>. Без токена оба отвечают только при ENV=dev.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+def _require_ops_token(authorization: str) -> None:
+    if METRICS_TOKEN:
+        if authorization != f"Bearer {METRICS_TOKEN}":
+            raise HTTPException(status_code=401, detail="Unauthorized")
+    elif os.environ.get("ENV", "dev") != "dev":
+        raise HTTPException(status_code=404, detail="Not Found")
+
+# ------------------------ CACHE STATS ------------------------
+# (до монтирования статики на "/", иначе маршрут будет перекрыт)
+@app.get("/api/debug/caches", include_in_schema=False)
+def _caches(authorization: str = Header(default="")):
+    _require_ops_token(authorization)
+    from auth.hashing import hasher
+    from auth.sessions import session_cache
+    from llm import get_gateway
+    from vision.vision_server import role_cache, history_windows, summaries
+    from db import pool
+    stats = [role_cache.stats(), history_windows.stats(), summaries.stats(), ai_jobs.stats(),
+             usage_recorder.stats(), quotas.stats(), hasher.stats(),
+             session_cache.stats(), last_used.stats(), session_sweeper.stats()]
+    if pool is not None:
+        stats.append(pool.stats())
+    if get_gateway() is not None:
+        stats.append(get_gateway().stats())
+    try:
+        from database.deps import user_directory, verified_tokens
+        stats += [verified_tokens.stats(), user_directory.stats()]
+    except Exception:
+        pass
+    stats += [decode_pool.stats(), io_pool.stats(), journal_sweeper.stats(), voice_budget.stats()]
+    return stats
+
+# ------------------------ METRICS ------------------------
+# Prometheus text: пул БД, LLM, bcrypt, учёт токенов и т.д.
+@app.get("/metrics", include_in_schema=False)
+def _metrics(authorization: str = Header(default="")):
+    from core import metrics
+    _require_ops_token(authorization)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ------------------------ STATIC DATA ------------------------
 DATA_DIR = Path(os.getcwd()).resolve() / "data"
 VOICE_DATA_DIR = DATA_DIR / "voicerecorder"
@@ -0,0 +1,4 @@
+-- Индекс под keyset-пагинацию шагов визии:
+-- WHERE vision_id = $1 AND (created_at, id) < / > (...) ORDER BY created_at, id
+CREATE INDEX IF NOT EXISTS vision_steps_vision_created_id_idx
+    ON public.vision_steps (vision_id, created_at, id);
@@ -0,0 +1,8 @@
+-- Скользящее резюме ранней части диалога визии (для контекста AI).
+-- summary покрывает все шаги с id <= last_step_id.
+CREATE TABLE IF NOT EXISTS public.vision_summaries (
+    vision_id    uuid PRIMARY KEY REFERENCES public.visions (id) ON DELETE CASCADE,
+    summary      text        NOT NULL DEFAULT '',
+    last_step_id bigint      NOT NULL DEFAULT 0,
+    updated_at   timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,22 @@
+-- Фоновые задачи генерации ответа AI для шагов визии (режим background в /vision/step).
+-- Состояние в БД, поэтому задачи переживают рестарт; воркеры забирают их
+-- через FOR UPDATE SKIP LOCKED, зависшие 'running' возвращаются по locked_until.
+CREATE TABLE IF NOT EXISTS public.vision_ai_jobs (
+    id           bigserial PRIMARY KEY,
+    vision_id    uuid        NOT NULL REFERENCES public.visions (id) ON DELETE CASCADE,
+    step_id      bigint      NOT NULL REFERENCES public.vision_steps (id) ON DELETE CASCADE,
+    user_id      uuid        NOT NULL,
+    user_text    text        NOT NULL,
+    status       text        NOT NULL DEFAULT 'queued',  -- queued | running | done | failed
+    attempts     int         NOT NULL DEFAULT 0,
+    max_attempts int         NOT NULL DEFAULT 3,
+    error        text,
+    run_after    timestamptz NOT NULL DEFAULT now(),
+    locked_until timestamptz,
+    created_at   timestamptz NOT NULL DEFAULT now(),
+    updated_at   timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS vision_ai_jobs_pending_idx
+    ON public.vision_ai_jobs (run_after, id)
+    WHERE status IN ('queued', 'running');
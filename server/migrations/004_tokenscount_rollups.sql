@@ -0,0 +1,58 @@
+-- Агрегаты tokenscount по часам и по дням (UTC) на clientid / clienttype / model.
+-- Поддерживаются приложением, не триггером: записи через recorder.py и
+-- service.log_tokenscount в той же транзакции прибавляют свои токены сюда
+-- (tokenscount.rollups.upsert_rollups). Прямой INSERT в tokenscount мимо
+-- этих путей агрегаты не обновляет — после такой правки их нужно пересчитать.
+-- NULL в ключах хранится как '' (первичный ключ не допускает NULL).
+CREATE TABLE IF NOT EXISTS public.tokenscount_hourly (
+    bucket           timestamptz NOT NULL,
+    clientid         text        NOT NULL DEFAULT '',
+    clienttype       text        NOT NULL DEFAULT '',
+    model            text        NOT NULL DEFAULT '',
+    calls            bigint      NOT NULL DEFAULT 0,
+    prompttokens     bigint      NOT NULL DEFAULT 0,
+    completiontokens bigint      NOT NULL DEFAULT 0,
+    totaltokens      bigint      NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, clientid, clienttype, model)
+);
+
+CREATE INDEX IF NOT EXISTS tokenscount_hourly_client_idx
+    ON public.tokenscount_hourly (clientid, bucket);
+
+CREATE TABLE IF NOT EXISTS public.tokenscount_daily (
+    day              date        NOT NULL,
+    clientid         text        NOT NULL DEFAULT '',
+    clienttype       text        NOT NULL DEFAULT '',
+    model            text        NOT NULL DEFAULT '',
+    calls            bigint      NOT NULL DEFAULT 0,
+    prompttokens     bigint      NOT NULL DEFAULT 0,
+    completiontokens bigint      NOT NULL DEFAULT 0,
+    totaltokens      bigint      NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, clientid, clienttype, model)
+);
+
+CREATE INDEX IF NOT EXISTS tokenscount_daily_client_idx
+    ON public.tokenscount_daily (clientid, day);
+
+-- Заполнение по уже накопленному логу (только если агрегаты ещё пусты).
+-- totaltokens: если провайдер его не прислал — prompt + completion.
+INSERT INTO public.tokenscount_hourly
+    (bucket, clientid, clienttype, model, calls, prompttokens, completiontokens, totaltokens)
+SELECT date_trunc('hour', createdat AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+       COALESCE(clientid, ''), COALESCE(clienttype, ''), COALESCE(model, ''),
+       count(*),
+       COALESCE(sum(prompttokens), 0),
+       COALESCE(sum(completiontokens), 0),
+       COALESCE(sum(COALESCE(totaltokens, COALESCE(prompttokens, 0) + COALESCE(completiontokens, 0))), 0)
+FROM public.tokenscount
+WHERE createdat IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM public.tokenscount_hourly)
+GROUP BY 1, 2, 3, 4;
+
+INSERT INTO public.tokenscount_daily
+    (day, clientid, clienttype, model, calls, prompttokens, completiontokens, totaltokens)
+SELECT (bucket AT TIME ZONE 'UTC')::date, clientid, clienttype, model,
+       sum(calls), sum(prompttokens), sum(completiontokens), sum(totaltokens)
+FROM public.tokenscount_hourly
+WHERE NOT EXISTS (SELECT 1 FROM public.tokenscount_daily)
+GROUP BY 1, 2, 3, 4;
@@ -0,0 +1,3 @@
+-- Индексы smart_sessions перенесены в 006: там они строятся CONCURRENTLY,
+-- без блокировки записи в таблицу сессий. На базах, где 005 уже применена,
+-- 006 ничего не делает (IF NOT EXISTS).
@@ -0,0 +1,12 @@
+-- Индексы для поиска сессии по токену (lookup_session) и для чистки
+-- протухших сессий (auth/sweeper.py).
+-- CONCURRENTLY не блокирует login / logout на время построения, но не
+-- работает внутри транзакции: применять по одной команде, без
+-- psql --single-transaction / BEGIN.
+-- Если построение прервалось, индекс остаётся INVALID и IF NOT EXISTS его
+-- пропустит — такой индекс удалить (DROP INDEX CONCURRENTLY) и применить заново.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS smart_sessions_token_key
+    ON public.smart_sessions (token);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS smart_sessions_expires_at_idx
+    ON public.smart_sessions (expires_at);
@@ -0,0 +1,36 @@
+# server/tests/conftest.py
+"""
+Тесты запускаются из server/:  python -m pytest tests
+Модули сервера импортируются так же, как в main.py (from core import ...).
+Асинхронный код гоняется через asyncio.run — без плагинов pytest.
+
+Окружение для диктофона задаётся до импорта модулей: временные каталоги
+вместо /tmp/voicerecorder и «ffmpeg», который просто копирует PCM в файл
+(кодек тестам не нужен, нужен процесс с тем же stdin/выходом).
+"""
+
+import os
+import stat
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp(prefix="smart-tests-")
+os.environ.setdefault("VOICE_TMP_DIR", os.path.join(_tmp, "voice"))
+os.environ.setdefault("VOICE_JOURNAL_DIR", os.path.join(_tmp, "voice", "journal"))
+# ws_voicerecorder создаёт Supabase-клиент при импорте; в сеть тесты не ходят
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJ0ZXN0.eyJ0ZXN0.c2ln")
+
+if "FFMPEG_BIN" not in os.environ:
+    _ffmpeg = os.path.join(_tmp, "ffmpeg")
+    with open(_ffmpeg, "w") as f:
+        f.write(
+            f"#!{sys.executable}\n"
+            "import shutil, sys\n"
+            "with open(sys.argv[-1], 'wb') as out:\n"
+            "    shutil.copyfileobj(sys.stdin.buffer, out)\n"
+        )
+    os.chmod(_ffmpeg, os.stat(_ffmpeg).st_mode | stat.S_IEXEC)
+    os.environ["FFMPEG_BIN"] = _ffmpeg
@@ -0,0 +1,42 @@
+# server/tests/test_ai_jobs.py
+import asyncio
+
+from llm import gateway as gateway_mod
+from llm.gateway import LLMGateway
+from llm.providers import FakeProvider
+from vision.jobs import JOB_OVERHEAD, AIJobQueue
+
+
+async def _noop(job):
+    return None
+
+
+def test_job_timeout_covers_gateway_retries(monkeypatch):
+    gateway = LLMGateway(FakeProvider(), call_timeout=60, max_retries=3, retry_cap=8, acquire_timeout=30)
+    monkeypatch.setattr(gateway_mod, "_gateway", gateway)
+    monkeypatch.setattr(gateway_mod, "_configured", True)
+
+    async def run():
+        queue = AIJobQueue(_noop, workers=1, lease_seconds=180)
+        queue.start()
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(run())
+    # 4 попытки по 60 с + 3 паузы по 8 с + ожидание слотов
+    assert queue.job_timeout == gateway.max_duration() + JOB_OVERHEAD
+    assert queue.job_timeout > 4 * 60 + 3 * 8
+    # lease длиннее таймаута: живую задачу не заберёт другой воркер
+    assert queue.lease_seconds > queue.job_timeout
+
+
+def test_explicit_job_timeout_is_kept():
+    async def run():
+        queue = AIJobQueue(_noop, workers=1, lease_seconds=60, job_timeout=90)
+        queue.start()
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.job_timeout == 90
+    assert queue.lease_seconds == 90 + JOB_OVERHEAD
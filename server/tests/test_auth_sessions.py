@@ -0,0 +1,73 @@
+# server/tests/test_auth_sessions.py
+import asyncio
+import time
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import db
+from auth import sessions
+
+
+class FakePool:
+    """smart_sessions из одной строки; revoke() — logout в другом воркере."""
+
+    def __init__(self):
+        self.active = True
+        self.queries = 0
+
+    def revoke(self):
+        self.active = False
+
+    async def fetchrow(self, sql, token):
+        self.queries += 1
+        if not self.active:
+            return None
+        return {"session_id": uuid.uuid4(), "remaining": 3600.0,
+                "id": 1, "email": "a@b.c", "name": "A", "level": 1}
+
+
+def test_revoked_elsewhere_expires_within_ttl(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(db, "pool", pool)
+    monkeypatch.setattr(sessions, "SESSION_CACHE_TTL", 0.2)
+    sessions.session_cache.clear()
+
+    async def run():
+        assert await sessions.lookup_session("t") is not None
+        pool.revoke()
+        # внутри окна — ответ из кэша этого воркера
+        assert await sessions.lookup_session("t") is not None
+        time.sleep(0.25)
+        return await sessions.lookup_session("t")
+
+    assert asyncio.run(run()) is None
+    assert pool.queries == 2
+
+
+def test_zero_ttl_checks_db_every_time(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(db, "pool", pool)
+    monkeypatch.setattr(sessions, "SESSION_CACHE_TTL", 0)
+    sessions.session_cache.clear()
+
+    async def run():
+        assert await sessions.lookup_session("t") is not None
+        pool.revoke()
+        return await sessions.lookup_session("t")
+
+    assert asyncio.run(run()) is None
+    assert pool.queries == 2
+
+
+def test_default_window_is_short():
+    assert sessions.session_cache.ttl <= 5
+
+
+def test_lookup_before_pool_is_ready_is_503(monkeypatch):
+    monkeypatch.setattr(db, "pool", None)
+    sessions.session_cache.clear()
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(sessions.lookup_session("t"))
+    assert exc.value.status_code == 503
@@ -0,0 +1,31 @@
+# server/tests/test_db_pooler.py
+import pytest
+
+import db
+
+
+def test_default_mode_keeps_prepared_statements_off():
+    # без DB_POOLER_MODE — как до пула с режимами: statement_cache_size=0
+    assert db.DB_POOLER_MODE == "transaction"
+    assert db.detect_pooler_mode("postgresql://u@db.example.com:5432/postgres") == "transaction"
+
+
+@pytest.mark.parametrize("dsn, mode", [
+    ("postgresql://u@pooler.supabase.com:6543/postgres", "transaction"),
+    ("postgresql://u@host:5432/postgres?pgbouncer=true", "transaction"),
+    ("postgresql://u@host:5432/postgres", "direct"),
+    (None, "direct"),
+])
+def test_auto_mode_is_opt_in_guess(dsn, mode):
+    assert db.detect_pooler_mode(dsn, "auto") == mode
+
+
+def test_explicit_mode_wins_over_dsn():
+    assert db.detect_pooler_mode("postgresql://u@host:6543/postgres", "direct") == "direct"
+    with pytest.raises(ValueError):
+        db.detect_pooler_mode("postgresql://u@host/postgres", "bogus")
+
+
+def test_pgbouncer_flag_is_not_sent_to_server():
+    dsn = "postgresql://u@host:5432/postgres?sslmode=require&pgbouncer=true"
+    assert db._strip_pgbouncer_flag(dsn) == "postgresql://u@host:5432/postgres?sslmode=require"
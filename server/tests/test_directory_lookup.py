@@ -0,0 +1,70 @@
+# server/tests/test_directory_lookup.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from database import deps
+
+
+@pytest.fixture
+def directory(monkeypatch):
+    """Медленный справочник USER со счётчиком запросов."""
+    calls = []
+    lock = threading.Lock()
+
+    def fetch(user_id):
+        with lock:
+            calls.append(user_id)
+        time.sleep(0.05)
+        if user_id == "broken":
+            raise RuntimeError("db down")
+        return {"id": user_id, "email": f"{user_id}@x"}
+
+    monkeypatch.setattr(deps, "_fetch_directory_user", fetch)
+    deps.user_directory.clear()
+    deps._user_inflight.clear()
+    yield calls
+    deps.user_directory.clear()
+    deps._user_inflight.clear()
+
+
+def test_concurrent_misses_share_one_fetch(directory):
+    async def run():
+        return await asyncio.gather(*(deps.lookup_directory_user("u1") for _ in range(5)))
+
+    users = asyncio.run(run())
+    assert all(u == {"id": "u1", "email": "u1@x"} for u in users)
+    assert directory == ["u1"]
+    assert not deps._user_inflight
+
+
+def test_cancelled_leader_does_not_hang_followers(directory):
+    async def run():
+        leader = asyncio.create_task(deps.lookup_directory_user("u1"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(deps.lookup_directory_user("u1"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.wait_for(follower, 1.0)
+
+    assert asyncio.run(run()) == {"id": "u1", "email": "u1@x"}
+    assert directory == ["u1"]
+    # запрос дошёл до конца — результат в кэше
+    assert deps.user_directory.get("u1") == {"id": "u1", "email": "u1@x"}
+
+
+def test_fetch_error_reaches_every_waiter_and_is_not_cached(directory):
+    async def run():
+        return await asyncio.gather(
+            *(deps.lookup_directory_user("broken") for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert directory == ["broken"]
+    assert deps.user_directory.get("broken") is deps.MISSING
+    assert not deps._user_inflight
@@ -0,0 +1,44 @@
+# server/tests/test_history_cache.py
+import time
+
+from vision.history_cache import HistoryWindows
+
+
+def step(i: int) -> dict:
+    return {"id": i, "user_text": f"q{i}", "ai_text": f"a{i}", "extra": "dropped"}
+
+
+def test_window_keeps_last_steps_compacted():
+    windows = HistoryWindows(size=3)
+    windows.put("v1", [step(i) for i in range(5)])
+    windows.append("v1", step(5))
+    assert [s["id"] for s in windows.get("v1")] == [3, 4, 5]
+    assert "extra" not in windows.get("v1")[0]
+
+
+def test_append_without_seeded_window_is_ignored():
+    windows = HistoryWindows()
+    windows.append("v1", step(1))
+    assert windows.get("v1") is None
+
+
+def test_append_does_not_extend_ttl():
+    windows = HistoryWindows(ttl=0.2)
+    windows.put("v1", [step(0)])
+    # постоянный трафик: шаги каждые 50 мс дольше TTL
+    for i in range(1, 6):
+        time.sleep(0.05)
+        windows.append("v1", step(i))
+    assert windows.get("v1") is None
+
+
+def test_out_of_order_appends_are_kept_in_insert_order():
+    windows = HistoryWindows(size=3)
+    windows.put("v1", [step(1)])
+    # шаг 3 закончил раньше шага 2
+    windows.append("v1", step(3))
+    windows.append("v1", step(2))
+    windows.append("v1", step(2))  # повтор не дублируется
+    assert [s["id"] for s in windows.get("v1")] == [1, 2, 3]
+    windows.append("v1", step(0))  # старше окна — вытесняется сам
+    assert [s["id"] for s in windows.get("v1")] == [1, 2, 3]
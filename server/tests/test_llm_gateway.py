@@ -0,0 +1,171 @@
+# server/tests/test_llm_gateway.py
+import asyncio
+
+import pytest
+
+from llm.gateway import CircuitBreaker, CircuitOpenError, LLMGateway, ProviderError
+from llm.providers import FakeProvider
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def make_gateway(provider, **kwargs) -> LLMGateway:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    return LLMGateway(provider, max_retries=0, retry_base=0.0, breaker=breaker, **kwargs)
+
+
+async def trip(gateway: LLMGateway) -> None:
+    """Два отказа подряд — breaker открыт."""
+    gateway.provider.failures = [503, 503]
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            await gateway.complete(MESSAGES, model="m")
+    assert gateway.breaker.state == CircuitBreaker.OPEN
+
+
+def test_retry_then_success():
+    provider = FakeProvider(failures=[429, 503])
+    gateway = LLMGateway(provider, max_retries=3, retry_base=0.0)
+    result = asyncio.run(gateway.complete(MESSAGES, model="m"))
+    assert result.text == "echo: hi"
+    assert result.attempts == 3
+
+
+def test_client_error_is_not_retried():
+    provider = FakeProvider(failures=[400])
+    gateway = LLMGateway(provider, max_retries=3, retry_base=0.0)
+    with pytest.raises(ProviderError):
+        asyncio.run(gateway.complete(MESSAGES, model="m"))
+    assert len(provider.calls) == 1
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_rejects_without_calling_provider():
+    async def run():
+        gateway = make_gateway(FakeProvider())
+        await trip(gateway)
+        calls = len(gateway.provider.calls)
+        with pytest.raises(CircuitOpenError):
+            await gateway.complete(MESSAGES, model="m")
+        assert len(gateway.provider.calls) == calls
+
+    asyncio.run(run())
+
+
+def test_half_open_probe_success_closes():
+    async def run():
+        gateway = make_gateway(FakeProvider())
+        await trip(gateway)
+        await asyncio.sleep(0.06)
+        await gateway.complete(MESSAGES, model="m")
+        assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(run())
+
+
+def test_half_open_allows_single_probe():
+    async def run():
+        gateway = make_gateway(FakeProvider(latency=0.05))
+        await trip(gateway)
+        await asyncio.sleep(0.06)
+        probe = asyncio.create_task(gateway.complete(MESSAGES, model="m"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(CircuitOpenError):
+            await gateway.complete(MESSAGES, model="m")
+        await probe
+        assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(run())
+
+
+def test_cancelled_probe_does_not_wedge_breaker():
+    async def run():
+        gateway = make_gateway(FakeProvider(latency=0.5))
+        await trip(gateway)
+        await asyncio.sleep(0.06)
+        probe = asyncio.create_task(gateway.complete(MESSAGES, model="m"))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        # следующий вызов — новая проба, а не вечный CircuitOpenError
+        gateway.provider.latency = 0
+        result = await gateway.complete(MESSAGES, model="m")
+        assert result.text == "echo: hi"
+        assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(run())
+
+
+def test_probe_timed_out_by_caller_does_not_wedge_breaker():
+    async def run():
+        gateway = make_gateway(FakeProvider(latency=0.5))
+        await trip(gateway)
+        await asyncio.sleep(0.06)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(gateway.complete(MESSAGES, model="m"), 0.01)
+        gateway.provider.latency = 0
+        await gateway.complete(MESSAGES, model="m")
+        assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(run())
+
+
+def test_abandoned_stream_probe_does_not_wedge_breaker():
+    async def run():
+        gateway = make_gateway(FakeProvider(reply="x" * 64))
+        await trip(gateway)
+        await asyncio.sleep(0.06)
+        stream = gateway.stream(MESSAGES, model="m")
+        await stream.__anext__()
+        await stream.aclose()  # клиент ушёл посреди ответа
+        chunks = [c.text async for c in gateway.stream(MESSAGES, model="m")]
+        assert "".join(chunks) == "x" * 64
+        assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(run())
+
+
+def test_stream_deadline_starts_after_slot_wait():
+    # ответ ~0.3 с при call_timeout 0.1 и ожидании слота 0.2 с: не обрывается
+    provider = FakeProvider(reply="x" * 64, latency=0.3, chunk_size=8)
+    gateway = make_gateway(provider, max_concurrency=1, call_timeout=0.1,
+                           stream_idle_timeout=0.2, stream_timeout=5.0)
+
+    async def hold_slot():
+        async with gateway._slot(None):
+            await asyncio.sleep(0.2)
+
+    async def run():
+        holder = asyncio.create_task(hold_slot())
+        await asyncio.sleep(0)
+        chunks = [c.text async for c in gateway.stream(MESSAGES, model="m") if c.text]
+        await holder
+        return "".join(chunks)
+
+    assert asyncio.run(run()) == "x" * 64
+
+
+def test_stream_idle_timeout_cuts_stalled_stream():
+    provider = FakeProvider(reply="x" * 16, latency=1.0, chunk_size=8)  # 0.5 с между кусками
+    gateway = make_gateway(provider, stream_idle_timeout=0.1, stream_timeout=5.0)
+
+    async def run():
+        return [c async for c in gateway.stream(MESSAGES, model="m")]
+
+    with pytest.raises(ProviderError, match="timeout"):
+        asyncio.run(run())
+
+
+def test_stream_timeout_caps_whole_attempt():
+    provider = FakeProvider(reply="x" * 80, latency=1.0, chunk_size=8)  # 0.1 с между кусками
+    gateway = make_gateway(provider, stream_idle_timeout=1.0, stream_timeout=0.35)
+
+    async def run():
+        got = []
+        with pytest.raises(ProviderError, match="timeout"):
+            async for c in gateway.stream(MESSAGES, model="m"):
+                got.append(c)
+        return got
+
+    assert 0 < len(asyncio.run(run())) < 10
@@ -0,0 +1,35 @@
+# server/tests/test_ops_auth.py
+from fastapi.testclient import TestClient
+
+import main
+
+
+def client() -> TestClient:
+    # без with: startup (пул БД и т.д.) не запускается
+    return TestClient(main.app)
+
+
+def test_caches_need_token_when_configured(monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "s3cret")
+    c = client()
+    assert c.get("/api/debug/caches").status_code == 401
+    assert c.get("/api/debug/caches", headers={"Authorization": "Bearer nope"}).status_code == 401
+    assert c.get("/metrics").status_code == 401
+    assert c.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
+
+
+def test_ops_endpoints_hidden_outside_dev_without_token(monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "")
+    monkeypatch.setenv("ENV", "prod")
+    c = client()
+    assert c.get("/api/debug/caches").status_code == 404
+    assert c.get("/metrics").status_code == 404
+
+
+def test_caches_open_in_dev_without_token(monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "")
+    monkeypatch.setenv("ENV", "dev")
+    resp = client().get("/api/debug/caches")
+    assert resp.status_code == 200
+    assert any(s.get("name") == "voice_budget" for s in resp.json())
+    assert client().get("/metrics").status_code == 200
@@ -0,0 +1,99 @@
+# server/tests/test_password_hasher.py
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import db
+from auth import hashing, smart_auth
+from auth.hashing import HasherBusy, PasswordHasher
+
+
+def test_hash_and_check_run_in_worker_threads():
+    h = PasswordHasher(workers=2, rounds=4)
+    threads = []
+    real_check = h._check
+
+    def check(password, hashed):
+        threads.append(threading.current_thread().name)
+        return real_check(password, hashed)
+
+    h._check = check
+
+    async def run():
+        hashed = await h.hash("secret")
+        return hashed, await h.check("secret", hashed), await h.check("wrong", hashed)
+
+    hashed, ok, bad = asyncio.run(run())
+    assert hashed.startswith("$2b$04$")
+    assert ok is True and bad is False
+    assert all(t.startswith("bcrypt") for t in threads)
+    assert h.pending == 0
+
+
+def test_event_loop_keeps_running_while_hashing():
+    h = PasswordHasher(workers=1)
+    h._check = lambda password, hashed: time.sleep(0.1) or True
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        t = asyncio.create_task(ticker())
+        await h.check("p", "h")
+        t.cancel()
+        return ticks
+
+    assert asyncio.run(run()) >= 5
+
+
+def test_saturated_pool_rejects_immediately():
+    h = PasswordHasher(workers=1, max_queue=1)
+    gate = threading.Event()
+    h._check = lambda password, hashed: gate.wait(5)
+    rejected = hashing._rejected.value()
+
+    async def run():
+        running = asyncio.create_task(h.check("p", "h"))
+        queued = asyncio.create_task(h.check("p", "h"))
+        await asyncio.sleep(0.01)
+        assert h.pending == 2
+
+        started = time.perf_counter()
+        with pytest.raises(HasherBusy):
+            await h.check("p", "h")
+        waited = time.perf_counter() - started
+
+        gate.set()
+        return await asyncio.gather(running, queued), waited
+
+    results, waited = asyncio.run(run())
+    assert results == [True, True]
+    assert waited < 0.05
+    assert hashing._rejected.value() == rejected + 1
+    assert h.pending == 0 and h.stats()["rejected"] == rejected + 1
+
+
+def test_login_answers_503_when_hasher_is_busy(monkeypatch):
+    class BusyHasher:
+        async def check(self, password, hashed):
+            raise HasherBusy("busy")
+
+    class FakePool:
+        async def fetchrow(self, sql, *args):
+            return {"id": "u1", "password_hash": "$2b$04$x"}
+
+    monkeypatch.setattr(smart_auth, "hasher", BusyHasher())
+    monkeypatch.setattr(db, "pool", FakePool())
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(smart_auth.login(smart_auth.LoginRequest(email="a@example.com", password="p")))
+    assert e.value.status_code == 503
+    assert e.value.headers == {"Retry-After": "1"}
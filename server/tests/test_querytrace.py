@@ -0,0 +1,94 @@
+# server/tests/test_querytrace.py
+import logging
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import db
+from core import querytrace
+from core.querytrace import QueryTraceMiddleware
+
+SERVER_DIR = Path(__file__).resolve().parents[1]
+
+
+class FakeConn:
+    async def fetchrow(self, sql, *args):
+        return {"id": args[0] if args else None}
+
+    async def fetchval(self, sql, *args):
+        return 1
+
+
+def make_app(**mw) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(QueryTraceMiddleware, **mw)
+    conn = db.InstrumentedConnection(FakeConn())
+
+    @app.get("/steps/{n}")
+    async def steps(n: int):
+        await conn.fetchval("SELECT count(*) FROM vision_steps")
+        # N+1: один и тот же запрос на каждый шаг, форматирование SQL разное
+        for i in range(n):
+            sql = "SELECT name FROM smart_users\n   WHERE id = $1" if i % 2 else "SELECT name  FROM smart_users WHERE id = $1"
+            await conn.fetchrow(sql, i)
+        return {"ok": True}
+
+    return app
+
+
+def test_repeated_statement_is_counted_and_warned(caplog):
+    app = make_app(headers=True, warn_queries=100, warn_duplicates=3)
+    before = querytrace._warnings.value(route="/steps/{n}", reason="duplicates")
+
+    with caplog.at_level(logging.WARNING, logger="core.querytrace"):
+        resp = TestClient(app).get("/steps/5")
+
+    assert resp.status_code == 200
+    assert resp.headers["x-db-queries"] == "6"
+    # 5 одинаковых (после нормализации) запросов = 4 повтора
+    assert resp.headers["x-db-duplicates"] == "4"
+    assert float(resp.headers["x-db-time-ms"]) >= 0
+    assert querytrace._warnings.value(route="/steps/{n}", reason="duplicates") == before + 1
+
+    [rec] = [r for r in caplog.records if r.name == "core.querytrace"]
+    msg = rec.getMessage()
+    assert "/steps/{n}: 6 DB queries" in msg
+    assert "5x pg: SELECT name FROM smart_users WHERE id = $1" in msg
+
+
+def test_below_threshold_is_not_warned(caplog):
+    app = make_app(headers=True, warn_queries=100, warn_duplicates=3)
+    with caplog.at_level(logging.WARNING, logger="core.querytrace"):
+        resp = TestClient(app).get("/steps/2")
+    assert resp.headers["x-db-duplicates"] == "1"
+    assert not [r for r in caplog.records if r.name == "core.querytrace"]
+
+
+def test_headers_off_outside_dev():
+    resp = TestClient(make_app(headers=False)).get("/steps/3")
+    assert resp.status_code == 200
+    assert not any(h.startswith("x-db-") for h in resp.headers)
+
+
+def test_record_outside_request_is_noop():
+    assert querytrace.current() is None
+    querytrace.record("pg", "SELECT 1", 0.1)  # не падает, никуда не пишет
+
+
+def _headers_default(env: str) -> str:
+    environ = {k: v for k, v in os.environ.items() if k != "QUERY_TRACE_HEADERS"}
+    environ["ENV"] = env
+    out = subprocess.run(
+        [sys.executable, "-c", "from core import querytrace; print(querytrace.QUERY_TRACE_HEADERS)"],
+        cwd=SERVER_DIR, env=environ, capture_output=True, text=True, check=True,
+    )
+    return out.stdout.strip()
+
+
+def test_headers_default_depends_on_env():
+    assert _headers_default("dev") == "True"
+    assert _headers_default("production") == "False"
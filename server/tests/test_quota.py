@@ -0,0 +1,97 @@
+# server/tests/test_quota.py
+import asyncio
+from collections import defaultdict
+
+import pytest
+
+import db
+from tokenscount import quota as quota_mod
+from tokenscount.quota import QuotaExceeded, QuotaManager, _hour
+from tokenscount.recorder import UsageRecorder
+
+
+class FakeStore:
+    """tokenscount_hourly в памяти: запись пачки и чтение агрегатов с задержкой."""
+
+    def __init__(self):
+        self.hourly = defaultdict(int)
+
+    async def write(self, batch):
+        await asyncio.sleep(0.01)
+        for row in batch:
+            clientid, clienttype, *_rest, createdat = row
+            self.hourly[(clientid, clienttype, _hour(createdat))] += row[6]
+
+    async def fetch(self, sql, clienttype, since):
+        await asyncio.sleep(0.01)
+        return [
+            {"clientid": cid, "bucket": bucket, "tokens": tokens}
+            for (cid, ctype, bucket), tokens in self.hourly.items()
+            if ctype == clienttype and bucket >= since
+        ]
+
+
+@pytest.fixture
+def env(monkeypatch):
+    store = FakeStore()
+    recorder = UsageRecorder(batch_size=1)
+    monkeypatch.setattr(recorder, "_write", store.write)
+    monkeypatch.setattr(quota_mod, "usage_recorder", recorder)
+    monkeypatch.setattr(db, "pool", store)
+    manager = QuotaManager(daily_tokens=10**9)
+    return manager, recorder, store
+
+
+def spend(manager, recorder, tokens):
+    # как vision_server.record_usage: буфер и локальный счётчик — вместе
+    recorder.record(clientid="u1", clienttype="user", totaltokens=tokens)
+    manager.charge("u1", tokens)
+
+
+def test_quotas_are_off_by_default():
+    assert not QuotaManager().enabled
+    # общий экземпляр без AI_QUOTA_* — тоже выключен
+    assert not quota_mod.quotas.enabled
+    QuotaManager().check("u1")  # не бросает
+
+
+def test_reconcile_does_not_double_count_concurrent_usage(env):
+    manager, recorder, store = env
+
+    async def run():
+        for _ in range(3):
+            spend(manager, recorder, 100)
+        task = asyncio.create_task(manager.reconcile())
+        # расход посреди записи буфера и фоновый flush в это же время
+        await asyncio.sleep(0.015)
+        spend(manager, recorder, 50)
+        background = asyncio.create_task(recorder.flush())
+        await asyncio.sleep(0.03)
+        spend(manager, recorder, 25)  # во время чтения агрегатов
+        await task
+        await background
+        return manager.used("u1")
+
+    assert asyncio.run(run()) == 375
+    # после записи хвоста и новой сверки — то же число, уже из БД
+    asyncio.run(manager.reconcile())
+    assert manager.used("u1") == 375
+    assert sum(store.hourly.values()) == 375
+
+
+def test_daily_limit_rejects_with_retry_after(env):
+    manager, recorder, store = env
+    manager.daily_tokens = 100
+    spend(manager, recorder, 150)
+    with pytest.raises(QuotaExceeded) as exc:
+        manager.check("u1")
+    assert exc.value.retry_after >= 1
+
+
+def test_rpm_bucket():
+    manager = QuotaManager(rpm=2)
+    manager.check("u1")
+    manager.check("u1")
+    with pytest.raises(QuotaExceeded):
+        manager.check("u1")
+    manager.check("u2")
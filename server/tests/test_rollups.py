@@ -0,0 +1,25 @@
+# server/tests/test_rollups.py
+from datetime import datetime, timedelta, timezone
+
+from tokenscount.rollups import _UPSERT_HOURLY, _aggregate, _hour
+
+
+def test_aggregate_is_sorted_by_conflict_key():
+    now = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+    rows = [
+        {"createdat": now - timedelta(hours=h), "clientid": c, "clienttype": "user", "model": "m",
+         "prompttokens": 1, "completiontokens": 2}
+        for h in (3, 1, 2) for c in ("b", "a")
+    ]
+    rows.append(dict(rows[0]))
+    buckets, clients, types, models, calls, prompt, completion, total = _aggregate(rows, _hour)
+    keys = list(zip(buckets, clients, types, models))
+    # один порядок блокировок у всех сбросов — без deadlock
+    assert keys == sorted(keys)
+    assert len(keys) == 6
+    assert sum(calls) == 7
+    assert sum(total) == 7 * 3  # totaltokens нет — prompt + completion
+
+
+def test_upsert_orders_rows_by_key():
+    assert "ORDER BY 1, 2, 3, 4" in _UPSERT_HOURLY
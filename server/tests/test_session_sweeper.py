@@ -0,0 +1,41 @@
+# server/tests/test_session_sweeper.py
+import asyncio
+import logging
+
+import db
+from auth.sweeper import INDEXES, SessionSweeper
+
+
+class FakePool:
+    def __init__(self, present):
+        self.present = present
+
+    async def fetch(self, sql, names):
+        return [{"name": n} for n in names if n in self.present]
+
+    async def execute(self, sql, *args):
+        return "DELETE 0"
+
+
+def test_start_warns_about_missing_indexes(monkeypatch, caplog):
+    monkeypatch.setattr(db, "pool", FakePool({"smart_sessions_token_key"}))
+    sweeper = SessionSweeper(interval=3600)
+
+    async def run():
+        sweeper.start()
+        await asyncio.sleep(0.05)
+        await sweeper.stop()
+
+    with caplog.at_level(logging.WARNING, logger="auth.sweeper"):
+        asyncio.run(run())
+    assert sweeper.missing_indexes == ["smart_sessions_expires_at_idx"]
+    assert "smart_sessions_expires_at_idx" in caplog.text
+    assert sweeper.stats()["missing_indexes"] == ["smart_sessions_expires_at_idx"]
+
+
+def test_no_warning_when_indexes_present(monkeypatch, caplog):
+    monkeypatch.setattr(db, "pool", FakePool(set(INDEXES)))
+    sweeper = SessionSweeper()
+    with caplog.at_level(logging.WARNING, logger="auth.sweeper"):
+        assert asyncio.run(sweeper.check_indexes()) == []
+    assert caplog.text == ""
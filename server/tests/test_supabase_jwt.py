@@ -0,0 +1,163 @@
+# server/tests/test_supabase_jwt.py
+import asyncio
+import json
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+from database import deps
+from database import supabase_jwt
+from database.supabase_jwt import InvalidToken, SupabaseJWTVerifier
+
+URL = "https://proj.supabase.co"
+SECRET = "test-secret-at-least-32-bytes-long!!"
+
+
+def claims(**over) -> dict:
+    now = int(time.time())
+    base = {"sub": "u1", "email": "a@b.c", "aud": "authenticated",
+            "iss": f"{URL}/auth/v1", "iat": now, "exp": now + 600}
+    base.update(over)
+    return {k: v for k, v in base.items() if v is not None}
+
+
+def hs256(**over) -> str:
+    return jwt.encode(claims(**over), SECRET, algorithm="HS256")
+
+
+def verifier(**kwargs) -> SupabaseJWTVerifier:
+    return SupabaseJWTVerifier(URL, jwt_secret=SECRET, leeway=0, **kwargs)
+
+
+def verify(v, token):
+    return asyncio.run(v.verify(token))
+
+
+# ---------- HS256 ----------
+
+def test_valid_hs256_is_accepted():
+    assert verify(verifier(), hs256())["sub"] == "u1"
+
+
+@pytest.mark.parametrize("token", [
+    jwt.encode(claims(), "another-secret-at-least-32-bytes-long", algorithm="HS256"),
+    hs256(aud="anon-other"),
+    hs256(iss="https://evil.example/auth/v1"),
+    hs256(exp=int(time.time()) - 60),
+    hs256(sub=None),
+    "not.a.jwt",
+], ids=["bad-signature", "wrong-aud", "wrong-iss", "expired", "no-sub", "malformed"])
+def test_invalid_hs256_is_rejected(token):
+    with pytest.raises(InvalidToken):
+        verify(verifier(), token)
+
+
+def test_hs256_without_secret_is_undecided():
+    assert verify(SupabaseJWTVerifier(URL), hs256()) is None
+
+
+# ---------- RS256 / JWKS ----------
+
+class JWKS:
+    """JWKS проекта через httpx.MockTransport; keys — текущий набор kid -> ключ."""
+
+    def __init__(self, monkeypatch):
+        self.keys = {}
+        self.requests = 0
+
+        def handler(request):
+            self.requests += 1
+            jwks = []
+            for kid, key in self.keys.items():
+                jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+                jwks.append({**jwk, "kid": kid, "alg": "RS256", "use": "sig"})
+            return httpx.Response(200, json={"keys": jwks})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(supabase_jwt, "get_http_client", lambda: client)
+
+    def add(self, kid):
+        self.keys[kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return self.keys[kid]
+
+
+def rs256(key, kid, **over) -> str:
+    return jwt.encode(claims(**over), key, algorithm="RS256", headers={"kid": kid})
+
+
+def test_rs256_refreshes_jwks_for_new_kid(monkeypatch):
+    jwks = JWKS(monkeypatch)
+    k1 = jwks.add("k1")
+    v = verifier(jwks_min_refresh=0)
+    assert verify(v, rs256(k1, "k1"))["sub"] == "u1"
+
+    # ротация: новый kid — JWKS перечитывается
+    k2 = jwks.add("k2")
+    assert verify(v, rs256(k2, "k2"))["sub"] == "u1"
+    assert jwks.requests == 2
+
+
+def test_unknown_kid_is_undecided(monkeypatch):
+    jwks = JWKS(monkeypatch)
+    jwks.add("k1")
+    stranger = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    v = verifier(jwks_min_refresh=3600)
+    assert verify(v, rs256(stranger, "k9")) is None
+    # повторный незнакомый kid не долбит JWKS чаще jwks_min_refresh
+    assert verify(v, rs256(stranger, "k9")) is None
+    assert jwks.requests == 1
+
+
+def test_rs256_signed_by_other_key_is_rejected(monkeypatch):
+    jwks = JWKS(monkeypatch)
+    jwks.add("k1")
+    stranger = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with pytest.raises(InvalidToken):
+        verify(verifier(), rs256(stranger, "k1"))
+
+
+# ---------- deps.fetch_user_from_token ----------
+
+def test_fetch_user_rejects_invalid_locally(monkeypatch):
+    monkeypatch.setattr(deps, "_verifier", verifier())
+    deps.verified_tokens.clear()
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(deps.fetch_user_from_token(hs256(exp=int(time.time()) - 60)))
+    assert exc.value.status_code == 401
+
+
+def test_fetch_user_accepts_valid_locally(monkeypatch):
+    async def remote(token):
+        raise AssertionError("no remote call expected")
+
+    monkeypatch.setattr(deps, "_verifier", verifier())
+    monkeypatch.setattr(deps, "_fetch_user_remote", remote)
+    deps.verified_tokens.clear()
+    assert asyncio.run(deps.fetch_user_from_token(hs256())) == {"id": "u1", "email": "a@b.c"}
+
+
+def test_fetch_user_falls_back_to_remote_when_undecided(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"id": "u1", "email": "a@b.c"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(deps, "get_http_client", lambda: client)
+    monkeypatch.setattr(deps, "SUPABASE_URL", URL)
+    monkeypatch.setattr(deps, "SUPABASE_ANON_KEY", "anon")
+    monkeypatch.setattr(deps, "_verifier", SupabaseJWTVerifier(URL))  # без секрета
+    deps.verified_tokens.clear()
+
+    token = hs256()
+    assert asyncio.run(deps.fetch_user_from_token(token)) == {"id": "u1", "email": "a@b.c"}
+    assert str(calls[0].url) == f"{URL}/auth/v1/user"
+    assert calls[0].headers["Authorization"] == f"Bearer {token}"
+    # повтор — из кэша проверенных токенов
+    asyncio.run(deps.fetch_user_from_token(token))
+    assert len(calls) == 1
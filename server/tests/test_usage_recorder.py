@@ -0,0 +1,181 @@
+# server/tests/test_usage_recorder.py
+import asyncio
+
+import pytest
+
+import db
+from tokenscount import recorder as rec
+from tokenscount.recorder import UsageRecorder
+
+
+class FakeConn:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def transaction(self):
+        pool = self.pool
+
+        class Tx:
+            async def __aenter__(self):
+                pool.tx_rows = []
+
+            async def __aexit__(self, exc_type, *exc):
+                # пачка и агрегаты коммитятся вместе или не коммитятся вовсе
+                if exc_type is None:
+                    pool.committed.extend(pool.tx_rows)
+
+        return Tx()
+
+    async def copy_records_to_table(self, table, *, schema_name, records, columns):
+        self.pool.calls.append("copy")
+        if self.pool.fail_copy:
+            raise RuntimeError("COPY not supported")
+        await self._write(records)
+
+    async def executemany(self, sql, records):
+        self.pool.calls.append("executemany")
+        await self._write(records)
+
+    async def _write(self, records):
+        if self.pool.fail_all:
+            raise ConnectionError("db down")
+        await asyncio.sleep(0)
+        self.pool.tx_rows.extend(r[6] for r in records)  # totaltokens
+
+
+class FakePool:
+    def __init__(self):
+        self.committed = []
+        self.calls = []
+        self.rollups = []
+        self.fail_copy = False
+        self.fail_all = False
+
+    def acquire(self):
+        pool = self
+
+        class Ctx:
+            async def __aenter__(self):
+                return FakeConn(pool)
+
+            async def __aexit__(self, *exc):
+                pass
+
+        return Ctx()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+
+    async def upsert_rollups(conn, rows):
+        pool.rollups.extend(r["totaltokens"] for r in rows)
+
+    monkeypatch.setattr(rec, "upsert_rollups", upsert_rollups)
+    monkeypatch.setattr(db, "pool", pool)
+    return pool
+
+
+def fill(recorder, tokens):
+    return [recorder.record(clientid="u1", clienttype="user", totaltokens=t) for t in tokens]
+
+
+def test_record_does_not_touch_database(monkeypatch):
+    monkeypatch.setattr(db, "pool", None)
+    r = UsageRecorder()
+    assert r.record_usage(clientid="u1", clienttype="user", provider="openai", model="m",
+                          usage={"prompt_tokens": 3, "completion_tokens": 4, "total_tokens": 7})
+    assert r.pending() == 1
+    # без пула сбрасывать некуда — строка остаётся в буфере
+    assert asyncio.run(r.flush()) is False and r.pending() == 1
+
+
+def test_drop_oldest_keeps_newest_rows(pool):
+    dropped = rec._dropped.value(reason="queue_full")
+    r = UsageRecorder(max_queue=3, batch_size=10)
+    assert fill(r, [1, 2, 3, 4, 5]) == [True] * 5
+    assert rec._dropped.value(reason="queue_full") == dropped + 2
+
+    asyncio.run(r.flush())
+    assert pool.committed == [3, 4, 5]
+
+
+def test_drop_newest_rejects_new_rows(pool):
+    r = UsageRecorder(max_queue=3, batch_size=10, policy="drop_newest")
+    assert fill(r, [1, 2, 3, 4, 5]) == [True, True, True, False, False]
+
+    asyncio.run(r.flush())
+    assert pool.committed == [1, 2, 3]
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        UsageRecorder(policy="block")
+
+
+def test_flush_writes_batches_with_rollups_in_one_transaction(pool):
+    r = UsageRecorder(batch_size=2)
+    fill(r, [1, 2, 3])
+
+    assert asyncio.run(r.flush()) is True
+    assert pool.committed == [1, 2] and pool.rollups == [1, 2] and r.pending() == 1
+    assert pool.calls == ["copy"]
+
+
+def test_copy_failure_falls_back_to_executemany(pool):
+    pool.fail_copy = True
+    r = UsageRecorder()
+    fill(r, [1, 2])
+
+    assert asyncio.run(r.flush()) is True
+    assert pool.calls == ["copy", "executemany"]
+    assert pool.committed == [1, 2]
+
+
+def test_failed_write_requeues_in_order(pool):
+    r = UsageRecorder(batch_size=2)
+    fill(r, [1, 2, 3])
+
+    pool.fail_all = True
+    assert asyncio.run(r.flush()) is False
+    assert r.pending() == 3 and pool.committed == []
+
+    pool.fail_all = False
+    asyncio.run(r.flush())
+    asyncio.run(r.flush())
+    assert pool.committed == [1, 2, 3]
+
+
+def test_background_loop_flushes_by_size_and_stop_drains(pool):
+    async def run():
+        r = UsageRecorder(batch_size=3, flush_interval=60)
+        r.start()
+        fill(r, [1, 2, 3])      # полная пачка будит цикл сразу
+        for _ in range(10):
+            await asyncio.sleep(0)
+        by_size = list(pool.committed)
+
+        fill(r, [4])            # хвост ждал бы flush_interval
+        await asyncio.sleep(0)
+        tail_waits = list(pool.committed)
+
+        await r.stop()          # shutdown дописывает всё
+        return by_size, tail_waits, r.pending()
+
+    by_size, tail_waits, pending = asyncio.run(run())
+    assert by_size == [1, 2, 3]
+    assert tail_waits == [1, 2, 3]
+    assert pool.committed == [1, 2, 3, 4] and pending == 0
+
+
+def test_background_loop_flushes_by_interval(pool):
+    async def run():
+        r = UsageRecorder(batch_size=100, flush_interval=0.02)
+        r.start()
+        fill(r, [7])
+        await asyncio.sleep(0.1)
+        done = list(pool.committed)
+        await r.stop()
+        return done
+
+    assert asyncio.run(run()) == [7]
@@ -0,0 +1,55 @@
+# server/tests/test_user_invalidation.py
+import asyncio
+import uuid
+
+import db
+from auth import sessions, smart_auth
+from core.cache import user_changed
+from database import deps
+from vision import vision_server as vs
+
+
+def test_user_changed_reaches_all_user_caches():
+    uid = str(uuid.uuid4())
+    other = str(uuid.uuid4())
+    vs.role_cache.set(("v1", uid), "participant")
+    vs.role_cache.set(("v1", other), "owner")
+    deps.user_directory.set(uid, None)  # негативная запись
+    sessions.session_cache.set("tok", {"session_id": 1, "user": {"id": uid}})
+
+    user_changed(uid)
+
+    assert vs.role_cache.get(("v1", uid), None) is None
+    assert vs.role_cache.get(("v1", other)) == "owner"
+    assert deps.user_directory.get(uid, "gone") == "gone"
+    assert sessions.session_cache.get("tok", "gone") == "gone"
+
+
+class FakePool:
+    def __init__(self, uid):
+        self.uid = uid
+        self.updated = []
+
+    async def fetchrow(self, sql, *args):
+        return {"id": self.uid}
+
+    async def execute(self, sql, *args):
+        self.updated.append(args)
+
+
+def test_reset_password_invalidates_user_caches(monkeypatch):
+    uid = str(uuid.uuid4())
+    pool = FakePool(uid)
+    monkeypatch.setattr(db, "pool", pool)
+
+    async def make_hash(password):
+        return "hash"
+
+    monkeypatch.setattr(smart_auth, "make_hash", make_hash)
+    sessions.session_cache.set("tok2", {"session_id": 2, "user": {"id": uid}})
+
+    req = smart_auth.ResetPasswordRequest(email="A@b.co")
+    result = asyncio.run(smart_auth.reset_password(req))
+
+    assert result["ok"] and pool.updated
+    assert sessions.session_cache.get("tok2", "gone") == "gone"
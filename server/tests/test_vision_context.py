@@ -0,0 +1,143 @@
+# server/tests/test_vision_context.py
+import asyncio
+
+import pytest
+
+from vision import context
+from vision.context import RollingSummaries, build_context, count_tokens
+
+
+@pytest.fixture(autouse=True)
+def estimate_tokens(monkeypatch):
+    # без словаря tiktoken: детерминированная оценка по длине
+    monkeypatch.setattr(context, "_encoding", None)
+
+
+def steps(n, size=60):
+    return [{"id": i, "user_text": f"q{i} " + "x" * size, "ai_text": f"a{i} " + "y" * size}
+            for i in range(1, n + 1)]
+
+
+def total_tokens(messages):
+    return sum(count_tokens(m["content"]) + context.MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+# ---------- build_context ----------
+
+def test_newest_steps_fill_the_budget_in_order():
+    history = steps(50)
+    budget = 400
+    messages, used = build_context("sys", history, "now?", budget)
+
+    assert 0 < used < 50
+    assert total_tokens(messages) <= budget
+    # влез хвост истории, в хронологическом порядке, новое сообщение — последним
+    kept = [m["content"] for m in messages[1:-1]]
+    expected = [t for s in history[-used:] for t in (s["user_text"], s["ai_text"])]
+    assert kept == expected
+    assert messages[0] == {"role": "system", "content": "sys"}
+    assert messages[-1] == {"role": "user", "content": "now?"}
+
+
+def test_whole_history_when_it_fits():
+    messages, used = build_context("sys", steps(3), "now?", 10_000)
+    assert used == 3 and len(messages) == 1 + 6 + 1
+
+
+def test_summarized_steps_are_not_resent():
+    history = steps(20)
+    summary = {"summary": "обсудили q1..q15", "last_step_id": 15}
+    messages, used = build_context("sys", history, "now?", 10_000, summary)
+
+    assert used == 5
+    assert messages[1]["role"] == "system" and "обсудили q1..q15" in messages[1]["content"]
+    assert messages[2]["content"] == history[15]["user_text"]
+
+
+# ---------- RollingSummaries ----------
+
+@pytest.fixture
+def store(monkeypatch):
+    """vision_steps / vision_summaries в памяти."""
+    db = {"steps": steps(40), "summaries": {}}
+
+    async def get_summary(vision_id):
+        return db["summaries"].get(vision_id)
+
+    async def list_steps_to_summarize(vision_id, after_id, keep_recent, limit):
+        pending = [s for s in db["steps"] if s["id"] > after_id]
+        return pending[:max(0, len(pending) - keep_recent)][:limit]
+
+    async def save_summary(vision_id, summary, last_step_id):
+        db["summaries"][vision_id] = {"summary": summary, "last_step_id": last_step_id}
+
+    for fn in (get_summary, list_steps_to_summarize, save_summary):
+        monkeypatch.setattr(context.repo, fn.__name__, fn)
+    return db
+
+
+def test_summary_is_updated_in_background(store):
+    calls = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def summarize(previous, batch):
+            calls.append([s["id"] for s in batch])
+            await gate.wait()
+            return f"{previous}+{batch[0]['id']}..{batch[-1]['id']}"
+
+        rs = RollingSummaries(summarize, keep_recent=10, batch=10, max_batch=100)
+        first = await rs.get("v1")
+        rs.schedule("v1")
+        rs.schedule("v1")  # уже идёт — второй раз не запускается
+        await asyncio.sleep(0)
+
+        # запрос не ждёт модель: пока резюме считается, get() отдаёт старое
+        during = await rs.get("v1")
+        gate.set()
+        await asyncio.gather(*rs._tasks)
+        return rs, first, during, await rs.get("v1")
+
+    rs, first, during, after = asyncio.run(run())
+    assert first == during == {"summary": "", "last_step_id": 0}
+    assert calls == [list(range(1, 31))]
+    assert after == {"summary": "+1..30", "last_step_id": 30}
+    assert store["summaries"]["v1"] == after
+    assert rs.stats()["running"] == 0
+
+
+def test_small_backlog_is_not_summarized(store):
+    store["steps"] = steps(15)
+    calls = []
+
+    async def summarize(previous, batch):
+        calls.append(batch)
+        return "x"
+
+    async def run():
+        rs = RollingSummaries(summarize, keep_recent=10, batch=10)
+        summary = await rs.get("v1")
+        rs.schedule_if_due("v1", store["steps"], summary)  # 15 < keep_recent + batch
+        assert not rs._tasks
+        rs.schedule("v1")
+        await asyncio.gather(*rs._tasks)
+
+    asyncio.run(run())
+    assert calls == [] and store["summaries"] == {}
+
+
+def test_failed_update_is_logged_and_retryable(store, caplog):
+    async def summarize(previous, batch):
+        raise RuntimeError("model down")
+
+    async def run():
+        rs = RollingSummaries(summarize, keep_recent=10, batch=10)
+        rs.schedule("v1")
+        await asyncio.gather(*rs._tasks)
+        return rs
+
+    rs = asyncio.run(run())
+    assert "summary update failed" in caplog.text
+    assert rs.stats()["running"] == 0
+    assert store["summaries"] == {}
@@ -0,0 +1,138 @@
+# server/tests/test_vision_repository.py
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import db
+from vision import repository as repo
+from vision import vision_server as vs
+
+DELAY = 0.05
+
+
+class FakeConn:
+    """Соединение asyncpg: каждый запрос «идёт по сети» DELAY секунд."""
+
+    def __init__(self, log, answers):
+        self.log = log
+        self.answers = answers
+        self.in_tx = False
+
+    def transaction(self):
+        conn = self
+
+        class Tx:
+            async def __aenter__(self):
+                conn.in_tx = True
+                conn.log.append(("BEGIN",))
+
+            async def __aexit__(self, *exc):
+                conn.in_tx = False
+                conn.log.append(("COMMIT",))
+
+        return Tx()
+
+    async def _q(self, sql, *args):
+        sql = " ".join(sql.split())
+        self.log.append((sql, args, self.in_tx))
+        await asyncio.sleep(DELAY)
+        for needle, value in self.answers.items():
+            if needle in sql:
+                return value(*args) if callable(value) else value
+        return None
+
+    fetch = fetchrow = fetchval = execute = _q
+
+
+class FakePool(FakeConn):
+    def __init__(self, answers=None):
+        super().__init__([], answers or {})
+        self.acquired = 0
+
+    def acquire(self):
+        pool = self
+
+        class Ctx:
+            async def __aenter__(self):
+                pool.acquired += 1
+                return FakeConn(pool.log, pool.answers)
+
+            async def __aexit__(self, *exc):
+                pass
+
+        return Ctx()
+
+
+@pytest.fixture(autouse=True)
+def clean_roles():
+    vs.role_cache.clear()
+    yield
+    vs.role_cache.clear()
+
+
+def test_handlers_do_not_block_event_loop(monkeypatch):
+    pool = FakePool({"FROM visions v": lambda uid: [{"id": f"v-{uid}"}]})
+    monkeypatch.setattr(db, "pool", pool)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(DELAY / 10)
+
+        t = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        results = await asyncio.gather(*(vs.list_visions(f"u{i}") for i in range(10)))
+        elapsed = time.perf_counter() - started
+        t.cancel()
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(run())
+    assert results == [[{"id": f"v-u{i}"}] for i in range(10)]
+    # 10 запросов по DELAY идут одновременно, loop всё это время свободен
+    assert elapsed < 5 * DELAY
+    assert ticks >= 5
+
+
+def test_get_participants_reads_through_pool(monkeypatch):
+    pool = FakePool({
+        "SELECT role FROM vision_participants": "owner",
+        "FROM vision_participants WHERE vision_id": [
+            {"vision_id": "v1", "user_id": "u1", "role": "owner", "added_at": None},
+            {"vision_id": "v1", "user_id": "u2", "role": "participant", "added_at": None},
+        ],
+        "FROM smart_users": [{"id": "u1", "email": "a@x", "name": "A"}, {"id": "u2", "email": "b@x", "name": "B"}],
+    })
+    monkeypatch.setattr(db, "pool", pool)
+
+    out = asyncio.run(vs.get_participants("v1", "u1"))
+
+    assert [(p["user_id"], p["role"], p["name"]) for p in out] == [("u1", "owner", "A"), ("u2", "participant", "B")]
+    # параметры передаются отдельно от SQL
+    assert pool.log[0][1] == ("v1", "u1")
+    assert pool.log[-1][1] == (["u1", "u2"],)
+
+
+def test_delete_vision_is_one_transaction(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(db, "pool", pool)
+
+    asyncio.run(repo.delete_vision("v1"))
+
+    assert pool.acquired == 1
+    assert pool.log[0] == ("BEGIN",) and pool.log[-1] == ("COMMIT",)
+    deletes = pool.log[1:-1]
+    assert [d[0].split()[2] for d in deletes] == ["vision_steps", "vision_participants", "visions"]
+    assert all(d[1] == ("v1",) and d[2] for d in deletes)
+
+
+def test_repository_without_pool_is_500(monkeypatch):
+    monkeypatch.setattr(db, "pool", None)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(repo.get_vision("v1"))
+    assert e.value.status_code == 500
@@ -0,0 +1,122 @@
+# server/tests/test_vision_roles.py
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from vision import vision_server as vs
+
+ROLES = ["owner", "participant", "ai"]
+
+
+@pytest.fixture
+def roles(monkeypatch):
+    """Таблица vision_participants в памяти; calls — обращения к «БД» за ролью."""
+    table = {("v1", "owner1"): "owner", ("v1", "p1"): "participant"}
+    calls = []
+
+    async def get_participant_role(vision_id, user_id):
+        calls.append((vision_id, user_id))
+        return table.get((vision_id, user_id))
+
+    async def delete_participant(vision_id, user_id):
+        table.pop((vision_id, user_id), None)
+
+    async def add_participants(vision_id, participants):
+        for user_id, role in participants:
+            table[(vision_id, user_id)] = role
+
+    async def get_user_email(user_id):
+        return f"{user_id}@x"
+
+    async def find_user_by_email(email):
+        return {"id": email.split("@")[0], "email": email}
+
+    async def delete_vision(vision_id):
+        for key in [k for k in table if k[0] == vision_id]:
+            del table[key]
+
+    for fn in (get_participant_role, delete_participant, add_participants,
+               get_user_email, find_user_by_email, delete_vision):
+        monkeypatch.setattr(vs.repo, fn.__name__, fn)
+
+    vs.role_cache.clear()
+    yield table, calls
+    vs.role_cache.clear()
+
+
+def access(vision_id, user_id):
+    asyncio.run(vs.ensure_access(vision_id, user_id, ROLES))
+
+
+def status(vision_id, user_id):
+    with pytest.raises(HTTPException) as e:
+        access(vision_id, user_id)
+    return e.value.status_code
+
+
+def test_repeated_checks_hit_cache_and_count(roles):
+    _table, calls = roles
+    hits, misses = vs.role_cache.hits, vs.role_cache.misses
+
+    for _ in range(5):
+        access("v1", "p1")
+
+    assert calls == [("v1", "p1")]
+    assert vs.role_cache.misses == misses + 1
+    assert vs.role_cache.hits == hits + 4
+    stats = vs.role_cache.stats()
+    assert stats["name"] == "vision_roles" and stats["size"] == 1
+
+
+def test_non_participant_is_cached_too(roles):
+    _table, calls = roles
+    assert status("v1", "stranger") == 404
+    assert status("v1", "stranger") == 404
+    assert calls == [("v1", "stranger")]
+
+
+def test_remove_participant_revokes_immediately(roles):
+    _table, calls = roles
+    access("v1", "p1")
+
+    asyncio.run(vs.remove_participant(vs.RemoveParticipantRequest(
+        vision_id="v1", user_id="owner1", participant_id="p1")))
+
+    assert status("v1", "p1") == 404
+
+
+def test_add_participant_clears_negative_entry(roles):
+    assert status("v1", "newbie") == 404
+
+    asyncio.run(vs.add_participant(vs.AddParticipantRequest(
+        vision_id="v1", user_id="owner1", email="newbie@x")))
+
+    access("v1", "newbie")
+
+
+def test_delete_vision_drops_all_roles_of_vision(roles):
+    table, _calls = roles
+    table[("v2", "p1")] = "owner"
+    access("v1", "p1")
+    access("v2", "p1")
+
+    asyncio.run(vs.delete_vision(vs.DeleteRequest(vision_id="v1", user_id="owner1")))
+
+    assert vs.role_cache.get(("v1", "p1"), None) is None
+    assert vs.role_cache.get(("v1", "owner1"), None) is None
+    assert vs.role_cache.get(("v2", "p1")) == "owner"
+
+
+def test_entries_expire_after_ttl(roles, monkeypatch):
+    table, calls = roles
+    monkeypatch.setattr(vs.role_cache, "ttl", 0.05)
+    access("v1", "p1")
+
+    # роль поменяли в обход API — кэш отдаёт старую не дольше ttl
+    table[("v1", "p1")] = "viewer"
+    access("v1", "p1")
+    time.sleep(0.06)
+    assert status("v1", "p1") == 403
+    assert len(calls) == 2
@@ -0,0 +1,52 @@
+# server/tests/test_vision_steps_paging.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from vision import vision_server as vs
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def step(i: int, sec: float) -> dict:
+    return {"id": i, "created_at": T0 + timedelta(seconds=sec), "user_text": f"s{i}"}
+
+
+def test_since_rereads_overlap_without_moving_cursor(monkeypatch):
+    calls = []
+
+    async def list_steps_page(vision_id, limit, before=None, since=None, overlap=0.0):
+        calls.append((since, overlap))
+        # шаг 4 закоммичен позже шага 5, но created_at у него раньше курсора
+        return [step(4, 2), step(5, 3), step(6, 5), step(7, 6)]
+
+    monkeypatch.setattr(vs.repo, "list_steps_page", list_steps_page)
+    cursor = vs.encode_cursor(step(5, 3))
+    page = asyncio.run(vs.load_steps_with_names("v1", 1, since=cursor))
+
+    assert calls[0][1] == vs.VISION_SINCE_OVERLAP > 0
+    assert [s["id"] for s in page["steps"]] == [4, 5, 6]
+    assert page["has_more"] is True
+    assert vs.decode_cursor(page["cursors"]["since"]) == (step(6, 5)["created_at"], 6)
+
+
+def test_since_with_only_overlap_keeps_cursor(monkeypatch):
+    async def list_steps_page(vision_id, limit, before=None, since=None, overlap=0.0):
+        return [step(5, 3)]
+
+    monkeypatch.setattr(vs.repo, "list_steps_page", list_steps_page)
+    cursor = vs.encode_cursor(step(5, 3))
+    page = asyncio.run(vs.load_steps_with_names("v1", 10, since=cursor))
+    assert page["cursors"]["since"] == cursor and page["has_more"] is False
+
+
+def test_get_vision_is_paged_by_default(monkeypatch):
+    limits = []
+
+    async def get_vision_full(vision_id, user_id, limit):
+        limits.append(limit)
+        return {"role": "owner", "vision": {"id": vision_id}, "participants": [], "steps": []}
+
+    monkeypatch.setattr(vs.repo, "get_vision_full", get_vision_full)
+    asyncio.run(vs.get_vision("v1", "u1", steps_limit=vs.STEPS_PAGE_DEFAULT))
+    asyncio.run(vs.get_vision("v1", "u1", steps_limit=vs.STEPS_PAGE_DEFAULT, full_history=True))
+    assert limits == [vs.STEPS_PAGE_DEFAULT + 1, None]
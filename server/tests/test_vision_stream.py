@@ -0,0 +1,118 @@
+# server/tests/test_vision_stream.py
+import asyncio
+
+import pytest
+
+from llm.gateway import LLMGateway
+from llm.providers import FakeProvider
+from vision import vision_server as vs
+
+REPLY = "Первый кусок ответа. Второй кусок ответа. Третий кусок."
+
+
+def setup(monkeypatch, fail_save: bool = False):
+    saved, usage = [], []
+
+    async def ensure_access(*args):
+        return None
+
+    async def load_ai_history(vision_id):
+        return []
+
+    async def get_summary(vision_id):
+        return {"summary": "", "last_step_id": 0}
+
+    async def insert_step(vision_id, user_id, user_text):
+        return {"id": 7, "vision_id": vision_id, "user_id": user_id, "user_text": user_text, "ai_text": None}
+
+    async def update_step_ai_text(step_id, ai_text):
+        if fail_save:
+            raise RuntimeError("db down")
+        saved.append((step_id, ai_text))
+
+    gateway = LLMGateway(FakeProvider(reply=REPLY, chunk_size=8), max_retries=0)
+    monkeypatch.setattr(vs, "get_gateway", lambda: gateway)
+    monkeypatch.setattr(vs, "check_quota", lambda user_id: None)
+    monkeypatch.setattr(vs, "ensure_access", ensure_access)
+    monkeypatch.setattr(vs, "load_ai_history", load_ai_history)
+    monkeypatch.setattr(vs.summaries, "get", get_summary)
+    monkeypatch.setattr(vs.repo, "insert_step", insert_step)
+    monkeypatch.setattr(vs.repo, "update_step_ai_text", update_step_ai_text)
+    monkeypatch.setattr(vs, "record_usage", lambda gw, model, u, user_id, **meta: usage.append((u, meta)))
+    vs.history_windows.put("v1", [])
+    return saved, usage
+
+
+def request() -> "vs.StepRequest":
+    return vs.StepRequest(vision_id="v1", user_id="u1", user_text="Привет", with_ai=True)
+
+
+def test_disconnect_saves_partial_answer(monkeypatch):
+    saved, usage = setup(monkeypatch)
+
+    async def run():
+        resp = await vs.add_step_stream(request())
+        body = resp.body_iterator
+        events = [await body.__anext__() for _ in range(3)]  # step + 2 куска
+        await body.aclose()  # клиент ушёл
+        await asyncio.gather(*vs._saving)
+        return events
+
+    events = asyncio.run(run())
+    assert events[0].startswith("event: step")
+    assert saved == [(7, REPLY[:16].strip())]
+    assert vs.history_windows.get("v1")[-1]["ai_text"] == REPLY[:16].strip()
+    # итог usage не пришёл — учтена оценка
+    assert len(usage) == 1 and usage[0][1]["partial"] is True
+    assert usage[0][0]["completion_tokens"] > 0
+
+
+def test_complete_stream_records_reported_usage(monkeypatch):
+    saved, usage = setup(monkeypatch)
+
+    async def run():
+        resp = await vs.add_step_stream(request())
+        return [e async for e in resp.body_iterator]
+
+    events = asyncio.run(run())
+    assert events[-1].startswith("event: done")
+    assert saved == [(7, REPLY)]
+    assert len(usage) == 1 and "partial" not in usage[0][1]
+
+
+def test_save_failure_keeps_history_and_reports_error(monkeypatch):
+    saved, usage = setup(monkeypatch, fail_save=True)
+
+    async def run():
+        resp = await vs.add_step_stream(request())
+        return [e async for e in resp.body_iterator]
+
+    events = asyncio.run(run())
+    assert events[-1].startswith("event: error")
+    assert vs.history_windows.get("v1")[-1]["id"] == 7
+    assert len(usage) == 1
+
+
+def test_add_step_keeps_step_in_window_when_save_fails(monkeypatch):
+    setup(monkeypatch, fail_save=True)
+
+    async def build_ai_answer(*args, **kwargs):
+        return "ответ"
+
+    monkeypatch.setattr(vs, "build_ai_answer", build_ai_answer)
+    with pytest.raises(RuntimeError):
+        asyncio.run(vs.add_step(request()))
+    window = vs.history_windows.get("v1")
+    assert window[-1]["id"] == 7 and window[-1]["ai_text"] is None
+
+
+def test_add_step_sets_ai_text_in_window(monkeypatch):
+    saved, _ = setup(monkeypatch)
+
+    async def build_ai_answer(*args, **kwargs):
+        return "ответ"
+
+    monkeypatch.setattr(vs, "build_ai_answer", build_ai_answer)
+    asyncio.run(vs.add_step(request()))
+    assert saved == [(7, "ответ")]
+    assert vs.history_windows.get("v1")[-1] == {"id": 7, "user_text": "Привет", "ai_text": "ответ"}
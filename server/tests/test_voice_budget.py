@@ -0,0 +1,101 @@
+# server/tests/test_voice_budget.py
+import asyncio
+
+import numpy as np
+import pytest
+
+from voicerecorder import ws_voicerecorder as wsv
+from voicerecorder.budget import AudioBudget, BudgetExceeded, SpillFile, SpillRef, budget
+from voicerecorder.encoder import PcmFormat
+from voicerecorder.protocol import FRAME_HEADER, PROTOCOL_V2
+
+FMT = PcmFormat(48000, 1)
+SAMPLES = 4800
+
+
+def frame(seq: int) -> bytes:
+    return FRAME_HEADER.pack(seq, SAMPLES) + np.full(SAMPLES, seq, dtype="<i2").tobytes()
+
+
+class FakeWS:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(text)
+
+
+# ---------- допуск ----------
+
+def test_admit_refuses_over_session_and_memory_limits():
+    b = AudioBudget(soft_bytes=100, hard_bytes=200, max_sessions=2)
+    b.admit()
+    b.admit()
+    with pytest.raises(BudgetExceeded):
+        b.admit()
+    b.leave()
+
+    b.charge(200)
+    with pytest.raises(BudgetExceeded):
+        b.admit()
+    assert b.sessions == 1
+    b.release(200)
+    b.admit()
+    assert b.stats()["refused"] == {"sessions": 1, "memory": 1}
+    assert b.peak == 200
+
+
+# ---------- SpillFile ----------
+
+def test_spill_reads_back_identical_and_is_deleted(tmp_path):
+    spill = SpillFile(tmp_path / "r.spill")
+    chunks = [bytes([i]) * (1000 + i) for i in range(5)]
+    refs = [spill.write(c) for c in chunks]
+    assert all(isinstance(r, SpillRef) for r in refs)
+    assert spill.path.exists() and spill.size == sum(map(len, chunks))
+
+    assert [spill.read(r) for r in refs] == chunks
+    # очередь разобрана — файл обнулён и переиспользуется
+    assert spill.size == 0
+    ref = spill.write(b"again")
+    assert spill.read(ref) == b"again"
+
+    spill.close()
+    assert not spill.path.exists()
+    spill.close()  # повторный close не падает
+
+
+# ---------- сессия под давлением ----------
+
+def test_session_spills_under_pressure_and_releases_everything(monkeypatch):
+    frame_bytes = len(frame(0))
+    monkeypatch.setattr(budget, "soft_bytes", 1)  # давление с первого кадра
+
+    async def run():
+        session = wsv.RecordingSession(FakeWS(), "u1", "spill1", PROTOCOL_V2, FMT)
+        peak = []
+        real_put = session.queue.put
+
+        async def put(item):
+            peak.append(budget.used)
+            await real_put(item)
+
+        monkeypatch.setattr(session.queue, "put", put)
+        start = budget.used  # буфер v2 сессии
+        try:
+            for seq in range(6):
+                await session.add_segment(frame(seq))
+            assert session.spill is not None and session.spill.path.exists()
+            spill_path = session.spill.path
+            await session.queue.drain()
+            # кадры шли на диск, в памяти не копились
+            assert max(peak) <= start + frame_bytes
+            pcm = b"".join(session.journal.read_chunks())
+            assert pcm == b"".join(frame(s)[FRAME_HEADER.size:] for s in range(6))
+        finally:
+            await session.close()
+        return spill_path
+
+    spill_path = asyncio.run(run())
+    assert not spill_path.exists()
+    assert budget.used == 0 and budget.sessions == 0
@@ -0,0 +1,127 @@
+# server/tests/test_voice_encoder.py
+import asyncio
+import io
+import os
+import stat
+import struct
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+from voicerecorder import encoder as enc
+from voicerecorder.encoder import EncoderError, Mp3StreamEncoder, PcmFormat, decode_wav
+
+FMT = PcmFormat(16000, 1)
+
+
+def fake_ffmpeg(path, body: str) -> str:
+    path.write_text(f"#!{sys.executable}\nimport sys\n{body}")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def wav_bytes(samples, rate=16000, channels=1, width=2) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(width)
+        wf.setframerate(rate)
+        wf.writeframes(samples)
+    return buf.getvalue()
+
+
+def float_wav() -> bytes:
+    """WAV с форматом 3 (IEEE float) — не PCM."""
+    data = np.zeros(16, dtype="<f4").tobytes()
+    fmt = struct.pack("<HHIIHH", 3, 1, 16000, 16000 * 4, 4, 32)
+    return (b"RIFF" + struct.pack("<I", 4 + 8 + len(fmt) + 8 + len(data)) + b"WAVE"
+            + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+            + b"data" + struct.pack("<I", len(data)) + data)
+
+
+# ---------- decode_wav ----------
+
+def test_decode_wav_returns_format_and_pcm():
+    pcm = np.arange(100, dtype="<i2").tobytes()
+    fmt, got = decode_wav(wav_bytes(pcm, rate=48000, channels=2))
+    assert fmt == PcmFormat(48000, 2, 2)
+    assert got == pcm
+
+
+@pytest.mark.parametrize("raw", [float_wav(), b"RIFF\x00\x00\x00\x00WAVEjunk", b"not a wav"],
+                         ids=["float", "truncated", "garbage"])
+def test_decode_wav_rejects_non_pcm(raw):
+    with pytest.raises((wave.Error, EOFError)):
+        decode_wav(raw)
+
+
+def test_decode_wav_rejects_unsupported_width():
+    with pytest.raises(ValueError, match="sample width"):
+        decode_wav(wav_bytes(b"\x00" * 30, width=3))
+
+
+# ---------- Mp3StreamEncoder ----------
+
+def test_streamed_pcm_reaches_ffmpeg_in_full_and_in_order(tmp_path):
+    chunks = [np.full(1600 + i, i, dtype="<i2").tobytes() for i in range(20)]
+
+    async def run():
+        e = Mp3StreamEncoder(FMT, out_dir=tmp_path)
+        await e.start()
+        for c in chunks:
+            await e.write(c)
+        path = await e.finish()
+        data = path.read_bytes()
+        e.cleanup()
+        return e, path, data
+
+    e, path, data = asyncio.run(run())
+    # «ffmpeg» тестов (conftest) копирует stdin в выходной файл
+    assert data == b"".join(chunks)
+    assert e.frames == sum(len(c) for c in chunks) // 2
+    assert e.duration_seconds == pytest.approx(e.frames / 16000)
+    assert not path.exists()
+
+
+def test_partial_frame_is_rejected(tmp_path):
+    async def run():
+        e = Mp3StreamEncoder(PcmFormat(16000, 2), out_dir=tmp_path)
+        await e.start()
+        try:
+            with pytest.raises(ValueError):
+                await e.write(b"\x00" * 6)  # полтора кадра стерео
+        finally:
+            await e.abort()
+
+    asyncio.run(run())
+
+
+def test_ffmpeg_failure_raises_and_cleans_up(tmp_path, monkeypatch):
+    # пишет кусок файла и падает
+    monkeypatch.setattr(enc, "FFMPEG_BIN", fake_ffmpeg(
+        tmp_path / "ffmpeg-bad",
+        "open(sys.argv[-1], 'wb').write(b'partial')\n"
+        "sys.stderr.write('boom')\n"
+        "sys.exit(1)\n",
+    ))
+
+    async def run():
+        e = Mp3StreamEncoder(FMT, out_dir=tmp_path)
+        await e.start()
+        with pytest.raises(EncoderError, match="boom"):
+            for _ in range(200):  # до разрыва pipe
+                await e.write(b"\x00" * 65536)
+            await e.finish()
+        assert e.out_path.exists()
+        await e.abort()
+        return e.out_path
+
+    assert not asyncio.run(run()).exists()
+
+
+def test_missing_ffmpeg_is_encoder_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(enc, "FFMPEG_BIN", str(tmp_path / "no-such-ffmpeg"))
+    with pytest.raises(EncoderError, match="not available"):
+        asyncio.run(Mp3StreamEncoder(FMT, out_dir=tmp_path).start())
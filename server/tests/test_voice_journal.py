@@ -0,0 +1,230 @@
+# server/tests/test_voice_journal.py
+import asyncio
+import json
+import uuid
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from voicerecorder import ws_voicerecorder as wsv
+from voicerecorder.budget import budget
+from voicerecorder.encoder import PcmFormat
+from voicerecorder.journal import INDEX_RECORD, SegmentJournal
+from voicerecorder.protocol import FRAME_HEADER, PROTOCOL_V2
+
+FMT = PcmFormat(48000, 1)
+SAMPLES = 4800
+
+
+def pcm(seq: int) -> bytes:
+    return np.full(SAMPLES, seq, dtype="<i2").tobytes()
+
+
+def frame(seq: int) -> bytes:
+    return FRAME_HEADER.pack(seq, SAMPLES) + pcm(seq)
+
+
+def start(user_id: str, rec_id: str) -> str:
+    return "START " + json.dumps({
+        "user_id": user_id, "rec_id": rec_id, "protocol": 2, "sample_rate": 48000, "channels": 1,
+    })
+
+
+def resume(user_id: str, rec_id: str) -> str:
+    return "RESUME " + json.dumps({"user_id": user_id, "rec_id": rec_id})
+
+
+def new_rec_id() -> str:
+    return uuid.uuid4().hex
+
+
+# ---------- журнал ----------
+
+def test_open_truncates_torn_tail():
+    rec_id = new_rec_id()
+    journal = SegmentJournal.create(rec_id, "u1", PROTOCOL_V2, FMT)
+    for seq in range(3):
+        journal.append(seq, pcm(seq))
+    journal.close()
+
+    # «падение» посреди следующего кадра
+    with open(journal.dir / "audio.pcm", "ab") as f:
+        f.write(b"x" * 1001)
+    with open(journal.dir / "frames.idx", "ab") as f:
+        f.write(b"y" * (INDEX_RECORD.size - 1))
+
+    reopened = SegmentJournal.open(rec_id)
+    try:
+        assert reopened.last_seq == 2
+        assert reopened.user_id == "u1"
+        assert reopened.fmt == FMT
+        assert b"".join(reopened.read_chunks(4096)) == b"".join(pcm(s) for s in range(3))
+        reopened.append(3, pcm(3))
+        assert reopened.last_seq == 3
+    finally:
+        reopened.remove()
+
+
+def test_create_never_replaces_existing_journal():
+    rec_id = new_rec_id()
+    journal = SegmentJournal.create(rec_id, "u1", PROTOCOL_V2, FMT)
+    journal.append(0, pcm(0))
+    try:
+        with pytest.raises(FileExistsError):
+            SegmentJournal.create(rec_id, "u2", PROTOCOL_V2, FMT)
+        assert SegmentJournal.exists(rec_id)
+        assert journal.nbytes == len(pcm(0))
+    finally:
+        journal.remove()
+
+
+# ---------- сокет: RESUME / START ----------
+
+@pytest.fixture
+def client(monkeypatch):
+    uploads = []
+
+    def upload(self, mp3_path, duration):
+        if upload.fail:
+            upload.fail -= 1
+            raise RuntimeError("storage down")
+        uploads.append((self.rec_id, mp3_path.read_bytes()))
+        return f"https://x/{self.rec_id}.mp3"
+
+    upload.fail = 0
+    monkeypatch.setattr(wsv.RecordingSession, "_upload", upload)
+    app = FastAPI()
+    app.include_router(wsv.router)
+    with TestClient(app) as c:
+        c.uploads = uploads
+        c.upload = upload
+        yield c
+    assert not wsv._sessions
+    assert budget.sessions == 0
+
+
+def recv(ws) -> str:
+    """Следующее сообщение, кроме ACK кадров."""
+    while True:
+        text = ws.receive_text()
+        if not (text.startswith("ACK ") and text[4:].isdigit()):
+            return text
+
+
+def send_frames(ws, seqs) -> None:
+    for seq in seqs:
+        ws.send_bytes(frame(seq))
+    for seq in seqs:
+        assert ws.receive_text() == f"ACK {seq}"
+
+
+def test_resume_from_memory_and_from_journal(client):
+    rec_id = new_rec_id()
+    with client.websocket_connect("/ws/voicerecorder") as ws:
+        ws.receive_text()
+        ws.send_text(start("u1", rec_id))
+        assert ws.receive_text() == "ACK START v2"
+        send_frames(ws, range(3))
+
+    # сокет оборвался — сессия припаркована
+    with client.websocket_connect("/ws/voicerecorder") as ws:
+        ws.receive_text()
+        ws.send_text(resume("u2", rec_id))
+        assert ws.receive_text() == "ERR unknown rec_id"
+        ws.send_text(resume("u1", rec_id))
+        assert json.loads(ws.receive_text()[len("ACK RESUME "):])["last_seq"] == 2
+        send_frames(ws, [3])
+
+    # сессия в памяти потеряна (перезапуск) — остался только журнал
+    session = wsv._sessions[rec_id]
+    client.portal.call(session.close, True)
+    with client.websocket_connect("/ws/voicerecorder") as ws:
+        ws.receive_text()
+        ws.send_text(resume("u1", rec_id))
+        assert json.loads(ws.receive_text()[len("ACK RESUME "):])["last_seq"] == 3
+        send_frames(ws, [4])
+        ws.send_text('END {"last_seq": 4}')
+        assert json.loads(recv(ws))["status"] == "SAVED"
+
+    assert client.uploads[-1] == (rec_id, b"".join(pcm(s) for s in range(5)))
+    assert not SegmentJournal.exists(rec_id)
+
+
+def test_start_cannot_take_over_foreign_recording(client):
+    rec_id = new_rec_id()
+    with client.websocket_connect("/ws/voicerecorder") as owner:
+        owner.receive_text()
+        owner.send_text(start("u1", rec_id))
+        owner.receive_text()
+        send_frames(owner, range(2))
+
+        with client.websocket_connect("/ws/voicerecorder") as intruder:
+            intruder.receive_text()
+            intruder.send_text(start("u2", rec_id))
+            assert intruder.receive_text() == "ERR rec_id in use"
+
+        # запись владельца цела
+        send_frames(owner, [2])
+        owner.send_text('END {"last_seq": 2}')
+        assert json.loads(recv(owner))["status"] == "SAVED"
+    assert client.uploads[-1] == (rec_id, b"".join(pcm(s) for s in range(3)))
+
+
+def test_start_refused_while_only_journal_is_left(client):
+    rec_id = new_rec_id()
+    journal = SegmentJournal.create(rec_id, "u1", PROTOCOL_V2, FMT)
+    journal.append(0, pcm(0))
+    journal.close()
+    with client.websocket_connect("/ws/voicerecorder") as ws:
+        ws.receive_text()
+        ws.send_text(start("u2", rec_id))
+        assert ws.receive_text() == "ERR rec_id in use"
+    reopened = SegmentJournal.open(rec_id)
+    assert reopened.last_seq == 0
+    reopened.remove()
+
+
+def test_failed_end_resumes_from_journal(client):
+    rec_id = new_rec_id()
+    client.upload.fail = 1
+    with client.websocket_connect("/ws/voicerecorder") as ws:
+        ws.receive_text()
+        ws.send_text(start("u1", rec_id))
+        ws.receive_text()
+        send_frames(ws, range(3))
+        ws.send_text('END {"last_seq": 2}')
+        assert recv(ws).startswith("ERR processing: storage down")
+
+    # кодировщик прежней сессии закрыт END — в памяти её нет, RESUME из журнала
+    assert rec_id not in wsv._sessions
+    with client.websocket_connect("/ws/voicerecorder") as ws:
+        ws.receive_text()
+        ws.send_text(resume("u1", rec_id))
+        assert json.loads(ws.receive_text()[len("ACK RESUME "):])["last_seq"] == 2
+        ws.send_text('END {"last_seq": 2}')
+        assert json.loads(recv(ws))["status"] == "SAVED"
+    assert client.uploads[-1] == (rec_id, b"".join(pcm(s) for s in range(3)))
+
+
+def test_parked_session_expires_to_journal(client, monkeypatch):
+    monkeypatch.setattr(wsv, "VOICE_RESUME_GRACE", 0.05)
+    rec_id = new_rec_id()
+    with client.websocket_connect("/ws/voicerecorder") as ws:
+        ws.receive_text()
+        ws.send_text(start("u1", rec_id))
+        ws.receive_text()
+        send_frames(ws, range(2))
+
+    client.portal.call(asyncio.sleep, 0.3)
+    assert rec_id not in wsv._sessions
+    assert not wsv._expiring
+    assert SegmentJournal.exists(rec_id)
+
+    with client.websocket_connect("/ws/voicerecorder") as ws:
+        ws.receive_text()
+        ws.send_text(resume("u1", rec_id))
+        assert json.loads(ws.receive_text()[len("ACK RESUME "):])["last_seq"] == 1
+        ws.send_text('END {"last_seq": 1}')
+        assert json.loads(recv(ws))["status"] == "SAVED"
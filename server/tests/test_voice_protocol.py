@@ -0,0 +1,58 @@
+# server/tests/test_voice_protocol.py
+import numpy as np
+import pytest
+
+from voicerecorder.protocol import FRAME_HEADER, FrameError, PcmBuffer, parse_frame
+
+
+def frame(seq: int, samples, pad: bytes = b"") -> bytes:
+    pcm = np.asarray(samples, dtype="<i2").tobytes()
+    return FRAME_HEADER.pack(seq, len(samples)) + pcm + pad
+
+
+@pytest.mark.parametrize("seq", [0, 1, 2**32 - 1])
+def test_seq_and_samples_round_trip(seq):
+    got_seq, view = parse_frame(frame(seq, [1, -2, 32767, -32768]))
+    assert got_seq == seq
+    assert np.frombuffer(view, dtype="<i2").tolist() == [1, -2, 32767, -32768]
+
+
+def test_padding_after_valid_samples_is_dropped():
+    _, view = parse_frame(frame(0, [5, 6], pad=b"\x00" * 6))
+    assert bytes(view) == np.array([5, 6], dtype="<i2").tobytes()
+
+
+@pytest.mark.parametrize("raw", [b"", b"\x01\x00\x00", FRAME_HEADER.pack(0, 0)[:7]])
+def test_truncated_header_is_rejected(raw):
+    with pytest.raises(FrameError, match="shorter than header"):
+        parse_frame(raw)
+
+
+def test_odd_byte_length_is_rejected():
+    # 2 сэмпла заявлено, а байт звука 3 — половина сэмпла
+    raw = FRAME_HEADER.pack(0, 2) + b"\x01\x00\x02"
+    with pytest.raises(FrameError, match="exceeds payload"):
+        parse_frame(raw)
+    # нечётный хвост за valid_samples — паддинг, звук не рвёт
+    _, view = parse_frame(FRAME_HEADER.pack(0, 1) + b"\x01\x00\x02")
+    assert bytes(view) == b"\x01\x00"
+
+
+def test_channel_mismatch_is_rejected():
+    with pytest.raises(FrameError, match="multiple of channels"):
+        parse_frame(frame(0, [1, 2, 3]), channels=2)
+    assert len(parse_frame(frame(0, [1, 2, 3, 4]), channels=2)[1]) == 8
+
+
+def test_pcm_buffer_keeps_order_across_growth_and_clear():
+    buf = PcmBuffer(capacity=4)
+    for seq in range(5):
+        buf.append(parse_frame(frame(seq, [seq] * 3))[1])
+    assert len(buf) == 15 and buf.capacity_bytes >= buf.nbytes
+    assert np.frombuffer(buf.view(), dtype="<i2").tolist() == [s for s in range(5) for _ in range(3)]
+
+    capacity = buf.capacity_bytes
+    buf.clear()
+    buf.append(parse_frame(frame(5, [7, 8]))[1])
+    assert bytes(buf.view()) == np.array([7, 8], dtype="<i2").tobytes()
+    assert buf.capacity_bytes == capacity  # память переиспользуется
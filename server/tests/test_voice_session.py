@@ -0,0 +1,213 @@
+# server/tests/test_voice_session.py
+import asyncio
+
+import numpy as np
+import pytest
+
+from voicerecorder import ws_voicerecorder as wsv
+from voicerecorder.budget import budget
+from voicerecorder.encoder import EncoderError, Mp3StreamEncoder, PcmFormat
+from voicerecorder.protocol import FRAME_HEADER, PROTOCOL_V2
+from voicerecorder.workers import AudioBusy, SessionQueue
+
+FMT = PcmFormat(48000, 1)
+SAMPLES = 4800
+
+
+def frame(seq: int) -> bytes:
+    pcm = np.full(SAMPLES, seq, dtype="<i2").tobytes()
+    return FRAME_HEADER.pack(seq, SAMPLES) + pcm
+
+
+class FakeWS:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(text)
+
+
+def make_session(monkeypatch, rec_id: str):
+    ws = FakeWS()
+    session = wsv.RecordingSession(ws, "u1", rec_id, PROTOCOL_V2, FMT)
+    uploads = []
+
+    def upload(mp3_path, duration):
+        uploads.append((mp3_path.read_bytes(), duration))
+        return f"https://x/{rec_id}.mp3"
+
+    monkeypatch.setattr(session, "_upload", upload)
+    return session, ws, uploads
+
+
+# ---------- SessionQueue ----------
+
+def test_queue_error_does_not_poison_later_items():
+    async def run():
+        done, errors = [], []
+
+        async def handler(item):
+            if item == 1:
+                raise AudioBusy("busy")
+            done.append(item)
+
+        async def on_error(item, error):
+            errors.append((item, str(error)))
+
+        queue = SessionQueue(handler, maxsize=2, on_error=on_error)
+        for i in range(4):
+            await queue.put(i)
+        await queue.drain()  # не бросает
+        await queue.close()
+        return done, errors, queue.errors
+
+    done, errors, count = asyncio.run(run())
+    assert done == [0, 2, 3]
+    assert errors == [(1, "busy")]
+    assert count == 1
+
+
+def test_queue_close_discards_pending():
+    async def run():
+        gate = asyncio.Event()
+        seen = []
+
+        async def handler(item):
+            await gate.wait()
+            seen.append(item)
+
+        queue = SessionQueue(handler, maxsize=8)
+        for i in range(3):
+            await queue.put(i)
+        await asyncio.sleep(0)
+        await queue.close()
+        gate.set()
+        return seen, len(queue)
+
+    assert asyncio.run(run()) == ([], 0)
+
+
+# ---------- сессия: отказ одного кадра ----------
+
+def test_transient_busy_is_retried_not_acked(monkeypatch):
+    async def run():
+        session, ws, uploads = make_session(monkeypatch, "busy1")
+        real_run = wsv.io_pool.run
+        appends = []
+
+        async def flaky(fn, *args):
+            # второй кадр (seq 1) упирается в переполненный io_pool
+            if getattr(fn, "__name__", "") == "append":
+                appends.append(args[0])
+                if len(appends) == 2:
+                    raise AudioBusy("busy")
+            return await real_run(fn, *args)
+
+        monkeypatch.setattr(wsv.io_pool, "run", flaky)
+        try:
+            for seq in range(4):
+                await session.add_segment(frame(seq))
+            await session.queue.drain()
+            assert "ACK 1" not in ws.sent
+            assert ws.sent[:2] == ["ACK 0", "ERR retry 1: busy"]
+            assert session.last_seq == 0
+
+            # END раньше, чем кадры дошли, запись не сохраняет
+            with pytest.raises(wsv.FramesMissing) as missing:
+                await session.finalize(last_seq=3)
+            assert missing.value.seq == 1
+
+            # клиент пересылает неподтверждённые
+            for seq in range(1, 4):
+                await session.add_segment(frame(seq))
+            url = await session.finalize(last_seq=3)
+            assert url == "https://x/busy1.mp3"
+            assert [m for m in ws.sent if m.startswith("ACK")] == ["ACK 0", "ACK 1", "ACK 2", "ACK 3"]
+            assert session.encoder.frames == 4 * SAMPLES
+        finally:
+            await session.close()
+
+    asyncio.run(run())
+    assert budget.sessions == 0 and budget.used == 0
+
+
+def test_encoder_failure_rebuilds_mp3_from_journal(monkeypatch):
+    async def run():
+        session, ws, uploads = make_session(monkeypatch, "enc1")
+        real_write = Mp3StreamEncoder.write
+        fail = {"left": 1}
+
+        async def broken(self, pcm):
+            if fail["left"]:
+                fail["left"] -= 1
+                raise EncoderError("ffmpeg exited")
+            await real_write(self, pcm)
+
+        monkeypatch.setattr(Mp3StreamEncoder, "write", broken)
+        monkeypatch.setattr(wsv, "VOICE_FLUSH_SECONDS", 0)
+        session.flush_bytes = 0  # каждый кадр сразу в кодировщик
+        try:
+            for seq in range(3):
+                await session.add_segment(frame(seq))
+            await session.queue.drain()
+            assert [m for m in ws.sent if m.startswith("ACK")] == ["ACK 0", "ACK 1", "ACK 2"]
+            assert session.rebuild
+
+            url = await session.finalize(last_seq=2)
+            assert url == "https://x/enc1.mp3"
+            data, duration = uploads[-1]
+            # «ffmpeg» тестов копирует PCM — в MP3 весь звук из журнала
+            expected = b"".join(frame(seq)[FRAME_HEADER.size:] for seq in range(3))
+            assert data == expected
+        finally:
+            await session.close()
+
+    asyncio.run(run())
+
+
+def wav(seq: int) -> bytes:
+    import io
+    import wave
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(np.full(1600, seq + 1, dtype="<i2").tobytes())
+    return buf.getvalue()
+
+
+def test_v1_frames_behind_failed_one_wait_for_its_retry(monkeypatch):
+    async def run():
+        ws = FakeWS()
+        session = wsv.RecordingSession(ws, "u1", "v1retry")
+        real_run = wsv.io_pool.run
+        appends = []
+
+        async def flaky(fn, *args):
+            if getattr(fn, "__name__", "") == "append":
+                appends.append(args[0])
+                if len(appends) == 2:
+                    raise AudioBusy("busy")
+            return await real_run(fn, *args)
+
+        monkeypatch.setattr(wsv.io_pool, "run", flaky)
+        try:
+            for i in range(4):
+                await session.add_segment(wav(i))
+            await session.queue.drain()
+            # 2 и 3 отправлены до ERR retry — не получают номера 1 и 2
+            assert ws.sent == ["ACK 0", "ERR retry 1: busy"]
+
+            for i in range(1, 4):
+                await session.add_segment(wav(i))
+            await session.queue.drain()
+            assert [m for m in ws.sent if m.startswith("ACK")] == ["ACK 0", "ACK 1", "ACK 2", "ACK 3"]
+            pcm = b"".join(session.journal.read_chunks())
+            expected = b"".join(np.full(1600, i + 1, dtype="<i2").tobytes() for i in range(4))
+            assert pcm == expected
+        finally:
+            await session.close()
+
+    asyncio.run(run())
+    assert budget.sessions == 0 and budget.used == 0
@@ -1,3 +1,13 @@
+from .quota import QuotaExceeded, QuotaManager, quotas
+from .recorder import UsageRecorder, usage_recorder
 from .service import log_tokenscount, log_tokenscount_from_usage
 
-__all__ = ["log_tokenscount", "log_tokenscount_from_usage"]
+__all__ = [
+    "log_tokenscount",
+    "log_tokenscount_from_usage",
+    "UsageRecorder",
+    "usage_recorder",
+    "QuotaExceeded",
+    "QuotaManager",
+    "quotas",
+]
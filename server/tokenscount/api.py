@@ -0,0 +1,95 @@
+# backend/tokenscount/api.py
+"""
+GET /api/tokens/usage — расход токенов по часам или дням.
+
+Читает только агрегаты (tokenscount_hourly / tokenscount_daily), поэтому
+не зависит от размера сырого лога. Обычный пользователь видит только
+свой clientid; уровень >= TOKENS_ADMIN_LEVEL (по умолчанию 4, super) —
+любой.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+import db
+from auth.smart_auth import SESSION_COOKIE, get_session_user
+from .rollups import GROUP_COLUMNS, query_usage
+
+router = APIRouter()
+
+ADMIN_LEVEL = int(os.getenv("TOKENS_ADMIN_LEVEL", "4"))
+
+DEFAULT_RANGE = {
+    "hour": timedelta(days=2),
+    "day": timedelta(days=30),
+}
+
+
+def _utc(value: datetime) -> datetime:
+    # время без зоны считаем UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+@router.get("/usage")
+async def token_usage(
+    request: Request,
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    clientid: Optional[str] = None,
+    clienttype: Optional[str] = None,
+    model: Optional[str] = None,
+    group_by: str = Query(",".join(GROUP_COLUMNS)),
+    limit: int = Query(5000, ge=1, le=50000),
+):
+    """
+    Суммы calls / prompttokens / completiontokens / totaltokens по бакетам
+    от бакета `from` до бакета `to` включительно (UTC).
+    group_by — подмножество clientid,clienttype,model (пусто — только по времени).
+    """
+    user = await get_session_user(request.cookies.get(SESSION_COOKIE))
+    if not user:
+        raise HTTPException(401, "Нужна авторизация")
+
+    if (user["level"] or 0) < ADMIN_LEVEL:
+        own = str(user["id"])
+        if clientid is not None and clientid != own:
+            raise HTTPException(403, "Можно смотреть только свой расход")
+        clientid = own
+
+    groups = [g.strip() for g in group_by.split(",") if g.strip()]
+    unknown = set(groups) - set(GROUP_COLUMNS)
+    if unknown:
+        raise HTTPException(400, f"Неизвестные поля group_by: {', '.join(sorted(unknown))}")
+
+    end = _utc(end) if end else datetime.now(timezone.utc)
+    start = _utc(start) if start else end - DEFAULT_RANGE[granularity]
+    if start > end:
+        raise HTTPException(400, "from позже to")
+
+    async with db.pool.acquire() as conn:
+        rows = await query_usage(
+            conn,
+            granularity=granularity,
+            start=start,
+            end=end,
+            clientid=clientid,
+            clienttype=clienttype,
+            model=model,
+            group_by=groups,
+            limit=limit,
+        )
+
+    totals = {k: sum(r[k] for r in rows) for k in ("calls", "prompttokens", "completiontokens", "totaltokens")}
+
+    return {
+        "granularity": granularity,
+        "from": start,
+        "to": end,
+        "rows": rows,
+        "totals": totals,
+        "truncated": len(rows) == limit,
+    }
@@ -0,0 +1,233 @@
+# backend/tokenscount/quota.py
+"""
+Квоты AI на пользователя, проверяемые в памяти.
+
+Два ограничения (0 — выключено, по умолчанию выключены оба):
+  - daily_tokens — токенов за скользящие 24 часа (по часовым бакетам),
+                   AI_QUOTA_DAILY_TOKENS;
+  - rpm          — запросов к модели в минуту (token bucket), AI_QUOTA_RPM.
+Сверка с БД — раз в AI_QUOTA_RECONCILE_INTERVAL секунд.
+
+Счётчики токенов засеваются из tokenscount_hourly на старте и раз
+в reconcile_interval сверяются с ней одной пачкой — так учитывается расход
+других воркеров. Между сверками расход этого процесса прибавляется
+локально (charge), поэтому проверка (check) не ходит в БД.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import db
+from core import metrics
+from .recorder import usage_recorder
+
+log = logging.getLogger("tokenscount.quota")
+
+_rejected = metrics.counter("ai_quota_rejected_total", "AI requests rejected by quota", ("reason",))
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _hour(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+class _Usage:
+    __slots__ = ("db", "local", "bucket", "bucket_at")
+
+    def __init__(self, rpm: int):
+        self.db: Dict[datetime, int] = {}     # час -> токены по данным БД
+        self.local: Dict[datetime, int] = {}  # час -> токены этого процесса после сверки
+        self.bucket = float(rpm)
+        self.bucket_at = time.monotonic()
+
+
+class QuotaManager:
+    def __init__(self,
+                 daily_tokens: int = 0,
+                 rpm: int = 0,
+                 clienttype: str = "user",
+                 reconcile_interval: float = 60.0):
+        self.daily_tokens = daily_tokens
+        self.rpm = rpm
+        self.clienttype = clienttype
+        self.reconcile_interval = reconcile_interval
+
+        self._users: Dict[str, _Usage] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.reconciled_at: Optional[datetime] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.daily_tokens or self.rpm)
+
+    # ---------- lifecycle ----------
+
+    async def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            await self.reconcile()
+        except Exception:
+            # без засева квоты работают по локальным счётчикам до следующей сверки
+            log.exception("quota seed failed")
+        self._task = asyncio.create_task(self._loop(), name="ai-quota-reconcile")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # ---------- API ----------
+
+    def check(self, clientid: Optional[str]) -> None:
+        """Бросает QuotaExceeded, если запрос к модели сейчас не положен."""
+        if not clientid or not self.enabled:
+            return
+        usage = self._get(clientid)
+        now = datetime.now(timezone.utc)
+
+        if self.daily_tokens:
+            used, oldest = self._window(usage, now)
+            if used >= self.daily_tokens:
+                _rejected.inc(reason="daily_tokens")
+                retry = (oldest + timedelta(hours=24) - now).total_seconds() if oldest else 3600
+                raise QuotaExceeded("Дневной лимит токенов исчерпан", max(retry, 1))
+
+        if self.rpm:
+            self._refill(usage)
+            if usage.bucket < 1:
+                _rejected.inc(reason="rpm")
+                raise QuotaExceeded("Слишком много запросов к AI", (1 - usage.bucket) * 60 / self.rpm)
+            usage.bucket -= 1
+
+    def charge(self, clientid: Optional[str], tokens: Optional[int]) -> None:
+        """Прибавляет расход (вызывать вместе с записью в usage_recorder)."""
+        if not clientid or not tokens or not self.enabled:
+            return
+        usage = self._get(clientid)
+        hour = _hour(datetime.now(timezone.utc))
+        usage.local[hour] = usage.local.get(hour, 0) + tokens
+
+    def used(self, clientid: str) -> int:
+        usage = self._users.get(clientid)
+        return self._window(usage, datetime.now(timezone.utc))[0] if usage else 0
+
+    async def reconcile(self) -> None:
+        """
+        Сверка с tokenscount_hourly одной пачкой. Локальный расход сначала
+        дописывается в БД (буфер пуст), затем заменяется значениями из
+        агрегатов — без двойного счёта.
+
+        Снимок local берётся, когда буфер записан целиком, и до конца чтения
+        агрегатов буфер не пишется (usage_recorder.drained): в снимке ровно то,
+        что уже в БД, а расход во время сверки останется в local и попадёт
+        в БД только после неё.
+        """
+        async with usage_recorder.drained() as flushed:
+            if not flushed:
+                log.warning("quota reconcile skipped: usage buffer not flushed")
+                return
+            snapshot = {cid: dict(u.local) for cid, u in self._users.items() if u.local}
+
+            since = _hour(datetime.now(timezone.utc)) - timedelta(hours=23)
+            rows = await db.pool.fetch(
+                """
+                SELECT clientid, bucket, sum(totaltokens)::bigint AS tokens
+                FROM public.tokenscount_hourly
+                WHERE clienttype = $1 AND bucket >= $2 AND clientid <> ''
+                GROUP BY clientid, bucket
+                """,
+                self.clienttype,
+                since,
+            )
+
+        fresh: Dict[str, Dict[datetime, int]] = {}
+        for r in rows:
+            fresh.setdefault(r["clientid"], {})[r["bucket"]] = r["tokens"]
+
+        for cid in set(fresh) | set(self._users):
+            usage = self._get(cid)
+            usage.db = fresh.get(cid, {})
+            for hour, tokens in snapshot.get(cid, {}).items():
+                left = usage.local.get(hour, 0) - tokens
+                if left > 0:
+                    usage.local[hour] = left
+                else:
+                    usage.local.pop(hour, None)
+
+        self._prune(since)
+        self.reconciled_at = datetime.now(timezone.utc)
+
+    def stats(self) -> dict:
+        return {
+            "name": "ai_quota",
+            "enabled": self.enabled,
+            "daily_tokens": self.daily_tokens,
+            "rpm": self.rpm,
+            "users": len(self._users),
+            "reconciled_at": self.reconciled_at,
+        }
+
+    # ---------- internals ----------
+
+    def _get(self, clientid: str) -> _Usage:
+        usage = self._users.get(clientid)
+        if usage is None:
+            usage = self._users[clientid] = _Usage(self.rpm)
+        return usage
+
+    @staticmethod
+    def _window(usage: _Usage, now: datetime):
+        since = _hour(now) - timedelta(hours=23)
+        used = 0
+        oldest = None
+        for part in (usage.db, usage.local):
+            for hour, tokens in part.items():
+                if hour >= since and tokens:
+                    used += tokens
+                    if oldest is None or hour < oldest:
+                        oldest = hour
+        return used, oldest
+
+    def _refill(self, usage: _Usage) -> None:
+        now = time.monotonic()
+        usage.bucket = min(float(self.rpm), usage.bucket + (now - usage.bucket_at) * self.rpm / 60.0)
+        usage.bucket_at = now
+
+    def _prune(self, since: datetime) -> None:
+        for cid in list(self._users):
+            usage = self._users[cid]
+            usage.db = {h: t for h, t in usage.db.items() if h >= since}
+            usage.local = {h: t for h, t in usage.local.items() if h >= since}
+            if self.rpm:
+                self._refill(usage)
+            idle = not usage.db and not usage.local and (not self.rpm or usage.bucket >= self.rpm)
+            if idle:
+                del self._users[cid]
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                log.exception("quota reconcile failed")
+
+
+# общий экземпляр: start()/stop() — из main.startup/shutdown
+quotas = QuotaManager(
+    daily_tokens=int(os.getenv("AI_QUOTA_DAILY_TOKENS", "0")),
+    rpm=int(os.getenv("AI_QUOTA_RPM", "0")),
+    reconcile_interval=float(os.getenv("AI_QUOTA_RECONCILE_INTERVAL", "60")),
+)
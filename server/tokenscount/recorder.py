@@ -0,0 +1,262 @@
+# backend/tokenscount/recorder.py
+"""
+Буферизованная запись в tokenscount.
+
+record_usage() только кладёт строку в очередь в памяти — без обращения
+к БД, поэтому учёт не добавляет round-trip к запросу к модели.
+Фоновая задача сбрасывает очередь пачками (COPY, при ошибке — executemany)
+по размеру (batch_size) или по времени (flush_interval); в той же транзакции
+пачка прибавляется к часовым/дневным агрегатам (rollups.py).
+
+Очередь ограничена (max_queue). Если БД не успевает, срабатывает политика:
+  drop_oldest — вытесняем самые старые строки (по умолчанию);
+  drop_newest — отбрасываем новую строку.
+Потерянные строки считаются в метрике tokenscount_dropped_total.
+На shutdown очередь сбрасывается целиком.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import db
+from core import metrics
+from .rollups import upsert_rollups
+from .service import COLUMNS, _json, usage_tokens
+
+log = logging.getLogger("tokenscount")
+
+POLICIES = ("drop_oldest", "drop_newest")
+
+_recorded = metrics.counter("tokenscount_recorded_total", "Usage rows accepted into the buffer")
+_dropped = metrics.counter("tokenscount_dropped_total", "Usage rows dropped", ("reason",))
+_flushed = metrics.counter("tokenscount_flushed_total", "Usage rows written to the database")
+_flush_seconds = metrics.histogram("tokenscount_flush_seconds", "Duration of one batch write", ("method",))
+
+
+class UsageRecorder:
+    def __init__(self,
+                 max_queue: int = 10000,
+                 batch_size: int = 500,
+                 flush_interval: float = 2.0,
+                 policy: str = "drop_oldest"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy: {policy}")
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+
+        self._queue: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+        metrics.gauge("tokenscount_queue_depth", "Usage rows waiting for flush", fn=lambda: len(self._queue))
+
+    # ---------- lifecycle ----------
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="tokenscount-recorder")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # дописываем всё, что накопилось
+        while self._queue:
+            if not await self.flush():
+                break
+        if self._queue:
+            log.warning("tokenscount: %d rows lost on shutdown", len(self._queue))
+            _dropped.inc(len(self._queue), reason="shutdown")
+            self._queue.clear()
+
+    # ---------- API ----------
+
+    def record(self,
+               *,
+               clientid: Optional[str] = None,
+               clienttype: Optional[str] = None,
+               provider: Optional[str] = None,
+               model: Optional[str] = None,
+               prompttokens: Optional[int] = None,
+               completiontokens: Optional[int] = None,
+               totaltokens: Optional[int] = None,
+               rawusage: Optional[dict[str, Any]] = None,
+               meta: Optional[dict[str, Any]] = None) -> bool:
+        """Кладёт строку в буфер. False — строка отброшена политикой очереди."""
+        if len(self._queue) >= self.max_queue:
+            if self.policy == "drop_newest":
+                _dropped.inc(reason="queue_full")
+                return False
+            self._queue.popleft()
+            _dropped.inc(reason="queue_full")
+
+        self._queue.append((
+            clientid,
+            clienttype,
+            provider,
+            model,
+            prompttokens,
+            completiontokens,
+            totaltokens,
+            _json(rawusage),
+            _json(meta),
+            datetime.now(timezone.utc),
+        ))
+        _recorded.inc()
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def record_usage(self,
+                     *,
+                     clientid: Optional[str],
+                     clienttype: Optional[str],
+                     provider: Optional[str],
+                     model: Optional[str],
+                     usage: Optional[dict[str, Any]],
+                     meta: Optional[dict[str, Any]] = None) -> bool:
+        """Аналог log_tokenscount_from_usage, но через буфер."""
+        prompttokens, completiontokens, totaltokens = usage_tokens(usage)
+        return self.record(
+            clientid=clientid,
+            clienttype=clienttype,
+            provider=provider,
+            model=model,
+            prompttokens=prompttokens,
+            completiontokens=completiontokens,
+            totaltokens=totaltokens,
+            rawusage=usage,
+            meta=meta,
+        )
+
+    async def flush(self) -> bool:
+        """Пишет одну пачку. False — запись не удалась (строки возвращены в очередь)."""
+        async with self._flush_lock:
+            return await self._flush_batch()
+
+    @asynccontextmanager
+    async def drained(self):
+        """
+        Пишет весь буфер и не даёт писать дальше до выхода из блока: внутри
+        всё, что этот процесс записал до входа, уже в БД, а новые строки ждут
+        в буфере (для сверки квот без двойного счёта). yield False — буфер
+        записать не удалось.
+        """
+        async with self._flush_lock:
+            ok = True
+            while self._queue:
+                if not await self._flush_batch():
+                    ok = False
+                    break
+            yield ok
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> dict:
+        return {
+            "name": "tokenscount",
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "recorded": _recorded.value(),
+            "flushed": _flushed.value(),
+            "dropped": _dropped.value(reason="queue_full") + _dropped.value(reason="write_failed"),
+        }
+
+    # ---------- internals ----------
+
+    async def _flush_batch(self) -> bool:
+        # вызывается под _flush_lock
+        if not self._queue or db.pool is None:
+            return not self._queue
+
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        try:
+            await self._write(batch)
+        except Exception as e:
+            log.warning("tokenscount flush of %d rows failed: %s", len(batch), e)
+            self._requeue(batch)
+            return False
+
+        _flushed.inc(len(batch))
+        return True
+
+    async def _write(self, batch: list) -> None:
+        rows = [dict(zip(COLUMNS, r)) for r in batch]
+        async with db.pool.acquire() as conn:
+            started = time.monotonic()
+            try:
+                async with conn.transaction():
+                    await conn.copy_records_to_table(
+                        "tokenscount",
+                        schema_name="public",
+                        records=batch,
+                        columns=COLUMNS,
+                    )
+                    await upsert_rollups(conn, rows)
+                _flush_seconds.observe(time.monotonic() - started, method="copy")
+                return
+            except Exception as e:
+                # COPY может быть недоступен (например, за pgbouncer) — пробуем обычной пачкой
+                log.info("tokenscount COPY failed, using executemany: %s", e)
+
+            started = time.monotonic()
+            async with conn.transaction():
+                await conn.executemany(
+                    """
+                    INSERT INTO public.tokenscount (
+                      clientid, clienttype, provider, model,
+                      prompttokens, completiontokens, totaltokens, rawusage, meta, createdat
+                    )
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8::jsonb, $9::jsonb, $10)
+                    """,
+                    batch,
+                )
+                await upsert_rollups(conn, rows)
+            _flush_seconds.observe(time.monotonic() - started, method="executemany")
+
+    def _requeue(self, batch: list) -> None:
+        # возвращаем в голову очереди столько, сколько помещается
+        room = self.max_queue - len(self._queue)
+        keep = batch[:max(room, 0)]
+        if len(keep) < len(batch):
+            _dropped.inc(len(batch) - len(keep), reason="write_failed")
+        self._queue.extendleft(reversed(keep))
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            while self._queue:
+                if not await self.flush():
+                    break
+                if len(self._queue) < self.batch_size:
+                    # хвост меньше пачки — допишем на следующем тике
+                    break
+
+
+def _env_recorder() -> UsageRecorder:
+    return UsageRecorder(
+        max_queue=int(os.getenv("TOKENSCOUNT_MAX_QUEUE", "10000")),
+        batch_size=int(os.getenv("TOKENSCOUNT_BATCH_SIZE", "500")),
+        flush_interval=float(os.getenv("TOKENSCOUNT_FLUSH_INTERVAL", "2")),
+        policy=os.getenv("TOKENSCOUNT_QUEUE_POLICY", "drop_oldest"),
+    )
+
+
+# общий буфер процесса: start()/stop() — из main.startup/shutdown
+usage_recorder = _env_recorder()
@@ -0,0 +1,146 @@
+# backend/tokenscount/rollups.py
+"""
+Часовые и дневные агрегаты tokenscount (см. migrations/004).
+
+upsert_rollups() вызывается в той же транзакции, что и вставка строк лога
+(recorder.py, service.log_tokenscount), поэтому агрегаты совпадают с сырым
+логом — пока в tokenscount пишут только через эти пути: триггера нет,
+прямой INSERT в лог агрегаты не обновит. query_usage() читает
+только агрегаты — время ответа не зависит от размера tokenscount.
+"""
+
+from datetime import date, datetime, timezone
+from typing import Iterable, List, Optional, Sequence
+
+GRANULARITIES = ("hour", "day")
+GROUP_COLUMNS = ("clientid", "clienttype", "model")
+
+
+def _upsert_sql(table: str, bucket: str, bucket_type: str) -> str:
+    return f"""
+        INSERT INTO public.{table} AS t
+            ({bucket}, clientid, clienttype, model, calls, prompttokens, completiontokens, totaltokens)
+        SELECT * FROM unnest(
+            $1::{bucket_type}[], $2::text[], $3::text[], $4::text[],
+            $5::bigint[], $6::bigint[], $7::bigint[], $8::bigint[]
+        ) AS u
+        -- строки блокируются в порядке ключа: параллельные сбросы с
+        -- пересекающимися (клиент, час) не ловят deadlock
+        ORDER BY 1, 2, 3, 4
+        ON CONFLICT ({bucket}, clientid, clienttype, model) DO UPDATE SET
+            calls            = t.calls + EXCLUDED.calls,
+            prompttokens     = t.prompttokens + EXCLUDED.prompttokens,
+            completiontokens = t.completiontokens + EXCLUDED.completiontokens,
+            totaltokens      = t.totaltokens + EXCLUDED.totaltokens
+    """
+
+
+_UPSERT_HOURLY = _upsert_sql("tokenscount_hourly", "bucket", "timestamptz")
+_UPSERT_DAILY = _upsert_sql("tokenscount_daily", "day", "date")
+
+
+def _aggregate(rows: Iterable[dict], bucket_of) -> List[list]:
+    acc = {}
+    for r in rows:
+        key = (
+            bucket_of(r["createdat"]),
+            r.get("clientid") or "",
+            r.get("clienttype") or "",
+            r.get("model") or "",
+        )
+        prompt = r.get("prompttokens") or 0
+        completion = r.get("completiontokens") or 0
+        total = r.get("totaltokens")
+        if total is None:
+            total = prompt + completion
+
+        a = acc.get(key)
+        if a is None:
+            a = acc[key] = [0, 0, 0, 0]
+        a[0] += 1
+        a[1] += prompt
+        a[2] += completion
+        a[3] += total
+
+    # unnest ждёт столбцы массивами
+    columns = [[] for _ in range(8)]
+    for key, values in sorted(acc.items()):
+        for i, v in enumerate(key + tuple(values)):
+            columns[i].append(v)
+    return columns
+
+
+def _hour(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _day(ts: datetime) -> date:
+    return ts.astimezone(timezone.utc).date()
+
+
+async def upsert_rollups(conn, rows: Sequence[dict]) -> None:
+    """
+    Прибавляет строки лога к агрегатам. rows — словари с полями tokenscount
+    (createdat обязателен). Вызывать внутри транзакции вставки в лог.
+    """
+    if not rows:
+        return
+    await conn.execute(_UPSERT_HOURLY, *_aggregate(rows, _hour))
+    await conn.execute(_UPSERT_DAILY, *_aggregate(rows, _day))
+
+
+async def query_usage(conn,
+                      *,
+                      granularity: str,
+                      start: datetime,
+                      end: datetime,
+                      clientid: Optional[str] = None,
+                      clienttype: Optional[str] = None,
+                      model: Optional[str] = None,
+                      group_by: Sequence[str] = GROUP_COLUMNS,
+                      limit: int = 5000) -> List[dict]:
+    """
+    Суммы по бакетам (включительно от бакета start до бакета end),
+    сгруппированные по bucket + group_by.
+    """
+    if granularity == "hour":
+        table, bucket = "tokenscount_hourly", "bucket"
+        lo, hi = _hour(start), _hour(end)
+    else:
+        table, bucket = "tokenscount_daily", "day"
+        lo, hi = _day(start), _day(end)
+
+    where = [f"{bucket} >= $1", f"{bucket} <= $2"]
+    args: list = [lo, hi]
+    for column, value in (("clientid", clientid), ("clienttype", clienttype), ("model", model)):
+        if value is not None:
+            args.append(value)
+            where.append(f"{column} = ${len(args)}")
+
+    groups = [c for c in GROUP_COLUMNS if c in group_by]
+    select_groups = "".join(f", {c}" for c in groups)
+    args.append(limit)
+
+    rows = await conn.fetch(
+        f"""
+        SELECT {bucket} AS bucket{select_groups},
+               sum(calls)::bigint            AS calls,
+               sum(prompttokens)::bigint     AS prompttokens,
+               sum(completiontokens)::bigint AS completiontokens,
+               sum(totaltokens)::bigint      AS totaltokens
+        FROM public.{table}
+        WHERE {" AND ".join(where)}
+        GROUP BY {bucket}{select_groups}
+        ORDER BY {bucket}{select_groups}
+        LIMIT ${len(args)}
+        """,
+        *args,
+    )
+
+    out = []
+    for r in rows:
+        item = dict(r)
+        for c in groups:
+            item[c] = item[c] or None  # '' в агрегатах = NULL в логе
+        out.append(item)
+    return out
@@ -1,7 +1,38 @@
 # backend/tokenscount/service.py
 
+import json
+from datetime import datetime, timezone
 from typing import Any, Optional
 
+from .rollups import upsert_rollups
+
+
+# порядок колонок для пакетной записи (см. recorder.py)
+COLUMNS = (
+    "clientid",
+    "clienttype",
+    "provider",
+    "model",
+    "prompttokens",
+    "completiontokens",
+    "totaltokens",
+    "rawusage",
+    "meta",
+    "createdat",
+)
+
+
+def _json(value: Optional[dict[str, Any]]) -> Optional[str]:
+    # asyncpg ждёт jsonb строкой
+    return json.dumps(value, ensure_ascii=False, default=str) if value is not None else None
+
+
+def usage_tokens(usage: Optional[dict[str, Any]]) -> tuple:
+    """(prompt, completion, total) из usage провайдера; чего нет — None."""
+    if not isinstance(usage, dict):
+        return None, None, None
+    return usage.get("prompt_tokens"), usage.get("completion_tokens"), usage.get("total_tokens")
+
 
 async def log_tokenscount(
     db,
@@ -17,48 +48,62 @@ async def log_tokenscount(
     meta: Optional[dict[str, Any]] = None,
 ) -> None:
     """
-    Записывает одну строку в таблицу tokenscount.
-    Ничего не требует, кроме живого db-соединения.
-    Все поля опциональны.
+    Записывает одну строку в таблицу tokenscount (и прибавляет её
+    к часовым/дневным агрегатам в той же транзакции).
+    db — пул или соединение asyncpg. Все поля опциональны.
     """
 
-    await db.execute(
-        """
-        INSERT INTO public.tokenscount (
-          clientid,
-          clienttype,
-          provider,
-          model,
-          prompttokens,
-          completiontokens,
-          totaltokens,
-          rawusage,
-          meta
-        )
-        VALUES (
-          :clientid,
-          :clienttype,
-          :provider,
-          :model,
-          :prompttokens,
-          :completiontokens,
-          :totaltokens,
-          :rawusage,
-          :meta
+    row = {
+        "clientid": clientid,
+        "clienttype": clienttype,
+        "provider": provider,
+        "model": model,
+        "prompttokens": prompttokens,
+        "completiontokens": completiontokens,
+        "totaltokens": totaltokens,
+        "rawusage": rawusage,
+        "meta": meta,
+        "createdat": datetime.now(timezone.utc),
+    }
+
+    if hasattr(db, "acquire"):
+        async with db.acquire() as conn:
+            await _insert_one(conn, row)
+    else:
+        await _insert_one(db, row)
+
+
+async def _insert_one(conn, row: dict) -> None:
+
+    async with conn.transaction():
+        await conn.execute(
+            """
+            INSERT INTO public.tokenscount (
+              clientid,
+              clienttype,
+              provider,
+              model,
+              prompttokens,
+              completiontokens,
+              totaltokens,
+              rawusage,
+              meta,
+              createdat
+            )
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8::jsonb, $9::jsonb, $10)
+            """,
+            row["clientid"],
+            row["clienttype"],
+            row["provider"],
+            row["model"],
+            row["prompttokens"],
+            row["completiontokens"],
+            row["totaltokens"],
+            _json(row["rawusage"]),
+            _json(row["meta"]),
+            row["createdat"],
         )
-        """,
-        {
-            "clientid": clientid,
-            "clienttype": clienttype,
-            "provider": provider,
-            "model": model,
-            "prompttokens": prompttokens,
-            "completiontokens": completiontokens,
-            "totaltokens": totaltokens,
-            "rawusage": rawusage,
-            "meta": meta,
-        },
-    )
+        await upsert_rollups(conn, [row])
 
 
 async def log_tokenscount_from_usage(
@@ -76,14 +121,7 @@ async def log_tokenscount_from_usage(
     Если каких-то полей нет — забиваем, пишем что есть.
     """
 
-    if usage is None:
-        prompttokens = None
-        completiontokens = None
-        totaltokens = None
-    else:
-        prompttokens = usage.get("prompt_tokens")
-        completiontokens = usage.get("completion_tokens")
-        totaltokens = usage.get("total_tokens")
+    prompttokens, completiontokens, totaltokens = usage_tokens(usage)
 
     await log_tokenscount(
         db,
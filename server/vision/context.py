@@ -0,0 +1,206 @@
+# server/vision/context.py
+"""
+Контекст AI для визии: бюджет токенов + скользящее резюме.
+
+- count_tokens    — локальный подсчёт токенов (tiktoken, если доступен;
+                    иначе грубая оценка по длине текста);
+- build_context   — messages для модели: system, резюме ранней части
+                    диалога и столько последних шагов, сколько влезает в бюджет
+                    (заполняется от новых к старым);
+- RollingSummaries — резюме шагов, вышедших из «живого» хвоста. Хранится
+                    в vision_summaries и обновляется в фоне, не на пути запроса.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from core.cache import MISSING, TTLCache
+from vision import repository as repo
+
+try:
+    import tiktoken
+except ImportError:  # необязательная зависимость
+    tiktoken = None
+
+log = logging.getLogger("vision.context")
+
+# служебные токены на каждое сообщение chat-формата
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+
+# =====================================================
+#  ПОДСЧЁТ ТОКЕНОВ
+# =====================================================
+
+def load_tokenizer(model: str = "gpt-4o-mini") -> None:
+    """
+    Загружает словарь tiktoken (при первом запуске он скачивается из сети).
+    Вызывается в фоне на старте; пока словаря нет, работает оценка.
+    """
+    global _encoding
+    if tiktoken is None or _encoding is not None:
+        return
+    try:
+        _encoding = tiktoken.encoding_for_model(model)
+        log.info("tokenizer loaded: %s", _encoding.name)
+    except Exception as e:
+        log.warning("tokenizer unavailable, using estimate: %s", e)
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # оценка: ~3 символа на токен (кириллица плотнее латиницы)
+    return len(text) // 3 + 1
+
+
+def step_tokens(step: dict) -> int:
+    tokens = 0
+    if step.get("user_text"):
+        tokens += count_tokens(step["user_text"]) + MESSAGE_OVERHEAD_TOKENS
+    if step.get("ai_text"):
+        tokens += count_tokens(step["ai_text"]) + MESSAGE_OVERHEAD_TOKENS
+    return tokens
+
+
+# =====================================================
+#  СБОРКА КОНТЕКСТА
+# =====================================================
+
+def build_context(system_prompt: str,
+                  history: List[dict],
+                  user_text: str,
+                  budget: int,
+                  summary: Optional[dict] = None) -> Tuple[List[dict], int]:
+    """
+    Возвращает (messages, сколько шагов истории вошло).
+
+    Шаги, уже свёрнутые в резюме (id <= summary.last_step_id), повторно
+    не отправляются. Остальные добавляются от новых к старым, пока
+    укладываются в budget вместе с system, резюме и новым сообщением.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    used = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+    used += count_tokens(user_text) + MESSAGE_OVERHEAD_TOKENS
+
+    covered_id = 0
+    if summary and summary.get("summary"):
+        covered_id = summary.get("last_step_id") or 0
+        summary_msg = "Краткое содержание более раннего разговора:\n" + summary["summary"]
+        messages.append({"role": "system", "content": summary_msg})
+        used += count_tokens(summary_msg) + MESSAGE_OVERHEAD_TOKENS
+
+    picked = []
+    for step in reversed(history):
+        if covered_id and step.get("id") is not None and step["id"] <= covered_id:
+            break
+        cost = step_tokens(step)
+        if used + cost > budget:
+            break
+        used += cost
+        picked.append(step)
+
+    for step in reversed(picked):
+        if step.get("user_text"):
+            messages.append({"role": "user", "content": step["user_text"]})
+        if step.get("ai_text"):
+            messages.append({"role": "assistant", "content": step["ai_text"]})
+
+    messages.append({"role": "user", "content": user_text})
+    return messages, len(picked)
+
+
+# =====================================================
+#  СКОЛЬЗЯЩЕЕ РЕЗЮМЕ
+# =====================================================
+
+Summarizer = Callable[[str, List[dict]], Awaitable[str]]
+
+
+class RollingSummaries:
+    """
+    Резюме по визиям. get() читает из памяти (или один раз из БД),
+    schedule() запускает фоновое обновление: шаги старше keep_recent
+    последних сворачиваются в резюме пачками от batch до max_batch.
+    """
+
+    def __init__(self,
+                 summarize: Summarizer,
+                 keep_recent: int = 10,
+                 batch: int = 10,
+                 max_batch: int = 100,
+                 max_visions: int = 2000,
+                 ttl: float = 600.0):
+        self._summarize = summarize
+        self.keep_recent = keep_recent
+        self.batch = batch
+        self.max_batch = max_batch
+        self._cache = TTLCache(maxsize=max_visions, ttl=ttl, name="vision_summaries")
+        self._running: set = set()
+        self._tasks: set = set()
+
+    async def get(self, vision_id) -> dict:
+        key = str(vision_id)
+        cached = self._cache.get(key)
+        if cached is not MISSING:
+            return cached
+
+        row = await repo.get_summary(vision_id)
+        summary = row or {"summary": "", "last_step_id": 0}
+        self._cache.set(key, summary)
+        return summary
+
+    def schedule(self, vision_id) -> None:
+        key = str(vision_id)
+        if key in self._running:
+            return
+        self._running.add(key)
+        task = asyncio.create_task(self._update(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def schedule_if_due(self, vision_id, history: List[dict], summary: dict) -> None:
+        """
+        Планирует обновление, только если в окне истории набралось
+        достаточно несвёрнутых шагов, — чтобы не ходить в БД на каждый ход.
+        """
+        covered_id = summary.get("last_step_id") or 0
+        pending = sum(1 for s in history if (s.get("id") or 0) > covered_id)
+        if pending >= self.keep_recent + self.batch:
+            self.schedule(vision_id)
+
+    def invalidate(self, vision_id) -> None:
+        self._cache.invalidate(str(vision_id))
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "running": len(self._running)}
+
+    async def _update(self, vision_id: str) -> None:
+        try:
+            current = await self.get(vision_id)
+            steps = await repo.list_steps_to_summarize(
+                vision_id,
+                after_id=current["last_step_id"],
+                keep_recent=self.keep_recent,
+                limit=self.max_batch,
+            )
+            if len(steps) < self.batch:
+                return
+
+            text = await self._summarize(current["summary"], steps)
+            if not text:
+                return
+
+            updated = {"summary": text, "last_step_id": steps[-1]["id"]}
+            await repo.save_summary(vision_id, updated["summary"], updated["last_step_id"])
+            self._cache.set(vision_id, updated)
+            log.info("[%s] summary updated: +%d steps", vision_id, len(steps))
+        except Exception:
+            log.exception("[%s] summary update failed", vision_id)
+        finally:
+            self._running.discard(vision_id)
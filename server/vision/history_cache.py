@@ -0,0 +1,82 @@
+# server/vision/history_cache.py
+"""
+Окно последних шагов визии для контекста AI.
+
+На каждую визию держим кольцевой буфер из последних N шагов
+({"id", "user_text", "ai_text"}). add_step дописывает в него свои шаги,
+поэтому большинству AI-ходов запрос истории в БД не нужен.
+Визии вытесняются по LRU/TTL (core.cache.TTLCache); TTL отсчитывается от
+засева окна из БД (put) и ограничивает расхождение, если шаги пишет другой
+воркер.
+"""
+
+from collections import deque
+from typing import List, Optional
+
+from core.cache import MISSING, TTLCache
+
+
+class HistoryWindows:
+    def __init__(self, size: int = 30, max_visions: int = 2000, ttl: float = 600.0):
+        self.size = size
+        self._cache = TTLCache(maxsize=max_visions, ttl=ttl, name="vision_history")
+
+    def get(self, vision_id) -> Optional[List[dict]]:
+        """Копия окна (от старых к новым) или None, если визии нет в кэше."""
+        window = self._cache.get(str(vision_id))
+        if window is MISSING:
+            return None
+        return list(window)
+
+    def put(self, vision_id, steps: List[dict]) -> None:
+        """Засевает окно шагами из БД (по возрастанию created_at)."""
+        window = deque(maxlen=self.size)
+        for s in steps[-self.size:]:
+            window.append(_compact(s))
+        self._cache.set(str(vision_id), window)
+
+    def append(self, vision_id, step: dict) -> None:
+        """
+        Дописывает шаг, только если окно визии уже в кэше. Порядок — по id
+        (порядок вставки): параллельные add_step одной визии могут прийти
+        сюда не в том порядке, в каком легли в БД.
+        """
+        key = str(vision_id)
+        window = self._cache.get(key)
+        if window is MISSING:
+            return
+        item = _compact(step)
+        if any(s["id"] == item["id"] for s in window):
+            return
+        # на месте, без set(): срок жизни окна не продлевается — иначе при
+        # постоянном трафике оно не истечёт и шаги других воркеров не увидим
+        if window and item["id"] < window[-1]["id"]:
+            steps = sorted([*window, item], key=lambda s: s["id"])
+            window.clear()
+            window.extend(steps[-self.size:])
+        else:
+            window.append(item)
+
+    def set_ai_text(self, vision_id, step_id, ai_text: str) -> None:
+        """Дописывает ответ AI в уже лежащий в окне шаг (фоновая генерация)."""
+        window = self._cache.get(str(vision_id))
+        if window is MISSING:
+            return
+        for s in window:
+            if s["id"] == step_id:
+                s["ai_text"] = ai_text
+                break
+
+    def invalidate(self, vision_id) -> None:
+        self._cache.invalidate(str(vision_id))
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+def _compact(step: dict) -> dict:
+    return {
+        "id": step.get("id"),
+        "user_text": step.get("user_text"),
+        "ai_text": step.get("ai_text"),
+    }
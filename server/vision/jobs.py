@@ -0,0 +1,158 @@
+# server/vision/jobs.py
+"""
+Фоновая очередь генерации ответов AI для шагов визии.
+
+Состояние задач хранится в vision_ai_jobs (см. migrations/003), поэтому
+работа переживает рестарт: воркеры забирают задачи через
+FOR UPDATE SKIP LOCKED, а задачи, зависшие в running у упавшего процесса,
+возвращаются в работу по истечении lease (locked_until).
+
+Параллелизм ограничен числом воркеров; неудачные попытки повторяются
+с экспоненциальной задержкой и джиттером до max_attempts.
+
+Таймаут задачи по умолчанию выводится из настроек шлюза LLM (худший
+случай вызова с повторами + JOB_OVERHEAD), lease — всегда длиннее
+таймаута: иначе живую задачу, которая честно ждёт повтор модели,
+отменили бы или забрал бы другой воркер.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, Optional
+
+from vision import repository as repo
+
+log = logging.getLogger("vision.jobs")
+
+JobHandler = Callable[[dict], Awaitable[None]]
+
+# БД и сборка контекста вокруг вызова модели, сек
+JOB_OVERHEAD = 30.0
+
+
+class AIJobQueue:
+    def __init__(self,
+                 handler: JobHandler,
+                 workers: int = 4,
+                 max_attempts: int = 3,
+                 lease_seconds: float = 180.0,
+                 job_timeout: Optional[float] = None,
+                 poll_interval: float = 2.0,
+                 retry_base: float = 2.0):
+        self._handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.job_timeout = job_timeout
+        self.poll_interval = poll_interval
+        self.retry_base = retry_base
+
+        self._wakeup = asyncio.Event()
+        self._tasks: list = []
+        self._stopping = False
+
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.busy = 0
+
+    # ---------- lifecycle ----------
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        if self.job_timeout is None:
+            self.job_timeout = _default_job_timeout()
+        self.lease_seconds = max(self.lease_seconds, self.job_timeout + JOB_OVERHEAD)
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"vision-ai-job-{n}")
+            for n in range(self.workers)
+        ]
+        log.info("vision AI job queue started: workers=%d timeout=%.0fs lease=%.0fs",
+                 self.workers, self.job_timeout, self.lease_seconds)
+
+    async def stop(self) -> None:
+        # незавершённые задачи останутся running и будут подхвачены после lease
+        self._stopping = True
+        self._wakeup.set()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------- API ----------
+
+    async def enqueue(self, vision_id, step_id, user_id, user_text: str) -> int:
+        job_id = await repo.insert_ai_job(vision_id, step_id, user_id, user_text, self.max_attempts)
+        self._wakeup.set()
+        return job_id
+
+    def stats(self) -> dict:
+        return {
+            "name": "vision_ai_jobs",
+            "workers": len(self._tasks),
+            "job_timeout": self.job_timeout,
+            "lease_seconds": self.lease_seconds,
+            "busy": self.busy,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+    # ---------- internals ----------
+
+    async def _worker(self, n: int) -> None:
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                job = await repo.claim_ai_job(self.lease_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("worker %d: claim failed", n)
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _run(self, job: dict) -> None:
+        self.busy += 1
+        try:
+            await asyncio.wait_for(self._handler(job), self.job_timeout)
+            await repo.complete_ai_job(job["id"])
+            self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            retry_in = self._retry_delay(job["attempts"]) if job["attempts"] < job["max_attempts"] else None
+            log.warning("job %s attempt %s failed: %s (retry_in=%s)", job["id"], job["attempts"], error, retry_in)
+            try:
+                await repo.fail_ai_job(job["id"], error, retry_in)
+            except Exception:
+                log.exception("job %s: could not record failure", job["id"])
+            if retry_in is None:
+                self.failed += 1
+            else:
+                self.retried += 1
+        finally:
+            self.busy -= 1
+
+    def _retry_delay(self, attempt: int) -> float:
+        delay = self.retry_base * (2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+
+def _default_job_timeout() -> float:
+    from llm import get_gateway
+
+    gateway = get_gateway()
+    return (gateway.max_duration() if gateway is not None else 120.0) + JOB_OVERHEAD
@@ -0,0 +1,543 @@
+# server/vision/repository.py
+"""
+Асинхронный слой доступа к данным модуля VISION.
+
+Работает поверх общего пула asyncpg (db.pool), поэтому запросы
+не блокируют event loop uvicorn, в отличие от синхронного supabase-клиента.
+Таблицы: visions, vision_steps, vision_participants, smart_users.
+"""
+
+from typing import Iterable, List, Optional
+import json
+
+from fastapi import HTTPException
+
+import db
+from core.cache import user_changed
+
+
+# =====================================================
+#  HELPERS
+# =====================================================
+
+def _pool():
+    if db.pool is None:
+        raise HTTPException(500, "Database connection not initialized")
+    return db.pool
+
+
+def _rows(records) -> List[dict]:
+    return [dict(r) for r in records]
+
+
+def _row(record) -> Optional[dict]:
+    return dict(record) if record else None
+
+
+# =====================================================
+#  SMART_USERS
+# =====================================================
+
+async def get_users(user_ids: Iterable) -> List[dict]:
+    ids = list(user_ids)
+    if not ids:
+        return []
+
+    rows = await _pool().fetch(
+        "SELECT id, email, name FROM smart_users WHERE id = ANY($1::uuid[])",
+        ids,
+    )
+    return _rows(rows)
+
+
+async def get_user_email(user_id: str) -> Optional[str]:
+    return await _pool().fetchval(
+        "SELECT email FROM smart_users WHERE id = $1",
+        user_id,
+    )
+
+
+async def find_user_by_email(email: str) -> Optional[dict]:
+    row = await _pool().fetchrow(
+        "SELECT id, email FROM smart_users WHERE email = $1 LIMIT 1",
+        email,
+    )
+    return _row(row)
+
+
+async def get_or_create_user(email: str, name: str, role: str):
+    """Находит пользователя по email или создаёт его. Возвращает id."""
+    async with _pool().acquire() as conn:
+        user_id = await conn.fetchval(
+            "SELECT id FROM smart_users WHERE email = $1 LIMIT 1",
+            email,
+        )
+        if user_id:
+            return user_id
+
+        user_id = await conn.fetchval(
+            """
+            INSERT INTO smart_users (email, name, role)
+            VALUES ($1, $2, $3)
+            RETURNING id
+            """,
+            email, name, role,
+        )
+    user_changed(user_id)
+    return user_id
+
+
+# =====================================================
+#  VISIONS
+# =====================================================
+
+async def create_vision(owner_id: str, title: str) -> dict:
+    row = await _pool().fetchrow(
+        """
+        INSERT INTO visions (owner_id, title, archived)
+        VALUES ($1, $2, false)
+        RETURNING *
+        """,
+        owner_id, title,
+    )
+    return dict(row)
+
+
+async def get_vision(vision_id: str) -> Optional[dict]:
+    row = await _pool().fetchrow(
+        "SELECT * FROM visions WHERE id = $1",
+        vision_id,
+    )
+    return _row(row)
+
+
+async def list_visions_for_user(user_id: str) -> List[dict]:
+    rows = await _pool().fetch(
+        """
+        SELECT v.*
+        FROM visions v
+        JOIN vision_participants p ON p.vision_id = v.id
+        WHERE p.user_id = $1
+        """,
+        user_id,
+    )
+    return _rows(rows)
+
+
+async def update_vision_title(vision_id: str, title: str) -> None:
+    await _pool().execute(
+        "UPDATE visions SET title = $1, updated_at = now() WHERE id = $2",
+        title, vision_id,
+    )
+
+
+async def update_vision_archived(vision_id: str, archived: bool) -> None:
+    await _pool().execute(
+        "UPDATE visions SET archived = $1, updated_at = now() WHERE id = $2",
+        archived, vision_id,
+    )
+
+
+async def delete_vision(vision_id: str) -> None:
+    # шаги, участники и сама визия удаляются атомарно
+    async with _pool().acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM vision_steps WHERE vision_id = $1", vision_id)
+            await conn.execute("DELETE FROM vision_participants WHERE vision_id = $1", vision_id)
+            await conn.execute("DELETE FROM visions WHERE id = $1", vision_id)
+
+
+# =====================================================
+#  VISION_PARTICIPANTS
+# =====================================================
+
+async def get_participant_role(vision_id: str, user_id: str) -> Optional[str]:
+    return await _pool().fetchval(
+        """
+        SELECT role FROM vision_participants
+        WHERE vision_id = $1 AND user_id = $2
+        LIMIT 1
+        """,
+        vision_id, user_id,
+    )
+
+
+async def list_participants(vision_id: str) -> List[dict]:
+    rows = await _pool().fetch(
+        """
+        SELECT vision_id, user_id, role, added_at
+        FROM vision_participants
+        WHERE vision_id = $1
+        """,
+        vision_id,
+    )
+    return _rows(rows)
+
+
+async def add_participants(vision_id, participants: List[tuple]) -> None:
+    """participants: список пар (user_id, role)."""
+    await _pool().executemany(
+        """
+        INSERT INTO vision_participants (vision_id, user_id, role)
+        VALUES ($1, $2, $3)
+        """,
+        [(vision_id, user_id, role) for user_id, role in participants],
+    )
+
+
+async def delete_participant(vision_id: str, user_id: str) -> None:
+    await _pool().execute(
+        "DELETE FROM vision_participants WHERE vision_id = $1 AND user_id = $2",
+        vision_id, user_id,
+    )
+
+
+# =====================================================
+#  VISION_STEPS
+# =====================================================
+
+async def list_steps(vision_id: str) -> List[dict]:
+    rows = await _pool().fetch(
+        """
+        SELECT id, vision_id, user_id, user_text, ai_text, created_at
+        FROM vision_steps
+        WHERE vision_id = $1
+        ORDER BY created_at ASC
+        """,
+        vision_id,
+    )
+    return _rows(rows)
+
+
+_STEP_COLUMNS = """
+    s.id, s.vision_id, s.user_id, s.user_text, s.ai_text, s.created_at,
+    u.name AS user_name, u.email AS user_email
+"""
+
+
+async def list_steps_page(vision_id: str,
+                          limit: int,
+                          before: Optional[tuple] = None,
+                          since: Optional[tuple] = None,
+                          overlap: float = 0.0) -> List[dict]:
+    """
+    Keyset-пагинация шагов по (created_at, id), с именами авторов.
+
+    before=(created_at, id) — до limit шагов старше курсора;
+    since=(created_at, id)  — до limit шагов новее курсора (дельта для polling)
+                              и ещё до limit шагов не старше overlap секунд
+                              до курсора: created_at — время начала транзакции,
+                              и шаг, закоммиченный позже более нового, иначе
+                              не попал бы ни в одну дельту;
+    без курсоров            — limit самых свежих.
+    Результат всегда по возрастанию (created_at, id).
+    """
+    if since and overlap > 0:
+        rows = await _pool().fetch(
+            f"""
+            (SELECT {_STEP_COLUMNS}
+             FROM vision_steps s
+             LEFT JOIN smart_users u ON u.id = s.user_id
+             WHERE s.vision_id = $1 AND (s.created_at, s.id) > ($2, $3)
+             ORDER BY s.created_at, s.id
+             LIMIT $4)
+            UNION ALL
+            (SELECT {_STEP_COLUMNS}
+             FROM vision_steps s
+             LEFT JOIN smart_users u ON u.id = s.user_id
+             WHERE s.vision_id = $1 AND (s.created_at, s.id) <= ($2, $3)
+               AND s.created_at > $2 - make_interval(secs => $5)
+             ORDER BY s.created_at DESC, s.id DESC
+             LIMIT $4)
+            ORDER BY created_at, id
+            """,
+            vision_id, *since, limit, float(overlap),
+        )
+        return _rows(rows)
+
+    if since:
+        cond, order, args = "AND (s.created_at, s.id) > ($2, $3)", "ASC", [*since]
+    elif before:
+        cond, order, args = "AND (s.created_at, s.id) < ($2, $3)", "DESC", [*before]
+    else:
+        cond, order, args = "", "DESC", []
+
+    rows = await _pool().fetch(
+        f"""
+        SELECT {_STEP_COLUMNS}
+        FROM vision_steps s
+        LEFT JOIN smart_users u ON u.id = s.user_id
+        WHERE s.vision_id = $1 {cond}
+        ORDER BY s.created_at {order}, s.id {order}
+        LIMIT ${len(args) + 2}
+        """,
+        vision_id, *args, limit,
+    )
+
+    steps = _rows(rows)
+    if order == "DESC":
+        steps.reverse()
+    return steps
+
+
+async def list_history(vision_id: str, limit: int) -> List[dict]:
+    """Последние limit шагов для контекста AI, по возрастанию."""
+    rows = await _pool().fetch(
+        """
+        SELECT id, user_text, ai_text
+        FROM vision_steps
+        WHERE vision_id = $1
+        ORDER BY created_at DESC, id DESC
+        LIMIT $2
+        """,
+        vision_id, limit,
+    )
+    history = _rows(rows)
+    history.reverse()
+    return history
+
+
+async def list_steps_to_summarize(vision_id: str,
+                                  after_id: int,
+                                  keep_recent: int,
+                                  limit: int) -> List[dict]:
+    """
+    Шаги с id > after_id, кроме keep_recent самых свежих, — кандидаты
+    на сворачивание в резюме. По возрастанию, не больше limit.
+    """
+    rows = await _pool().fetch(
+        """
+        SELECT id, user_text, ai_text
+        FROM (
+            SELECT id, user_text, ai_text, created_at,
+                   row_number() OVER (ORDER BY created_at DESC, id DESC) AS rn
+            FROM vision_steps
+            WHERE vision_id = $1 AND id > $2
+        ) t
+        WHERE rn > $3
+        ORDER BY created_at, id
+        LIMIT $4
+        """,
+        vision_id, after_id, keep_recent, limit,
+    )
+    return _rows(rows)
+
+
+async def insert_step(vision_id: str, user_id: str, user_text: str) -> dict:
+    row = await _pool().fetchrow(
+        """
+        INSERT INTO vision_steps (vision_id, user_id, user_text)
+        VALUES ($1, $2, $3)
+        RETURNING id, vision_id, user_id, user_text, ai_text, created_at
+        """,
+        vision_id, user_id, user_text,
+    )
+    return dict(row)
+
+
+async def update_step_ai_text(step_id, ai_text: str) -> None:
+    await _pool().execute(
+        "UPDATE vision_steps SET ai_text = $1 WHERE id = $2",
+        ai_text, step_id,
+    )
+
+
+# =====================================================
+#  VISION_SUMMARIES
+# =====================================================
+
+async def get_summary(vision_id: str) -> Optional[dict]:
+    row = await _pool().fetchrow(
+        "SELECT summary, last_step_id FROM vision_summaries WHERE vision_id = $1",
+        vision_id,
+    )
+    return _row(row)
+
+
+async def save_summary(vision_id: str, summary: str, last_step_id: int) -> None:
+    # резюме только продвигается вперёд — устаревшая запись не перетрёт новую
+    await _pool().execute(
+        """
+        INSERT INTO vision_summaries (vision_id, summary, last_step_id, updated_at)
+        VALUES ($1, $2, $3, now())
+        ON CONFLICT (vision_id) DO UPDATE
+        SET summary = EXCLUDED.summary,
+            last_step_id = EXCLUDED.last_step_id,
+            updated_at = now()
+        WHERE vision_summaries.last_step_id < EXCLUDED.last_step_id
+        """,
+        vision_id, summary, last_step_id,
+    )
+
+
+# =====================================================
+#  VISION_AI_JOBS
+# =====================================================
+
+async def insert_ai_job(vision_id, step_id, user_id, user_text: str, max_attempts: int) -> int:
+    return await _pool().fetchval(
+        """
+        INSERT INTO vision_ai_jobs (vision_id, step_id, user_id, user_text, max_attempts)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING id
+        """,
+        vision_id, step_id, user_id, user_text, max_attempts,
+    )
+
+
+async def claim_ai_job(lease_seconds: float) -> Optional[dict]:
+    """
+    Забирает одну готовую к запуску задачу (или зависшую — с истёкшим locked_until)
+    и помечает её running на lease_seconds. Безопасно для нескольких воркеров/процессов.
+    Зависшая задача, у которой попытки кончились (воркер падал на ней каждый
+    раз), в той же команде помечается failed, а не берётся снова.
+    """
+    row = await _pool().fetchrow(
+        """
+        WITH exhausted AS (
+            UPDATE vision_ai_jobs
+            SET status = 'failed',
+                error = coalesce(error, 'lease expired'),
+                locked_until = NULL,
+                updated_at = now()
+            WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts
+        )
+        UPDATE vision_ai_jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            locked_until = now() + make_interval(secs => $1),
+            updated_at = now()
+        WHERE id = (
+            SELECT id FROM vision_ai_jobs
+            WHERE (status = 'queued' AND run_after <= now())
+               OR (status = 'running' AND locked_until < now() AND attempts < max_attempts)
+            ORDER BY run_after, id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, vision_id, step_id, user_id, user_text, attempts, max_attempts
+        """,
+        float(lease_seconds),
+    )
+    return _row(row)
+
+
+async def complete_ai_job(job_id: int) -> None:
+    await _pool().execute(
+        """
+        UPDATE vision_ai_jobs
+        SET status = 'done', error = NULL, locked_until = NULL, updated_at = now()
+        WHERE id = $1
+        """,
+        job_id,
+    )
+
+
+async def fail_ai_job(job_id: int, error: str, retry_in: Optional[float]) -> None:
+    """retry_in — через сколько секунд повторить; None — задача окончательно failed."""
+    if retry_in is None:
+        await _pool().execute(
+            """
+            UPDATE vision_ai_jobs
+            SET status = 'failed', error = $2, locked_until = NULL, updated_at = now()
+            WHERE id = $1
+            """,
+            job_id, error,
+        )
+    else:
+        await _pool().execute(
+            """
+            UPDATE vision_ai_jobs
+            SET status = 'queued', error = $2, locked_until = NULL,
+                run_after = now() + make_interval(secs => $3), updated_at = now()
+            WHERE id = $1
+            """,
+            job_id, error, float(retry_in),
+        )
+
+
+async def get_ai_job(job_id: int) -> Optional[dict]:
+    row = await _pool().fetchrow(
+        """
+        SELECT j.id, j.vision_id, j.step_id, j.status, j.attempts, j.max_attempts,
+               j.error, j.created_at, j.updated_at, s.ai_text
+        FROM vision_ai_jobs j
+        LEFT JOIN vision_steps s ON s.id = j.step_id
+        WHERE j.id = $1
+        """,
+        job_id,
+    )
+    return _row(row)
+
+
+# =====================================================
+#  READ MODEL: ВИЗИЯ ЦЕЛИКОМ
+# =====================================================
+
+_VISION_FULL_SQL = """
+WITH access AS (
+    SELECT role
+    FROM vision_participants
+    WHERE vision_id = $1 AND user_id = $2
+    LIMIT 1
+)
+SELECT
+    a.role,
+    (SELECT to_json(v) FROM visions v WHERE v.id = $1) AS vision,
+    COALESCE((
+        SELECT json_agg(json_build_object(
+                   'id', s.id,
+                   'vision_id', s.vision_id,
+                   'user_id', s.user_id,
+                   'user_text', s.user_text,
+                   'ai_text', s.ai_text,
+                   'created_at', s.created_at,
+                   'user_name', u.name,
+                   'user_email', u.email
+               ) ORDER BY s.created_at, s.id)
+        FROM (
+            -- последние $3 шагов (LIMIT NULL — все)
+            SELECT *
+            FROM vision_steps
+            WHERE vision_id = $1
+            ORDER BY created_at DESC, id DESC
+            LIMIT $3::int
+        ) s
+        LEFT JOIN smart_users u ON u.id = s.user_id
+    ), '[]'::json) AS steps,
+    COALESCE((
+        SELECT json_agg(json_build_object(
+                   'vision_id', p.vision_id,
+                   'user_id', p.user_id,
+                   'role', p.role,
+                   'added_at', p.added_at,
+                   'email', u.email,
+                   'name', u.name
+               ))
+        FROM vision_participants p
+        LEFT JOIN smart_users u ON u.id = p.user_id
+        WHERE p.vision_id = $1
+    ), '[]'::json) AS participants
+FROM access a
+"""
+
+
+async def get_vision_full(vision_id: str,
+                          user_id: str,
+                          steps_limit: Optional[int] = None) -> Optional[dict]:
+    """
+    Вся визия одним запросом: роль пользователя, сама визия, шаги с именами
+    авторов и участники. None — если пользователь не участник визии
+    (данные в этом случае даже не собираются).
+    steps_limit ограничивает шаги самыми свежими (None — все).
+    """
+    row = await _pool().fetchrow(_VISION_FULL_SQL, vision_id, user_id, steps_limit)
+    if not row:
+        return None
+
+    return {
+        "role": row["role"],
+        "vision": json.loads(row["vision"]) if row["vision"] else None,
+        "steps": json.loads(row["steps"]),
+        "participants": json.loads(row["participants"]),
+    }
@@ -1,11 +1,22 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from contextlib import aclosing
 from datetime import datetime
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List
+import asyncio
+import base64
+import json
+import logging
 import os
 
-from supabase import create_client
-from openai import OpenAI
+from core.cache import MISSING, TTLCache, on_user_changed
+from llm import LLMError, get_gateway
+from tokenscount import QuotaExceeded, quotas, usage_recorder
+from vision import repository as repo
+from vision.context import RollingSummaries, build_context, count_tokens
+from vision.history_cache import HistoryWindows
+from vision.jobs import AIJobQueue
 
 
 # =====================================================
@@ -14,15 +25,47 @@ from openai import OpenAI
 
 router = APIRouter(tags=["Vision Module"])
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+log = logging.getLogger("vision")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("SUPABASE_URL или SUPABASE_SERVICE_ROLE_KEY не заданы")
+# Все запросы к БД идут через асинхронный репозиторий (db.pool),
+# а к модели — через общий шлюз llm.get_gateway() (лимиты, повторы,
+# circuit breaker), чтобы не блокировать event loop.
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+AI_MODEL = "gpt-4o-mini"
+
+# Кэш ролей участников: (vision_id, user_id) -> role | None.
+# Сбрасывается явно при add/remove participant и delete vision,
+# между воркерами устаревание ограничено TTL.
+role_cache = TTLCache(
+    maxsize=int(os.getenv("VISION_ROLE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("VISION_ROLE_CACHE_TTL", "30")),
+    name="vision_roles",
+)
+
+# Шаги на странице GET /vision/{id} по умолчанию (вся история — full_history=true)
+STEPS_PAGE_DEFAULT = 50
+
+# Сколько секунд до курсора since перечитывается в каждой дельте: шаг,
+# чья транзакция закоммитилась позже более нового шага, иначе пропал бы
+VISION_SINCE_OVERLAP = float(os.getenv("VISION_SINCE_OVERLAP", "30"))
+
+# Окно последних шагов, из которого набирается контекст AI
+AI_HISTORY_STEPS = 30
+
+# Бюджет токенов на prompt (system + резюме + шаги + новое сообщение)
+AI_CONTEXT_TOKENS = int(os.getenv("VISION_CONTEXT_TOKENS", "4000"))
+
+AI_SYSTEM_PROMPT = (
+    "Ты — дружелюбный, умный ассистент, который помогает человеку "
+    "развивать свою жизненную визию. Говори понятно, по-человечески."
+)
+
+# Окна последних шагов по визиям — чтобы не читать историю на каждый AI-ход
+history_windows = HistoryWindows(
+    size=AI_HISTORY_STEPS,
+    max_visions=int(os.getenv("VISION_HISTORY_CACHE_SIZE", "2000")),
+    ttl=float(os.getenv("VISION_HISTORY_CACHE_TTL", "600")),
+)
 
 AI_USER_EMAIL = "ai@smartvision.local"
 
@@ -40,6 +83,9 @@ class StepRequest(BaseModel):
     user_id: str
     user_text: str
     with_ai: bool = True
+    # True — шаг сохраняется и возвращается сразу, ответ AI генерируется
+    # фоновой очередью (статус: GET /vision/job/{job_id})
+    background: bool = False
 
 
 class RenameRequest(BaseModel):
@@ -82,14 +128,34 @@ def require_user(user_id: Optional[str]):
     return user_id
 
 
+def _role_key(vision_id, user_id) -> tuple:
+    return (str(vision_id), str(user_id))
+
+
+def invalidate_roles(vision_id, user_id=None):
+    if user_id is not None:
+        role_cache.invalidate(_role_key(vision_id, user_id))
+    else:
+        vid = str(vision_id)
+        role_cache.invalidate_where(lambda key: key[0] == vid)
+
+
+@on_user_changed
+def invalidate_user_roles(user_id: str) -> None:
+    role_cache.invalidate_where(lambda key: key[1] == user_id)
+
+
 async def get_participant_role(vision_id: str, user_id: str) -> Optional[str]:
-    res = supabase.table("vision_participants") \
-        .select("role") \
-        .eq("vision_id", vision_id) \
-        .eq("user_id", user_id) \
-        .execute()
+    key = _role_key(vision_id, user_id)
+
+    role = role_cache.get(key)
+    if role is not MISSING:
+        return role
 
-    return res.data[0]["role"] if res.data else None
+    # None тоже кэшируем: "не участник" — такой же частый ответ
+    role = await repo.get_participant_role(vision_id, user_id)
+    role_cache.set(key, role)
+    return role
 
 
 async def ensure_access(vision_id: str,
@@ -106,25 +172,22 @@ async def ensure_access(vision_id: str,
 
 
 async def load_participants(vision_id: str):
-    res = supabase.table("vision_participants") \
-        .select("vision_id,user_id,role,added_at") \
-        .eq("vision_id", vision_id) \
-        .execute().data
+    res = await repo.list_participants(vision_id)
 
     if not res:
         return []
 
     ids = [p["user_id"] for p in res]
 
-    users = supabase.table("smart_users") \
-        .select("id,email,name") \
-        .in_("id", ids) \
-        .execute().data
+    users = await repo.get_users(ids)
 
     u_map = {u["id"]: u for u in users}
 
     participants = []
     for p in res:
+        # список участников заодно прогревает кэш ролей
+        role_cache.set(_role_key(p["vision_id"], p["user_id"]), p["role"])
+
         info = u_map.get(p["user_id"], {})
         participants.append({
             "vision_id": p["vision_id"],
@@ -138,66 +201,270 @@ async def load_participants(vision_id: str):
     return participants
 
 
-async def load_steps_with_names(vision_id: str):
-    steps = supabase.table("vision_steps") \
-        .select("id,vision_id,user_id,user_text,ai_text,created_at") \
-        .eq("vision_id", vision_id) \
-        .order("created_at", desc=False) \
-        .execute().data
+def encode_cursor(step: dict) -> str:
+    """Непрозрачный курсор шага: base64url("<created_at ISO>|<id>")."""
+    created = step["created_at"]
+    if isinstance(created, datetime):
+        created = created.isoformat()
+    raw = f"{created}|{step['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-    if not steps:
-        return []
 
-    ids = list({s["user_id"] for s in steps})
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created, step_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created), int(step_id)
+    except Exception:
+        raise HTTPException(400, "Некорректный курсор")
 
-    users = supabase.table("smart_users") \
-        .select("id,email,name") \
-        .in_("id", ids) \
-        .execute().data
 
-    u_map = {u["id"]: u for u in users}
+async def load_steps_with_names(vision_id: str,
+                                limit: int,
+                                before: Optional[str] = None,
+                                since: Optional[str] = None):
+    """
+    Страница шагов (keyset по created_at, id). Возвращает {steps, has_more, cursors}:
+      cursors.before — передать как before, чтобы получить более ранние шаги;
+      cursors.since  — передать как since при следующем опросе (только новые шаги).
 
-    for s in steps:
-        s["user_name"] = u_map.get(s["user_id"], {}).get("name")
-        s["user_email"] = u_map.get(s["user_id"], {}).get("email")
+    Ответ на since повторяет и шаги последних VISION_SINCE_OVERLAP секунд до
+    курсора (см. repo.list_steps_page) — клиент сливает шаги по id.
+    """
+    before_key = decode_cursor(before) if before else None
+    since_key = decode_cursor(since) if since else None
+
+    # берём на один шаг больше, чтобы узнать, есть ли ещё
+    steps = await repo.list_steps_page(vision_id, limit + 1, before=before_key, since=since_key,
+                                       overlap=VISION_SINCE_OVERLAP)
+
+    if since_key:
+        # перекрытие (шаги до курсора) не считается в limit и не двигает курсор
+        seen = [s for s in steps if _step_key(s) <= since_key]
+        new = [s for s in steps if _step_key(s) > since_key]
+        has_more = len(new) > limit
+        new = new[:limit]
+        return {
+            "steps": seen + new,
+            "has_more": has_more,
+            "cursors": {"before": None, "since": encode_cursor(new[-1]) if new else since},
+        }
 
-    return steps
+    has_more = len(steps) > limit
+    if has_more:
+        steps = steps[1:]
+
+    return {
+        "steps": steps,
+        "has_more": has_more,
+        "cursors": {
+            "before": encode_cursor(steps[0]) if steps and has_more else None,
+            "since": encode_cursor(steps[-1]) if steps else since,
+        },
+    }
 
 
-def build_ai_answer(history: List[dict], user_text: str):
+def _step_key(step: dict) -> tuple:
+    return step["created_at"], step["id"]
+
+
+async def load_ai_history(vision_id: str) -> List[dict]:
     """
-    Генерация AI ответа на основе 30 предыдущих шагов.
+    Последние AI_HISTORY_STEPS шагов визии: из кэша окна,
+    а при промахе — один ограниченный запрос в БД.
     """
+    history = history_windows.get(vision_id)
+    if history is None:
+        history = await repo.list_history(vision_id, AI_HISTORY_STEPS)
+        history_windows.put(vision_id, history)
+    return history
+
+
+def build_ai_messages(history: List[dict],
+                      user_text: str,
+                      summary: Optional[dict] = None) -> List[dict]:
+    """
+    Собирает messages для OpenAI: резюме ранних шагов и столько
+    последних шагов, сколько влезает в AI_CONTEXT_TOKENS.
+    """
+    messages, _ = build_context(AI_SYSTEM_PROMPT, history, user_text, AI_CONTEXT_TOKENS, summary)
+    return messages
+
+
+def record_usage(gateway, model: str, usage: Optional[dict], user_id: Optional[str], **meta) -> None:
+    """Учёт токенов: только буфер в памяти, запись в tokenscount — в фоне."""
+    usage_recorder.record_usage(
+        clientid=user_id,
+        clienttype="user" if user_id else "system",
+        provider=getattr(gateway.provider, "name", None),
+        model=model,
+        usage=usage,
+        meta={"module": "vision", **meta},
+    )
+    quotas.charge(user_id, (usage or {}).get("total_tokens"))
 
-    if not openai_client:
-        return "AI недоступен."
+
+def check_quota(user_id: str) -> None:
+    """Квота AI пользователя — в памяти, до вставки шага и вызова модели."""
+    try:
+        quotas.check(user_id)
+    except QuotaExceeded as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+
+
+async def summarize_steps(summary: str, steps: List[dict]) -> str:
+    """Сворачивает новые шаги в резюме (вызывается в фоне RollingSummaries)."""
+    gateway = get_gateway()
+    if gateway is None:
+        return ""
+
+    lines = []
+    for s in steps:
+        if s.get("user_text"):
+            lines.append(f"Пользователь: {s['user_text']}")
+        if s.get("ai_text"):
+            lines.append(f"Ассистент: {s['ai_text']}")
 
     messages = [
         {
             "role": "system",
             "content": (
-                "Ты — дружелюбный, умный ассистент, который помогает человеку "
-                "развивать свою жизненную визию. Говори понятно, по-человечески."
+                "Ты ведёшь краткое резюме диалога о жизненной визии человека. "
+                "Обнови резюме с учётом новых реплик: сохрани цели, решения, факты "
+                "о человеке и договорённости. Не больше 200 слов, без вступлений."
             ),
-        }
+        },
+        {
+            "role": "user",
+            "content": f"Текущее резюме:\n{summary or '—'}\n\nНовые реплики:\n" + "\n".join(lines),
+        },
     ]
 
-    # Берём до 30 последних шагов
-    for step in history[-30:]:
-        if step.get("user_text"):
-            messages.append({"role": "user", "content": step["user_text"]})
-        if step.get("ai_text"):
-            messages.append({"role": "assistant", "content": step["ai_text"]})
+    result = await gateway.complete(messages, model=AI_MODEL)
+    record_usage(gateway, result.model, result.usage, None, purpose="summary")
+    return result.text
+
+
+summaries = RollingSummaries(
+    summarize_steps,
+    keep_recent=int(os.getenv("VISION_SUMMARY_KEEP_RECENT", "10")),
+    batch=int(os.getenv("VISION_SUMMARY_BATCH", "10")),
+)
 
-    messages.append({"role": "user", "content": user_text})
 
-    resp = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
+async def build_ai_answer(history: List[dict],
+                          user_text: str,
+                          summary: Optional[dict] = None,
+                          user_id: Optional[str] = None,
+                          vision_id: Optional[str] = None) -> str:
+    """
+    Генерация AI ответа с учётом резюме и последних шагов (в пределах бюджета).
+    Ошибки шлюза (перегрузка, circuit open, отказ провайдера) — LLMError.
+    """
+
+    gateway = get_gateway()
+    if gateway is None:
+        return "AI недоступен."
+
+    result = await gateway.complete(
+        build_ai_messages(history, user_text, summary),
+        model=AI_MODEL,
+        user_id=user_id,
     )
+    record_usage(gateway, result.model, result.usage, user_id, visionid=vision_id)
+    return result.text
+
+
+async def stream_ai_answer(history: List[dict],
+                           user_text: str,
+                           summary: Optional[dict] = None,
+                           user_id: Optional[str] = None,
+                           vision_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    То же, что build_ai_answer, но отдаёт текст кусками по мере генерации.
+    Если поток оборвался после первого куска (клиент ушёл, ошибка модели),
+    итог usage не придёт — токены учитываются по локальной оценке.
+    """
+
+    gateway = get_gateway()
+    if gateway is None:
+        yield "AI недоступен."
+        return
+
+    messages = build_ai_messages(history, user_text, summary)
+    parts: List[str] = []
+    counted = False
+    try:
+        async for chunk in gateway.stream(messages, model=AI_MODEL, user_id=user_id):
+            if chunk.usage:
+                counted = True
+                record_usage(gateway, AI_MODEL, chunk.usage, user_id, visionid=vision_id)
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+    finally:
+        if parts and not counted:
+            prompt = sum(count_tokens(m.get("content")) for m in messages)
+            completion = count_tokens("".join(parts))
+            record_usage(gateway, AI_MODEL,
+                         {"prompt_tokens": prompt, "completion_tokens": completion,
+                          "total_tokens": prompt + completion},
+                         user_id, visionid=vision_id, partial=True)
+
+
+async def run_ai_job(job: dict) -> None:
+    """Обработчик фоновой задачи: генерирует ai_text для уже сохранённого шага."""
+    vision_id = str(job["vision_id"])
+
+    # контекст — только шаги до текущего
+    history = [h for h in await load_ai_history(vision_id) if h["id"] < job["step_id"]]
+    summary = await summaries.get(vision_id)
+
+    ai_text = await build_ai_answer(history, job["user_text"], summary,
+                                    user_id=str(job["user_id"]), vision_id=vision_id)
+
+    await repo.update_step_ai_text(job["step_id"], ai_text)
+    history_windows.set_ai_text(vision_id, job["step_id"], ai_text)
+    summaries.schedule_if_due(vision_id, history, summary)
+
+
+ai_jobs = AIJobQueue(
+    run_ai_job,
+    workers=int(os.getenv("VISION_AI_WORKERS", "4")),
+    max_attempts=int(os.getenv("VISION_AI_MAX_ATTEMPTS", "3")),
+    # по умолчанию — из настроек шлюза LLM (см. vision.jobs)
+    job_timeout=float(os.getenv("VISION_AI_JOB_TIMEOUT", "0")) or None,
+)
+
+
+# Запись ответов оборванных потоков: обработчик запроса уже отменён,
+# задача доводит запись до конца сама
+_saving: set = set()
+
+
+async def save_ai_text(vision_id, step: dict, ai_text: Optional[str]) -> None:
+    """Ответ AI (или его начало) — в vision_steps и в шаг окна истории."""
+    if ai_text:
+        await repo.update_step_ai_text(step["id"], ai_text)
+        step["ai_text"] = ai_text
+        history_windows.set_ai_text(vision_id, step["id"], ai_text)
+
+
+def _save_in_background(vision_id, step: dict, ai_text: Optional[str]) -> asyncio.Task:
+    task = asyncio.create_task(save_ai_text(vision_id, step, ai_text))
+    _saving.add(task)
+    task.add_done_callback(_saved)
+    return task
 
-    text = resp.choices[0].message.content
-    return text.strip() if text else ""
+
+def _saved(task: asyncio.Task) -> None:
+    _saving.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.error("AI answer was not saved: %s", task.exception())
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
 
 
 # =====================================================
@@ -209,39 +476,22 @@ async def create_vision(request: Request):
     body = await request.json()
     user_id = require_user(body.get("user_id"))
 
-    res = supabase.table("visions").insert({
-        "owner_id": user_id,
-        "title": "Моя визия",
-        "archived": False,
-    }).execute()
+    vision = await repo.create_vision(user_id, "Моя визия")
 
-    if not res.data:
+    if not vision:
         raise HTTPException(500, "Ошибка создания визии")
 
-    vision = res.data[0]
     vid = vision["id"]
 
     # добавляем owner + ai как участников
     # находим/создаём AI
-    ai_user = supabase.table("smart_users") \
-        .select("id") \
-        .eq("email", AI_USER_EMAIL) \
-        .execute().data
+    ai_id = await repo.get_or_create_user(AI_USER_EMAIL, "SMART AI", "system")
 
-    if ai_user:
-        ai_id = ai_user[0]["id"]
-    else:
-        ai = supabase.table("smart_users").insert({
-            "email": AI_USER_EMAIL,
-            "name": "SMART AI",
-            "role": "system",
-        }).execute().data[0]
-        ai_id = ai["id"]
-
-    supabase.table("vision_participants").insert([
-        {"vision_id": vid, "user_id": user_id, "role": "owner"},
-        {"vision_id": vid, "user_id": ai_id, "role": "ai"},
-    ]).execute()
+    await repo.add_participants(vid, [
+        (user_id, "owner"),
+        (ai_id, "ai"),
+    ])
+    invalidate_roles(vid)
 
     return {"vision_id": vid}
 
@@ -255,38 +505,25 @@ async def add_participant(req: AddParticipantRequest):
     await ensure_access(req.vision_id, req.user_id, ["owner"])
 
     # нельзя добавить самого себя
-    owner_row = supabase.table("smart_users").select("email").eq("id", req.user_id).execute()
-    owner_email = owner_row.data[0]["email"]
+    owner_email = await repo.get_user_email(req.user_id)
 
     if req.email == owner_email:
         raise HTTPException(400, "Нельзя добавить самого себя как участника")
 
     # ищем пользователя по email
-    u = supabase.table("smart_users") \
-        .select("id,email") \
-        .eq("email", req.email) \
-        .execute().data
+    u = await repo.find_user_by_email(req.email)
 
     if not u:
         raise HTTPException(400, "Пользователь с таким email не найден")
 
-    add_id = u[0]["id"]
+    add_id = u["id"]
 
     # проверяем уже есть ли
-    check = supabase.table("vision_participants") \
-        .select("user_id") \
-        .eq("vision_id", req.vision_id) \
-        .eq("user_id", add_id) \
-        .execute()
-
-    if check.data:
+    if await repo.get_participant_role(req.vision_id, add_id):
         raise HTTPException(409, "Участник уже существует")
 
-    supabase.table("vision_participants").insert({
-        "vision_id": req.vision_id,
-        "user_id": add_id,
-        "role": "participant",
-    }).execute()
+    await repo.add_participants(req.vision_id, [(add_id, "participant")])
+    invalidate_roles(req.vision_id, add_id)
 
     return {"status": "ok"}
 
@@ -300,24 +537,16 @@ async def remove_participant(req: RemoveParticipantRequest):
     await ensure_access(req.vision_id, req.user_id, ["owner"])
 
     # нельзя удалить владельца или AI
-    p = supabase.table("vision_participants") \
-        .select("role") \
-        .eq("vision_id", req.vision_id) \
-        .eq("user_id", req.participant_id) \
-        .execute().data
+    role = await repo.get_participant_role(req.vision_id, req.participant_id)
 
-    if not p:
+    if not role:
         raise HTTPException(404, "Участник не найден")
 
-    role = p[0]["role"]
     if role in ("owner", "ai"):
         raise HTTPException(403, "Нельзя удалить владельца или AI")
 
-    supabase.table("vision_participants") \
-        .delete() \
-        .eq("vision_id", req.vision_id) \
-        .eq("user_id", req.participant_id) \
-        .execute()
+    await repo.delete_participant(req.vision_id, req.participant_id)
+    invalidate_roles(req.vision_id, req.participant_id)
 
     return {"status": "ok"}
 
@@ -341,22 +570,7 @@ async def get_participants(vision_id: str, user_id: str):
 async def list_visions(user_id: str):
     require_user(user_id)
 
-    part = supabase.table("vision_participants") \
-        .select("vision_id") \
-        .eq("user_id", user_id) \
-        .execute().data
-
-    vision_ids = [p["vision_id"] for p in part]
-
-    if not vision_ids:
-        return []
-
-    visions = supabase.table("visions") \
-        .select("*") \
-        .in_("id", vision_ids) \
-        .execute().data
-
-    return visions
+    return await repo.list_visions_for_user(user_id)
 
 
 # =====================================================
@@ -364,30 +578,72 @@ async def list_visions(user_id: str):
 # =====================================================
 
 @router.get("/vision/{vision_id}")
-async def get_vision(vision_id: str, user_id: str):
+async def get_vision(vision_id: str,
+                     user_id: str,
+                     steps_limit: int = Query(STEPS_PAGE_DEFAULT, ge=1, le=500),
+                     full_history: bool = False):
     require_user(user_id)
 
-    await ensure_access(vision_id, user_id, ["owner", "participant", "ai"])
+    # проверка доступа, визия, шаги и участники — одним запросом;
+    # steps_limit — последние N шагов, вся история — только явно (full_history)
+    if full_history:
+        steps_limit = None
+    fetch_limit = steps_limit + 1 if steps_limit else None
+    full = await repo.get_vision_full(vision_id, user_id, fetch_limit)
+
+    role = full["role"] if full else None
+    role_cache.set(_role_key(vision_id, user_id), role)
+
+    if role is None:
+        raise HTTPException(404, "Визия недоступна")
 
-    v = supabase.table("visions") \
-        .select("*") \
-        .eq("id", vision_id) \
-        .single() \
-        .execute().data
+    if role not in ("owner", "participant", "ai"):
+        raise HTTPException(403, "Нет прав для этого действия")
 
-    if not v:
+    if not full["vision"]:
         raise HTTPException(404, "Визия не найдена")
 
-    steps = await load_steps_with_names(vision_id)
-    participants = await load_participants(vision_id)
+    for p in full["participants"]:
+        role_cache.set(_role_key(p["vision_id"], p["user_id"]), p["role"])
+
+    steps = full["steps"]
+    has_more = bool(steps_limit) and len(steps) > steps_limit
+    if has_more:
+        steps = steps[1:]
 
     return {
-        "vision": v,
+        "vision": full["vision"],
         "steps": steps,
-        "participants": participants,
+        "participants": full["participants"],
+        "has_more": has_more,
+        "cursors": {
+            "before": encode_cursor(steps[0]) if has_more else None,
+            "since": encode_cursor(steps[-1]) if steps else None,
+        },
     }
 
 
+# =====================================================
+#  STEPS PAGE / DELTA
+# =====================================================
+
+@router.get("/vision/{vision_id}/steps")
+async def get_steps(vision_id: str,
+                    user_id: str,
+                    limit: int = Query(50, ge=1, le=200),
+                    before: Optional[str] = None,
+                    since: Optional[str] = None):
+    """
+    Шаги визии порциями: before — листать историю назад,
+    since — получить только шаги, добавленные после прошлого запроса.
+    """
+    if before and since:
+        raise HTTPException(400, "Нельзя передавать before и since одновременно")
+
+    await ensure_access(vision_id, user_id, ["owner", "participant", "ai"])
+    return await load_steps_with_names(vision_id, limit, before=before, since=since)
+
+
 # =====================================================
 #  ADD STEP
 # =====================================================
@@ -401,28 +657,48 @@ async def add_step(req: StepRequest):
 
     await ensure_access(req.vision_id, req.user_id, ["owner", "participant", "ai"])
 
-    # вставка шага
-    step = supabase.table("vision_steps").insert({
-        "vision_id": req.vision_id,
-        "user_id": req.user_id,
-        "user_text": req.user_text,
-    }).execute().data[0]
+    if req.with_ai:
+        check_quota(req.user_id)
+
+    if req.with_ai and req.background:
+        step = await repo.insert_step(req.vision_id, req.user_id, req.user_text)
+        history_windows.append(req.vision_id, step)
+        job_id = await ai_jobs.enqueue(req.vision_id, step["id"], req.user_id, req.user_text)
+
+        return {
+            "vision_id": req.vision_id,
+            "user_text": req.user_text,
+            "ai_text": None,
+            "step_id": step["id"],
+            "job_id": job_id,
+            "status": "queued",
+        }
+
+    # контекст — предыдущие шаги (до вставки текущего) и резюме более ранних
+    if req.with_ai:
+        history = await load_ai_history(req.vision_id)
+        summary = await summaries.get(req.vision_id)
+
+    # вставка шага; в окно — сразу, в порядке вставки (ответ AI допишется)
+    step = await repo.insert_step(req.vision_id, req.user_id, req.user_text)
+    history_windows.append(req.vision_id, step)
 
     ai_text = None
 
     if req.with_ai:
-        history = supabase.table("vision_steps") \
-            .select("user_text,ai_text") \
-            .eq("vision_id", req.vision_id) \
-            .order("created_at", desc=False) \
-            .execute().data
+        try:
+            ai_text = await build_ai_answer(history, req.user_text, summary,
+                                            user_id=req.user_id, vision_id=req.vision_id)
+        except LLMError as e:
+            # шаг уже сохранён — ответ AI можно запросить повторно
+            raise HTTPException(503, f"AI временно недоступен: {e}")
 
-        ai_text = build_ai_answer(history, req.user_text)
+        await repo.update_step_ai_text(step["id"], ai_text)
+        step["ai_text"] = ai_text
+        history_windows.set_ai_text(req.vision_id, step["id"], ai_text)
 
-        supabase.table("vision_steps") \
-            .update({"ai_text": ai_text}) \
-            .eq("id", step["id"]) \
-            .execute()
+        # резюме обновляется в фоне, ответ его не ждёт
+        summaries.schedule_if_due(req.vision_id, history + [step], summary)
 
     return {
         "vision_id": req.vision_id,
@@ -431,6 +707,114 @@ async def add_step(req: StepRequest):
     }
 
 
+# =====================================================
+#  AI JOB STATUS
+# =====================================================
+
+@router.get("/vision/job/{job_id}")
+async def get_ai_job(job_id: int, user_id: str):
+    """Статус фоновой генерации: queued | running | done | failed (+ ai_text, когда done)."""
+    require_user(user_id)
+
+    job = await repo.get_ai_job(job_id)
+    if not job:
+        raise HTTPException(404, "Задача не найдена")
+
+    await ensure_access(str(job["vision_id"]), user_id, ["owner", "participant", "ai"])
+
+    return {
+        "job_id": job["id"],
+        "vision_id": job["vision_id"],
+        "step_id": job["step_id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"] if job["status"] == "failed" else None,
+        "ai_text": job["ai_text"] if job["status"] == "done" else None,
+    }
+
+
+# =====================================================
+#  ADD STEP (STREAM)
+# =====================================================
+
+@router.post("/vision/step/stream")
+async def add_step_stream(req: StepRequest):
+    """
+    Потоковый вариант /vision/step (Server-Sent Events).
+
+    События:
+      step  — шаг сохранён: {"vision_id", "step_id", "user_text"}
+      token — очередной кусок ответа AI: {"text"}
+      done  — ответ готов и записан в vision_steps: {"vision_id", "step_id", "user_text", "ai_text"}
+      error — генерация или запись упала: {"message"[, "ai_text"]};
+              начало ответа, если оно было, уже записано в шаг
+    """
+    require_user(req.user_id)
+
+    if not req.user_text.strip():
+        raise HTTPException(400, "Текст пустой")
+
+    await ensure_access(req.vision_id, req.user_id, ["owner", "participant", "ai"])
+
+    if req.with_ai:
+        check_quota(req.user_id)
+        history = await load_ai_history(req.vision_id)
+        summary = await summaries.get(req.vision_id)
+
+    step = await repo.insert_step(req.vision_id, req.user_id, req.user_text)
+    history_windows.append(req.vision_id, step)
+
+    async def events():
+        yield sse_event("step", {
+            "vision_id": req.vision_id,
+            "step_id": step["id"],
+            "user_text": req.user_text,
+        })
+
+        ai_text = None
+
+        if req.with_ai:
+            parts = []
+            error = None
+            try:
+                try:
+                    async with aclosing(stream_ai_answer(history, req.user_text, summary,
+                                                         user_id=req.user_id, vision_id=req.vision_id)) as answer:
+                        async for delta in answer:
+                            parts.append(delta)
+                            yield sse_event("token", {"text": delta})
+                except Exception as e:
+                    error = e
+            finally:
+                # и при обрыве клиента: уже сгенерированное сохраняется
+                ai_text = "".join(parts).strip() or None
+                saving = _save_in_background(req.vision_id, step, ai_text)
+
+            try:
+                await asyncio.shield(saving)
+            except Exception as e:
+                yield sse_event("error", {"message": f"Save error: {e}"})
+                return
+            if error is not None:
+                yield sse_event("error", {"message": f"AI error: {error}", "ai_text": ai_text})
+                return
+
+            summaries.schedule_if_due(req.vision_id, history + [step], summary)
+
+        yield sse_event("done", {
+            "vision_id": req.vision_id,
+            "step_id": step["id"],
+            "user_text": req.user_text,
+            "ai_text": ai_text,
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # =====================================================
 #  RENAME
 # =====================================================
@@ -439,10 +823,7 @@ async def add_step(req: StepRequest):
 async def rename_vision(req: RenameRequest):
     await ensure_access(req.vision_id, req.user_id, ["owner"])
 
-    supabase.table("visions") \
-        .update({"title": req.title, "updated_at": datetime.utcnow().isoformat()}) \
-        .eq("id", req.vision_id) \
-        .execute()
+    await repo.update_vision_title(req.vision_id, req.title)
 
     return {"status": "ok", "title": req.title}
 
@@ -455,10 +836,7 @@ async def rename_vision(req: RenameRequest):
 async def archive_vision(req: ArchiveRequest):
     await ensure_access(req.vision_id, req.user_id, ["owner"])
 
-    supabase.table("visions") \
-        .update({"archived": req.archived, "updated_at": datetime.utcnow().isoformat()}) \
-        .eq("id", req.vision_id) \
-        .execute()
+    await repo.update_vision_archived(req.vision_id, req.archived)
 
     return {"status": "ok", "archived": req.archived}
 
@@ -471,8 +849,9 @@ async def archive_vision(req: ArchiveRequest):
 async def delete_vision(req: DeleteRequest):
     await ensure_access(req.vision_id, req.user_id, ["owner"])
 
-    supabase.table("vision_steps").delete().eq("vision_id", req.vision_id).execute()
-    supabase.table("vision_participants").delete().eq("vision_id", req.vision_id).execute()
-    supabase.table("visions").delete().eq("id", req.vision_id).execute()
+    await repo.delete_vision(req.vision_id)
+    invalidate_roles(req.vision_id)
+    history_windows.invalidate(req.vision_id)
+    summaries.invalidate(req.vision_id)
 
     return {"status": "ok", "deleted": req.vision_id}
@@ -0,0 +1,144 @@
+# server/voicerecorder/budget.py
+"""
+Общий бюджет памяти диктофона и допуск новых записей.
+
+Учитываются байты аудио, которые записи держат в памяти процесса: кадры,
+ждущие в очереди сессии, и PcmBuffer протокола v2 (PCM после разбора уже
+в журнале на диске и в ffmpeg).
+
+  - used >= soft: сессии «проливают» входящие кадры на диск (SpillFile) —
+    в очереди остаётся только ссылка (смещение, длина);
+  - used >= hard или открыто max_sessions записей: новые START / RESUME
+    получают ERR busy, идущие записи продолжаются (на диске).
+
+VOICE_MEMORY_SOFT_MB / VOICE_MEMORY_HARD_MB / VOICE_MAX_SESSIONS.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from core import metrics
+
+
+class BudgetExceeded(Exception):
+    """Новая запись не помещается в бюджет — клиенту «попробуйте позже»."""
+
+
+class AudioBudget:
+    def __init__(self, soft_bytes: int, hard_bytes: int, max_sessions: int):
+        self.soft_bytes = soft_bytes
+        self.hard_bytes = hard_bytes
+        self.max_sessions = max_sessions
+        self.used = 0
+        self.sessions = 0
+        self.peak = 0
+        self._refused = metrics.counter(
+            "voice_sessions_refused_total", "Recordings refused by admission control", ("reason",)
+        )
+        self._spilled = metrics.counter("voice_spilled_bytes_total", "Audio bytes spilled to disk under memory pressure")
+        metrics.gauge("voice_memory_bytes", "Audio bytes buffered in memory by recordings", fn=lambda: self.used)
+        metrics.gauge("voice_memory_soft_bytes", "Recorder memory threshold for spilling to disk", fn=lambda: self.soft_bytes)
+        metrics.gauge("voice_memory_hard_bytes", "Recorder memory limit for admitting recordings", fn=lambda: self.hard_bytes)
+        metrics.gauge("voice_sessions_admitted", "Recordings holding a budget slot", fn=lambda: self.sessions)
+
+    @property
+    def spilling(self) -> bool:
+        return self.used >= self.soft_bytes
+
+    def admit(self) -> None:
+        """Слот новой записи; BudgetExceeded — не помещается."""
+        if self.sessions >= self.max_sessions:
+            self._refused.inc(reason="sessions")
+            raise BudgetExceeded(f"too many recordings in progress ({self.sessions}), try again later")
+        if self.used >= self.hard_bytes:
+            self._refused.inc(reason="memory")
+            raise BudgetExceeded("recorder memory budget exhausted, try again later")
+        self.sessions += 1
+
+    def leave(self) -> None:
+        self.sessions -= 1
+
+    def charge(self, n: int) -> None:
+        self.used += n
+        self.peak = max(self.peak, self.used)
+
+    def release(self, n: int) -> None:
+        self.used -= n
+
+    def spilled(self, n: int) -> None:
+        self._spilled.inc(n)
+
+    def stats(self) -> dict:
+        return {
+            "name": "voice_budget",
+            "used": self.used,
+            "peak": self.peak,
+            "soft": self.soft_bytes,
+            "hard": self.hard_bytes,
+            "spilling": self.spilling,
+            "sessions": self.sessions,
+            "max_sessions": self.max_sessions,
+            "refused": {r: self._refused.value(reason=r) for r in ("sessions", "memory")},
+        }
+
+
+@dataclass
+class SpillRef:
+    """Кадр, пролитый на диск: вместо байтов в очереди — место в SpillFile."""
+    offset: int
+    length: int
+
+
+class SpillFile:
+    """
+    Файл кадров сессии под давлением памяти. Запись (приём с сокета) и
+    чтение (очередь сессии) идут из потоков io_pool — под общим локом;
+    когда прочитан последний кадр, файл обнуляется.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes) -> SpillRef:
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "w+b")
+            self._file.seek(self.size)
+            self._file.write(data)
+            ref = SpillRef(self.size, len(data))
+            self.size += len(data)
+            return ref
+
+    def read(self, ref: SpillRef) -> bytes:
+        with self._lock:
+            self._file.flush()
+            self._file.seek(ref.offset)
+            data = self._file.read(ref.length)
+            if ref.offset + ref.length == self.size:
+                # очередь разобрана до конца — место можно переиспользовать
+                self._file.truncate(0)
+                self.size = 0
+            return data
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+budget = AudioBudget(
+    soft_bytes=int(float(os.getenv("VOICE_MEMORY_SOFT_MB", "64")) * 2**20),
+    hard_bytes=int(float(os.getenv("VOICE_MEMORY_HARD_MB", "128")) * 2**20),
+    max_sessions=int(os.getenv("VOICE_MAX_SESSIONS", "32")),
+)
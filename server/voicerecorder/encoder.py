@@ -0,0 +1,146 @@
+# server/voicerecorder/encoder.py
+"""
+Потоковое кодирование диктовки в MP3.
+
+Вместо того чтобы копить все сегменты в памяти и кодировать одним export()
+в конце, PCM отдаётся долгоживущему процессу ffmpeg через stdin по мере
+поступления сегментов. MP3 пишется во временный файл; END только закрывает
+stdin и ждёт, пока ffmpeg допишет хвост (доли секунды при любой длине записи).
+
+decode_wav() — разбор WAV-сегмента протокола v1 (stdlib wave, без pydub).
+"""
+
+import asyncio
+import io
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+import wave
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+log = logging.getLogger("voicerecorder.encoder")
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN") or shutil.which("ffmpeg") or "ffmpeg"
+VOICE_TMP_DIR = Path(os.getenv("VOICE_TMP_DIR") or Path(tempfile.gettempdir()) / "voicerecorder")
+
+# ширина сэмпла (байт) -> формат сырого PCM для ffmpeg
+_PCM_FORMATS = {1: "u8", 2: "s16le", 4: "s32le"}
+
+
+class EncoderError(Exception):
+    """ffmpeg не запустился или завершился с ошибкой."""
+
+
+@dataclass
+class PcmFormat:
+    sample_rate: int
+    channels: int
+    sample_width: int = 2
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.channels * self.sample_width
+
+
+def decode_wav(raw: bytes):
+    """WAV-байты -> (PcmFormat, сырые PCM-кадры)."""
+    with wave.open(io.BytesIO(raw), "rb") as wf:
+        fmt = PcmFormat(wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+        pcm = wf.readframes(wf.getnframes())
+    if fmt.sample_width not in _PCM_FORMATS:
+        raise ValueError(f"unsupported sample width: {fmt.sample_width}")
+    return fmt, pcm
+
+
+class Mp3StreamEncoder:
+    """
+    Один процесс ffmpeg на запись: s16le/u8/s32le PCM в stdin -> MP3 в файл.
+
+        enc = Mp3StreamEncoder(fmt); await enc.start()
+        await enc.write(pcm) ...            # по мере прихода сегментов
+        path = await enc.finish()           # END: дописать хвост
+        enc.cleanup()                       # удалить временный файл
+    """
+
+    def __init__(self, fmt: PcmFormat, bitrate: str = "128k", out_dir: Optional[Path] = None):
+        self.fmt = fmt
+        self.bitrate = bitrate
+        self.out_path = Path(out_dir or VOICE_TMP_DIR) / f"{uuid.uuid4().hex}.mp3"
+        self.frames = 0
+        self._proc: Optional[asyncio.subprocess.Process] = None
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.frames / self.fmt.sample_rate
+
+    async def start(self) -> None:
+        self.out_path.parent.mkdir(parents=True, exist_ok=True)
+        cmd = [
+            FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", _PCM_FORMATS[self.fmt.sample_width],
+            "-ar", str(self.fmt.sample_rate),
+            "-ac", str(self.fmt.channels),
+            "-i", "pipe:0",
+            "-acodec", "libmp3lame", "-b:a", self.bitrate,
+            str(self.out_path),
+        ]
+        try:
+            self._proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            raise EncoderError(f"ffmpeg not available: {e}") from e
+
+    async def write(self, pcm: bytes) -> None:
+        """Отдаёт PCM кодировщику; ждёт, если ffmpeg не успевает (backpressure)."""
+        if self._proc is None:
+            raise EncoderError("encoder not started")
+        if len(pcm) % self.fmt.frame_bytes:
+            raise ValueError("PCM length is not a whole number of frames")
+        try:
+            self._proc.stdin.write(pcm)
+            await self._proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise EncoderError(f"ffmpeg exited: {await self._stderr()}") from e
+        self.frames += len(pcm) // self.fmt.frame_bytes
+
+    async def finish(self) -> Path:
+        """Закрывает stdin и ждёт завершения ffmpeg; возвращает путь к MP3."""
+        if self._proc is None:
+            raise EncoderError("encoder not started")
+        try:
+            self._proc.stdin.close()
+            await self._proc.stdin.wait_closed()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        code = await self._proc.wait()
+        if code != 0:
+            raise EncoderError(f"ffmpeg exited with {code}: {await self._stderr()}")
+        return self.out_path
+
+    async def abort(self) -> None:
+        """Прерывает кодирование (обрыв сессии) и удаляет файл."""
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+            await self._proc.wait()
+        self.cleanup()
+
+    def cleanup(self) -> None:
+        try:
+            self.out_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    async def _stderr(self) -> str:
+        try:
+            err = await asyncio.wait_for(self._proc.stderr.read(), 5)
+        except Exception:
+            return ""
+        return err.decode(errors="replace").strip()[-500:]
@@ -0,0 +1,265 @@
+# server/voicerecorder/journal.py
+"""
+Журнал сегментов записи на локальном диске — для продолжения после обрыва.
+
+Каталог на rec_id (VOICE_JOURNAL_DIR/<rec_id>/):
+    meta.json   user_id, протокол, формат PCM
+    audio.pcm   принятый PCM подряд (только дописывается)
+    frames.idx  записи <IQ: seq кадра и конец его данных в audio.pcm
+
+Кадр сначала дописывается в audio.pcm, потом в индекс, поэтому индекс не
+ссылается дальше записанных данных. При открытии после падения хвост
+audio.pcm за последней целой записью индекса обрезается: last_seq —
+последний кадр, который точно на диске (его и сообщает клиенту RESUME).
+
+Методы SegmentJournal синхронные (файловый I/O) — сессия вызывает их
+через voicerecorder.workers.io_pool, по порядку.
+
+JournalSweeper — фоновая чистка: журналы, которые не открыты в этом
+процессе и не менялись дольше ttl (брошенные записи, остатки после
+падения), удаляются вместе со старыми временными файлами (MP3
+кодировщика, пролив очередей).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from core import metrics
+from voicerecorder.encoder import VOICE_TMP_DIR, PcmFormat
+
+log = logging.getLogger("voicerecorder.journal")
+
+VOICE_JOURNAL_DIR = Path(os.getenv("VOICE_JOURNAL_DIR") or VOICE_TMP_DIR / "journal")
+VOICE_JOURNAL_FSYNC = os.getenv("VOICE_JOURNAL_FSYNC", "0") == "1"
+
+INDEX_RECORD = struct.Struct("<IQ")
+REC_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_swept = metrics.counter("voice_journal_swept_total", "Abandoned voicerecorder journals removed")
+_journal_bytes = metrics.counter("voice_journal_bytes_total", "PCM bytes appended to voicerecorder journals")
+
+# открытые в этом процессе журналы (rec_id -> journal): их sweeper не трогает
+_open: Dict[str, "SegmentJournal"] = {}
+
+
+def valid_rec_id(rec_id: str) -> bool:
+    """rec_id идёт в путь на диске — только [A-Za-z0-9_-]."""
+    return bool(rec_id) and bool(REC_ID_RE.match(rec_id))
+
+
+class SegmentJournal:
+    def __init__(self, rec_id: str, meta: dict, root: Path = VOICE_JOURNAL_DIR):
+        self.rec_id = rec_id
+        self.meta = meta
+        self.dir = root / rec_id
+        self.last_seq = -1
+        self.nbytes = 0
+        self._audio = None
+        self._index = None
+
+    @property
+    def fmt(self) -> PcmFormat:
+        return PcmFormat(**self.meta["fmt"])
+
+    @property
+    def user_id(self) -> str:
+        return self.meta["user_id"]
+
+    # ---------- открытие ----------
+
+    @classmethod
+    def create(cls, rec_id: str, user_id: str, protocol: int, fmt: PcmFormat,
+               root: Path = VOICE_JOURNAL_DIR) -> "SegmentJournal":
+        """Новый журнал; FileExistsError — журнал с этим rec_id уже есть (чужой не трогаем)."""
+        if not valid_rec_id(rec_id):
+            raise ValueError(f"bad rec_id: {rec_id!r}")
+        meta = {
+            "rec_id": rec_id,
+            "user_id": user_id,
+            "protocol": protocol,
+            "fmt": {"sample_rate": fmt.sample_rate, "channels": fmt.channels, "sample_width": fmt.sample_width},
+            "created_at": time.time(),
+        }
+        journal = cls(rec_id, meta, root)
+        journal.dir.mkdir(parents=True)
+        (journal.dir / "meta.json").write_text(json.dumps(meta))
+        journal._open_files()
+        return journal
+
+    @staticmethod
+    def exists(rec_id: str, root: Path = VOICE_JOURNAL_DIR) -> bool:
+        return valid_rec_id(rec_id) and (root / rec_id).exists()
+
+    @classmethod
+    def open(cls, rec_id: str, root: Path = VOICE_JOURNAL_DIR) -> Optional["SegmentJournal"]:
+        """Журнал с диска (после обрыва или падения процесса); None — нет такого."""
+        if not valid_rec_id(rec_id):
+            return None
+        path = root / rec_id
+        try:
+            meta = json.loads((path / "meta.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+        journal = cls(rec_id, meta, root)
+        index = (path / "frames.idx").read_bytes() if (path / "frames.idx").exists() else b""
+        whole = len(index) - len(index) % INDEX_RECORD.size
+        if whole:
+            journal.last_seq, journal.nbytes = INDEX_RECORD.unpack_from(index, whole - INDEX_RECORD.size)
+
+        # обрезаем недописанное при падении
+        with open(path / "frames.idx", "ab") as f:
+            f.truncate(whole)
+        with open(path / "audio.pcm", "ab") as f:
+            f.truncate(journal.nbytes)
+
+        journal._open_files()
+        return journal
+
+    def _open_files(self) -> None:
+        self._audio = open(self.dir / "audio.pcm", "ab")
+        self._index = open(self.dir / "frames.idx", "ab")
+        _open[self.rec_id] = self
+
+    # ---------- запись / чтение ----------
+
+    def append(self, seq: int, pcm) -> None:
+        self._audio.write(pcm)
+        self._audio.flush()
+        if VOICE_JOURNAL_FSYNC:
+            os.fsync(self._audio.fileno())
+        self.nbytes += len(pcm)
+        self._index.write(INDEX_RECORD.pack(seq, self.nbytes))
+        self._index.flush()
+        if VOICE_JOURNAL_FSYNC:
+            os.fsync(self._index.fileno())
+        self.last_seq = seq
+        _journal_bytes.inc(len(pcm))
+
+    def read_chunks(self, chunk_bytes: int = 1 << 20) -> Iterator[bytes]:
+        """PCM журнала по кускам (кратным кадру) — для пересборки MP3."""
+        chunk_bytes -= chunk_bytes % self.fmt.frame_bytes
+        with open(self.dir / "audio.pcm", "rb") as f:
+            left = self.nbytes
+            while left > 0:
+                data = f.read(min(chunk_bytes, left))
+                if not data:
+                    break
+                left -= len(data)
+                yield data
+
+    # ---------- закрытие ----------
+
+    def close(self) -> None:
+        for f in (self._audio, self._index):
+            if f is not None:
+                f.close()
+        self._audio = self._index = None
+        if _open.get(self.rec_id) is self:
+            del _open[self.rec_id]
+
+    def remove(self) -> None:
+        self.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# =====================================================
+#  ЧИСТКА
+# =====================================================
+
+def _age(path: Path, now: float) -> float:
+    """Секунд с последнего изменения файла / каталога журнала."""
+    try:
+        paths = [path, *path.iterdir()] if path.is_dir() else [path]
+        return now - max(p.stat().st_mtime for p in paths)
+    except OSError:
+        return 0.0
+
+
+class JournalSweeper:
+    def __init__(self, interval: float = 600.0, ttl: float = 86400.0, root: Path = VOICE_JOURNAL_DIR):
+        self.interval = interval
+        self.ttl = ttl
+        self.root = root
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[dict] = None
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop(), name="voice-journal-sweeper")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def pending(self) -> int:
+        """Журналов на диске (открытых и ждущих RESUME)."""
+        try:
+            return sum(1 for p in self.root.iterdir() if p.is_dir())
+        except OSError:
+            return 0
+
+    def _sweep_sync(self) -> dict:
+        now = time.time()
+        journals = tmp = 0
+        if self.root.exists():
+            for path in self.root.iterdir():
+                if path.is_dir() and path.name not in _open and _age(path, now) > self.ttl:
+                    shutil.rmtree(path, ignore_errors=True)
+                    journals += 1
+        # временные MP3 кодировщика и файлы пролива очередей (budget.SpillFile),
+        # оставшиеся после падения процесса
+        if VOICE_TMP_DIR.exists():
+            for pattern in ("*.mp3", "*.spill"):
+                for path in VOICE_TMP_DIR.glob(pattern):
+                    if _age(path, now) > self.ttl:
+                        path.unlink(missing_ok=True)
+                        tmp += 1
+        return {"journals": journals, "tmp": tmp}
+
+    async def sweep(self) -> dict:
+        started = time.monotonic()
+        result = await asyncio.to_thread(self._sweep_sync)
+        _swept.inc(result["journals"])
+        self.last_run = {**result, "seconds": round(time.monotonic() - started, 3)}
+        if result["journals"] or result["tmp"]:
+            log.info("voice journals swept: %d journals, %d temp files", result["journals"], result["tmp"])
+        return self.last_run
+
+    def stats(self) -> dict:
+        return {
+            "name": "voice_journal_sweeper",
+            "interval": self.interval,
+            "ttl": self.ttl,
+            "journals": self.pending(),
+            "swept_total": _swept.value(),
+            "last_run": self.last_run,
+        }
+
+    async def _loop(self) -> None:
+        found = await asyncio.to_thread(self.pending)
+        if found:
+            # журналы предыдущего процесса: доступны для RESUME до истечения ttl
+            log.info("voice journals on disk after restart: %d", found)
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                log.exception("voice journal sweep failed")
+            await asyncio.sleep(self.interval)
+
+
+journal_sweeper = JournalSweeper(
+    interval=float(os.getenv("VOICE_JOURNAL_SWEEP_INTERVAL", "600")),
+    ttl=float(os.getenv("VOICE_JOURNAL_TTL", "86400")),
+)
@@ -0,0 +1,85 @@
+# server/voicerecorder/protocol.py
+"""
+Бинарный протокол v2 для /ws/voicerecorder.
+
+Согласование — в START:
+    START {"user_id": "...", "rec_id": "...", "protocol": 2, "sample_rate": 48000, "channels": 1}
+    <- ACK START v2
+Без "protocol" (или с 1) — прежний v1: каждый бинарный кадр — WAV-файл.
+
+Кадр v2 — заголовок + int16 PCM (little-endian, каналы чередуются):
+    uint32 seq            номер кадра, с 0, подряд
+    uint32 valid_samples  сколько int16-сэмплов (по всем каналам) — звук;
+                          хвост кадра сверх этого (паддинг) отбрасывается
+    int16[...]            сэмплы
+
+Кадр не декодируется: заголовок читается struct'ом, сэмплы через memoryview
+копируются один раз — в PcmBuffer сессии.
+"""
+
+import struct
+from typing import Tuple
+
+import numpy as np
+
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+
+FRAME_HEADER = struct.Struct("<II")
+SAMPLE = np.dtype("<i2")
+
+
+class FrameError(ValueError):
+    """Кадр v2 не разбирается."""
+
+
+def parse_frame(raw: bytes, channels: int = 1) -> Tuple[int, memoryview]:
+    """Кадр v2 -> (seq, memoryview звуковых сэмплов) без копирования."""
+    if len(raw) < FRAME_HEADER.size:
+        raise FrameError("frame shorter than header")
+    seq, valid = FRAME_HEADER.unpack_from(raw, 0)
+    end = FRAME_HEADER.size + valid * SAMPLE.itemsize
+    if end > len(raw):
+        raise FrameError(f"valid_samples={valid} exceeds payload")
+    if valid % channels:
+        raise FrameError(f"valid_samples={valid} is not a multiple of channels={channels}")
+    return seq, memoryview(raw)[FRAME_HEADER.size:end]
+
+
+class PcmBuffer:
+    """
+    Растущий буфер int16: память выделяется заранее и удваивается при нехватке,
+    clear() оставляет выделенное — следующие кадры пишутся в тот же массив.
+    """
+
+    def __init__(self, capacity: int = 96000):
+        self._data = np.empty(max(capacity, 1), dtype=SAMPLE)
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def nbytes(self) -> int:
+        return self._len * SAMPLE.itemsize
+
+    @property
+    def capacity_bytes(self) -> int:
+        return self._data.nbytes
+
+    def append(self, samples) -> None:
+        arr = np.frombuffer(samples, dtype=SAMPLE)
+        need = self._len + arr.size
+        if need > self._data.size:
+            grown = np.empty(max(need, self._data.size * 2), dtype=SAMPLE)
+            grown[:self._len] = self._data[:self._len]
+            self._data = grown
+        self._data[self._len:need] = arr
+        self._len = need
+
+    def view(self) -> memoryview:
+        """Заполненная часть как байты (без копии; действительна до следующего append/clear)."""
+        return memoryview(self._data[:self._len].view(np.uint8))
+
+    def clear(self) -> None:
+        self._len = 0
@@ -5,7 +5,7 @@ from pydantic import BaseModel
 from datetime import datetime
 import uuid
 
-from supabase import create_client
+from database.supabase_client import create_traced_client
 import os
 
 router = APIRouter()
@@ -14,7 +14,7 @@ router = APIRouter()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = create_traced_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 BUCKET = "sv-storage"
 FOLDER = "voicerecorder"
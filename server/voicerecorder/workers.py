@@ -0,0 +1,156 @@
+# server/voicerecorder/workers.py
+"""
+Исполнители тяжёлой работы диктофона вне event loop.
+
+  - decode_pool — разбор входящих сегментов (CPU);
+  - io_pool     — чтение готового MP3 и синхронный Supabase (upload, insert).
+MP3 кодирует отдельный процесс ffmpeg на запись (voicerecorder.encoder) —
+это и есть «пул процессов» для кодирования: loop только пишет в его stdin.
+
+Пулы ограничены: если задач (выполняются + ждут) больше workers + max_queue,
+run() сразу бросает AudioBusy — сессия получает ошибку, а не копит хвост.
+
+SessionQueue — порядок внутри сессии: сегменты обрабатываются строго по
+одному и в порядке прихода, разные сессии — параллельно. Ошибка одного
+сегмента (например, AudioBusy) не останавливает очередь: она уходит в
+on_error, сессия сообщает клиенту, с какого кадра переслать.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+from core import metrics
+
+log = logging.getLogger("voicerecorder.workers")
+
+_seconds = metrics.histogram("voice_worker_seconds", "Voicerecorder job duration", ("pool",))
+_wait = metrics.histogram("voice_worker_wait_seconds", "Time a voicerecorder job waited for a worker", ("pool",))
+_rejected = metrics.counter("voice_worker_rejected_total", "Voicerecorder jobs rejected, pool saturated", ("pool",))
+_pending = metrics.gauge("voice_worker_pending", "Voicerecorder jobs running or queued", ("pool",))
+_session_depth = metrics.gauge("voice_session_queue_depth", "Segments queued in all recording sessions")
+
+
+class AudioBusy(Exception):
+    """Пул обработки аудио переполнен."""
+
+
+class AudioExecutor:
+    def __init__(self, name: str, workers: int = 2, max_queue: int = 64):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"voice-{name}")
+
+    async def run(self, fn: Callable, *args):
+        if self.pending >= self.workers + self.max_queue:
+            _rejected.inc(pool=self.name)
+            raise AudioBusy("Сервер обработки аудио перегружен, попробуйте позже")
+
+        queued_at = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            _wait.observe(started - queued_at, pool=self.name)
+            try:
+                return fn(*args)
+            finally:
+                _seconds.observe(time.perf_counter() - started, pool=self.name)
+
+        self.pending += 1
+        _pending.inc(pool=self.name)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self.pending -= 1
+            _pending.dec(pool=self.name)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "name": f"voice_{self.name}",
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            "rejected": _rejected.value(pool=self.name),
+        }
+
+
+class SessionQueue:
+    """
+    Очередь одной записи: handler(item) вызывается по одному, в порядке put().
+    put() ждёт, если очередь полна (backpressure на сокет). Ошибка handler'а
+    относится только к своему элементу: она передаётся в on_error(item, exc),
+    следующие элементы обрабатываются как обычно.
+    """
+
+    def __init__(self, handler: Callable[[object], Awaitable[None]], maxsize: int = 16,
+                 on_error: Optional[Callable[[object, Exception], Awaitable[None]]] = None):
+        self._handler = handler
+        self._on_error = on_error
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._task: Optional[asyncio.Task] = None
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    async def put(self, item) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+        await self._queue.put(item)
+        _session_depth.inc()
+
+    async def drain(self) -> None:
+        """Ждёт обработки всего, что уже поставлено."""
+        if self._task is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """Отменяет обработку (обрыв сессии); неразобранное выбрасывается."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        _session_depth.dec(self._queue.qsize())
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self._queue.task_done()
+
+    async def _loop(self) -> None:
+        while True:
+            item = await self._queue.get()
+            _session_depth.dec()
+            try:
+                await self._handler(item)
+            except Exception as e:
+                log.warning("voice session job failed: %s", e)
+                self.errors += 1
+                if self._on_error is not None:
+                    try:
+                        await self._on_error(item, e)
+                    except Exception:
+                        log.exception("voice session error handler failed")
+            finally:
+                self._queue.task_done()
+
+
+decode_pool = AudioExecutor(
+    "decode",
+    workers=int(os.getenv("VOICE_DECODE_WORKERS", "2")),
+    max_queue=int(os.getenv("VOICE_DECODE_MAX_QUEUE", "64")),
+)
+io_pool = AudioExecutor(
+    "io",
+    workers=int(os.getenv("VOICE_IO_WORKERS", "4")),
+    max_queue=int(os.getenv("VOICE_IO_MAX_QUEUE", "32")),
+)
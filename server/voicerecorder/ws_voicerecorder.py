@@ -1,16 +1,52 @@
 # server/voicerecorder/ws_voicerecorder.py
+"""
+/ws/voicerecorder — диктовка по WebSocket.
 
-import io
+Команды (текст):
+    START {"user_id", "rec_id", ["protocol": 2, "sample_rate", "channels"]}  -> ACK START [v2]
+    RESUME {"user_id", "rec_id"}  -> ACK RESUME {"rec_id", "last_seq", "protocol"}
+    END [{"last_seq": N}]         -> {"status": "SAVED", "url": ...}
+Бинарные кадры — сегменты (v1: WAV, v2: см. protocol.py). Каждый принятый
+кадр пишется в журнал на диске (journal.py) и подтверждается "ACK <seq>"
+(в v1 seq — номер кадра по порядку, с 0). Кадр, который не удалось принять
+(перегрузка, ошибка диска), не подтверждается: "ERR retry <seq>: ..." —
+клиент пересылает неподтверждённые кадры начиная с seq. В v1 номера в кадре
+нет: после ERR retry кадры отбрасываются, пока не придёт повтор сбойного. END с last_seq
+не сохраняет запись, пока в журнале нет всех кадров (тот же ERR retry).
+
+Обрыв сокета не теряет запись: сессия «паркуется» на VOICE_RESUME_GRACE
+секунд вместе с работающим кодировщиком, а журнал остаётся на диске до
+VOICE_JOURNAL_TTL. Клиент переподключается, шлёт RESUME и досылает кадры
+после last_seq. Если сессии в памяти уже нет (истекла или процесс
+перезапущен), она собирается заново из журнала.
+
+Память под аудио общая на процесс (budget.py): под давлением кадры очереди
+уходят на диск, а новые записи сверх лимита получают "ERR busy: ..." и
+закрытие сокета с кодом 1013 (try again later).
+"""
+
+import asyncio
+import hashlib
+import logging
 import os
 import json
 import uuid
 from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Set
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from pydub import AudioSegment
 from supabase import create_client
 
+from core import metrics
+from voicerecorder.budget import BudgetExceeded, SpillFile, SpillRef, budget
+from voicerecorder.encoder import VOICE_TMP_DIR, EncoderError, Mp3StreamEncoder, PcmFormat, decode_wav
+from voicerecorder.journal import SegmentJournal, valid_rec_id
+from voicerecorder.protocol import PROTOCOL_V1, PROTOCOL_V2, FrameError, PcmBuffer, parse_frame
+from voicerecorder.workers import AudioBusy, SessionQueue, decode_pool, io_pool
+
 router = APIRouter()
+log = logging.getLogger("voicerecorder.ws")
 
 # --- Supabase config ---
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -21,93 +57,497 @@ supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 BUCKET = "sv-storage"
 FOLDER = "voicerecorder"  # => voicerecorder/user-{user_id}/{rec_id}.mp3
 
+# сегментов в очереди одной сессии; дальше приём с сокета ждёт
+VOICE_SESSION_QUEUE = int(os.getenv("VOICE_SESSION_QUEUE", "16"))
+# v2: PCM копится в буфере сессии и уходит в ffmpeg порциями не меньше этой
+VOICE_FLUSH_SECONDS = float(os.getenv("VOICE_FLUSH_SECONDS", "1.0"))
+# сколько секунд оборванная сессия ждёт RESUME в памяти (дальше — только журнал)
+VOICE_RESUME_GRACE = float(os.getenv("VOICE_RESUME_GRACE", "120"))
+
+# живые сессии (на сокете или припаркованные): rec_id -> session
+_sessions: Dict[str, "RecordingSession"] = {}
+# задачи истечения парковки: ссылка держится до конца, ошибки — в лог
+_expiring: Set[asyncio.Task] = set()
+
+class FramesMissing(Exception):
+    """END пришёл раньше, чем в журнал легли все кадры клиента."""
+
+    def __init__(self, seq: int):
+        super().__init__(f"frames missing from seq {seq}")
+        self.seq = seq
+
+
+_active = metrics.gauge("voice_sessions_active", "Open /ws/voicerecorder sessions")
+_resumes = metrics.counter("voice_resumes_total", "Resumed recordings by source", ("source",))
+metrics.gauge(
+    "voice_sessions_parked", "Recordings waiting for RESUME after a dropped socket",
+    fn=lambda: sum(1 for s in _sessions.values() if s.ws is None),
+)
+
+
+class RecordingSession:
+    """
+    Одна запись. Сегменты уходят в SessionQueue: разбор — в decode_pool (v1)
+    или прямо в PcmBuffer (v2), затем журнал (io_pool) и PCM в ffmpeg
+    (Mp3StreamEncoder) — строго по порядку; приём с сокета при этом не ждёт
+    кодирования. END дожидается очереди, закрывает кодировщик и грузит MP3
+    в Supabase через io_pool.
+
+    Сессия держит слот budget от создания до close(); байты кадров в очереди
+    и буфера v2 учитываются в budget.used (self.charged — доля сессии).
+    """
+
+    def __init__(self, ws: Optional[WebSocket], user_id: str, rec_id: str,
+                 protocol: int = PROTOCOL_V1, fmt: Optional[PcmFormat] = None,
+                 journal: Optional[SegmentJournal] = None):
+        budget.admit()  # BudgetExceeded — запись не принимаем
+        self.admitted = True
+        self.charged = 0
+        self.spill: Optional[SpillFile] = None
+        self.ws = ws
+        self.user_id = user_id
+        self.rec_id = rec_id
+        self.protocol = protocol
+        # v1: формат задаёт первый WAV-сегмент; v2: объявлен в START
+        self.fmt = fmt
+        # MP3 кодируется по мере прихода сегментов (ffmpeg через stdin)
+        self.encoder: Optional[Mp3StreamEncoder] = None
+        ingest = self._ingest_v2 if protocol == PROTOCOL_V2 else self._ingest
+        self.queue = SessionQueue(ingest, maxsize=VOICE_SESSION_QUEUE, on_error=self._on_error)
+        # журнал создаётся на первом кадре (когда известен формат)
+        self.journal = journal
+        # кодировщик упал — MP3 пересобирается из журнала в finalize()
+        self.rebuild = False
+        self.last_seq = journal.last_seq if journal else -1
+        # v1: кадр в обработке и sha1 сбойного кадра, повтора которого ждём
+        self._current: Optional[bytes] = None
+        self._retry_digest: Optional[bytes] = None
+        self.finalized = False
+        self._expire: Optional[asyncio.TimerHandle] = None
+        # v2
+        self.buffer: Optional[PcmBuffer] = None
+        if protocol == PROTOCOL_V2:
+            self.flush_bytes = int(VOICE_FLUSH_SECONDS * fmt.sample_rate) * fmt.frame_bytes
+            # порог + один 2-секундный кадр: в обычном режиме буфер не растёт
+            self.buffer = PcmBuffer(capacity=int((VOICE_FLUSH_SECONDS + 2) * fmt.sample_rate * fmt.channels))
+            self._charge(self.buffer.capacity_bytes)
+
+    @classmethod
+    async def restore(cls, ws: WebSocket, journal: SegmentJournal) -> "RecordingSession":
+        """Сессия из журнала на диске: MP3 пересобирается из сохранённого PCM."""
+        session = cls(ws, journal.user_id, journal.rec_id, journal.meta["protocol"], journal.fmt, journal)
+        try:
+            await session._replay()
+        except BaseException:
+            await session.close(keep_journal=True)
+            raise
+        return session
+
+    async def _send(self, text: str) -> None:
+        # сокет мог оборваться, пока очередь дорабатывает — это не ошибка сессии
+        if self.ws is None:
+            return
+        try:
+            await self.ws.send_text(text)
+        except Exception:
+            pass
+
+    # ---------- память ----------
+
+    def _charge(self, n: int) -> None:
+        if self.admitted:
+            self.charged += n
+            budget.charge(n)
+
+    def _release(self, n: int) -> None:
+        if self.admitted:
+            self.charged -= n
+            budget.release(n)
+
+    async def add_segment(self, raw: bytes) -> None:
+        item = raw
+        if budget.spilling:
+            # память на исходе: кадр ждёт очереди на диске, а не в RAM
+            if self.spill is None:
+                self.spill = SpillFile(VOICE_TMP_DIR / f"{self.rec_id}.spill")
+            try:
+                item = await io_pool.run(self.spill.write, raw)
+                budget.spilled(len(raw))
+            except AudioBusy:
+                pass
+        if item is raw:
+            self._charge(len(raw))
+        await self.queue.put(item)
+
+    async def _take(self, item) -> bytes:
+        """Кадр из очереди: с диска (SpillRef) или из памяти — тогда он больше не в учёте."""
+        if isinstance(item, SpillRef):
+            return await io_pool.run(self.spill.read, item)
+        self._release(len(item))
+        return item
+
+    async def _ensure_encoder(self, fmt: PcmFormat) -> None:
+        if self.encoder is None:
+            encoder = Mp3StreamEncoder(fmt)
+            await encoder.start()
+            self.encoder = encoder
+
+    async def _replay(self) -> None:
+        """Новый кодировщик из всего PCM журнала."""
+        if self.encoder is not None:
+            await self.encoder.abort()
+            self.encoder = None
+        if self.journal is None or not self.journal.nbytes:
+            return
+        await self._ensure_encoder(self.fmt)
+        chunks = self.journal.read_chunks()
+        while (chunk := await io_pool.run(next, chunks, None)) is not None:
+            await self.encoder.write(chunk)
+
+    async def _encode(self, pcm) -> None:
+        """
+        PCM в ffmpeg. Кадр к этому моменту уже в журнале и подтверждён,
+        поэтому отказ кодировщика не теряет звук: MP3 соберётся из журнала.
+        """
+        if self.rebuild:
+            return
+        try:
+            await self._ensure_encoder(self.fmt)
+            await self.encoder.write(pcm)
+        except EncoderError as e:
+            log.warning("voice encoder failed, rebuilding from journal at END: %s", e)
+            if self.encoder is not None:
+                await self.encoder.abort()
+                self.encoder = None
+            self.rebuild = True
+
+    async def _on_error(self, item, error: Exception) -> None:
+        # кадр не в журнале и не подтверждён — клиент пришлёт его снова
+        if self.protocol == PROTOCOL_V1 and self._current is not None:
+            # кадры за ним уже в пути и получили бы его номер
+            self._retry_digest = hashlib.sha1(self._current).digest()
+        await self._send(f"ERR retry {self.last_seq + 1}: {error}")
+
+    async def _persist(self, seq: int, pcm) -> None:
+        """Кадр в журнал и ACK клиенту."""
+        if self.journal is None:
+            self.journal = await io_pool.run(
+                SegmentJournal.create, self.rec_id, self.user_id, self.protocol, self.fmt
+            )
+        await io_pool.run(self.journal.append, seq, pcm)
+        self.last_seq = seq
+        await self._send(f"ACK {seq}")
+
+    async def _ingest_v2(self, item) -> None:
+        raw = await self._take(item)
+        try:
+            seq, samples = parse_frame(raw, self.fmt.channels)
+        except FrameError as e:
+            await self._send(f"ERR bad-frame: {e}")
+            return
+        if seq <= self.last_seq:
+            return  # повтор уже принятого кадра
+        if seq != self.last_seq + 1:
+            await self._send(f"ERR gap: expected seq {self.last_seq + 1}, got {seq}")
+            return
+
+        await self._persist(seq, samples)
+        capacity = self.buffer.capacity_bytes
+        self.buffer.append(samples)
+        if self.buffer.capacity_bytes != capacity:
+            self._charge(self.buffer.capacity_bytes - capacity)
+        # под давлением памяти PCM не копится — сразу в ffmpeg (он уже в журнале)
+        if self.buffer.nbytes >= self.flush_bytes or budget.spilling:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if self.buffer is None or not len(self.buffer):
+            return
+        await self._encode(self.buffer.view())
+        self.buffer.clear()
+
+    async def _ingest(self, item) -> None:
+        self._current = None
+        raw = await self._take(item)
+        if self._retry_digest is not None:
+            if hashlib.sha1(raw).digest() != self._retry_digest:
+                return  # отправлен до ERR retry — клиент пришлёт его снова, по порядку
+            self._retry_digest = None
+        self._current = raw
+        try:
+            # Каждый бинарный chunk — полноценный WAV-сегмент (2 сек)
+            fmt, pcm = await decode_pool.run(decode_wav, raw)
+        except AudioBusy:
+            raise
+        except Exception as e:
+            await self._send(f"ERR bad-segment: {e}")
+            return
+
+        if self.fmt is None:
+            # формат записи задаёт первый сегмент
+            self.fmt = fmt
+        elif fmt != self.fmt:
+            await self._send("ERR bad-segment: format changed mid-recording")
+            return
+        await self._persist(self.last_seq + 1, pcm)
+        await self._encode(pcm)
+
+    async def finalize(self, last_seq: Optional[int] = None) -> Optional[str]:
+        """
+        Дописывает MP3 и сохраняет запись; None — сегментов не было.
+        last_seq — последний кадр клиента: FramesMissing, если в журнале его нет.
+        """
+        await self.queue.drain()
+        if last_seq is not None and self.last_seq < last_seq:
+            raise FramesMissing(self.last_seq + 1)
+        await self._flush()
+        if self.rebuild:
+            await self._replay()
+            self.rebuild = False
+        if self.encoder is None or not self.encoder.frames:
+            return None
+        # --- MP3 уже закодирован, дописываем хвост ---
+        mp3_path = await self.encoder.finish()
+        file_url = await io_pool.run(self._upload, mp3_path, int(self.encoder.duration_seconds))
+        self.finalized = True
+        return file_url
+
+    def _upload(self, mp3_path: Path, duration_seconds: int) -> str:
+        # синхронный Supabase — выполняется в io_pool
+        mp3_bytes = mp3_path.read_bytes()
+        filename = f"{self.rec_id}.mp3"
+        storage_path = f"{FOLDER}/user-{self.user_id}/{filename}"
+
+        # --- Загрузка в Supabase Storage ---
+        supabase.storage.from_(BUCKET).upload(storage_path, mp3_bytes)
+        signed = supabase.storage.from_(BUCKET).create_signed_url(
+            storage_path,
+            expires_in=60 * 60 * 24 * 365 * 10  # 10 лет
+        )
+        file_url = signed.get("signedURL")
+
+        # --- Запись в voicerecorder_records ---
+        supabase.table("voicerecorder_records").insert({
+            "user_id": self.user_id,
+            "rec_id": self.rec_id,
+            "file_name": filename,
+            "file_url": file_url,
+            "storage_path": storage_path,
+            "format": "mp3",
+            "duration_seconds": duration_seconds,
+            "size_bytes": len(mp3_bytes),
+            "created_at": datetime.utcnow().isoformat()
+        }).execute()
+        return file_url
+
+    # ---------- обрыв / продолжение ----------
+
+    def attach(self, ws: WebSocket) -> None:
+        self.ws = ws
+        if self._expire is not None:
+            self._expire.cancel()
+            self._expire = None
+
+    def park(self) -> None:
+        """Сокет оборвался: ждём RESUME VOICE_RESUME_GRACE секунд, потом — только журнал."""
+        self.ws = None
+        self._expire = asyncio.get_running_loop().call_later(VOICE_RESUME_GRACE, self._start_expire)
+
+    def _start_expire(self) -> None:
+        self._expire = None
+        task = asyncio.get_running_loop().create_task(self._expire_parked())
+        _expiring.add(task)
+        task.add_done_callback(_expire_done)
+
+    async def _expire_parked(self) -> None:
+        if self.ws is None and _sessions.get(self.rec_id) is self:
+            await self.close(keep_journal=True)
+
+    async def close(self, keep_journal: bool = False) -> None:
+        # запись сохранена, брошена или ждёт RESUME только из журнала —
+        # очередь, ffmpeg и временный MP3 не нужны
+        if _sessions.get(self.rec_id) is self:
+            del _sessions[self.rec_id]
+        if self.admitted:
+            # слот и память — до первого await: закрытие может быть прервано
+            # отменой задачи сокета, а бюджет должен сойтись
+            budget.release(self.charged)
+            budget.leave()
+            self.charged = 0
+            self.admitted = False
+        if self._expire is not None:
+            self._expire.cancel()
+            self._expire = None
+        await self.queue.close()
+        if self.encoder is not None:
+            await self.encoder.abort()
+            self.encoder = None
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.close if keep_journal else self.journal.remove)
+            self.journal = None
+        if self.spill is not None:
+            await asyncio.to_thread(self.spill.close)
+            self.spill = None
+
+
+def _expire_done(task: asyncio.Task) -> None:
+    _expiring.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.error("voice parked session expiry failed", exc_info=task.exception())
+
+
+async def _resume(ws: WebSocket, user_id: str, rec_id: str) -> Optional[RecordingSession]:
+    """Живая сессия (подхватываем у старого сокета) или сборка из журнала."""
+    session = _sessions.get(rec_id)
+    if session is not None:
+        if session.user_id != user_id:
+            return None
+        session.attach(ws)
+        _resumes.inc(source="memory")
+        return session
+
+    journal = await io_pool.run(SegmentJournal.open, rec_id)
+    if journal is None:
+        return None
+    if journal.user_id != user_id:
+        await asyncio.to_thread(journal.close)
+        return None
+    try:
+        session = await RecordingSession.restore(ws, journal)
+    except BudgetExceeded:
+        await asyncio.to_thread(journal.close)
+        raise
+    _sessions[rec_id] = session
+    _resumes.inc(source="journal")
+    return session
+
 
 @router.websocket("/ws/voicerecorder")
 async def ws_voicerecorder(ws: WebSocket):
     await ws.accept()
     await ws.send_text("Connected")
 
-    meta: dict = {}
-    segments: list[AudioSegment] = []
+    session: Optional[RecordingSession] = None
+    _active.inc()
 
     try:
         while True:
             msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(msg.get("code", 1000))
 
             # ---------- TEXT ----------
-            if "text" in msg:
+            if "text" in msg and msg["text"] is not None:
                 text = msg["text"]
 
                 # START {"user_id":"...","rec_id":"...","ext":".wav"}
+                # START {"user_id":"...","rec_id":"...","protocol":2,"sample_rate":48000,"channels":1}
                 if text.startswith("START"):
                     try:
                         payload_text = text[5:].strip()
                         payload = json.loads(payload_text or "{}")
 
-                        meta["user_id"] = payload.get("user_id")
-                        meta["rec_id"] = payload.get("rec_id") or str(uuid.uuid4())
-                        meta["ext"] = payload.get("ext") or ".wav"
+                        user_id = payload.get("user_id")
+                        rec_id = payload.get("rec_id") or str(uuid.uuid4())
 
-                        if not meta["user_id"]:
+                        if not user_id:
                             await ws.send_text("ERR no user_id")
                             continue
+                        if not valid_rec_id(rec_id):
+                            await ws.send_text("ERR bad rec_id")
+                            continue
+
+                        protocol = int(payload.get("protocol") or PROTOCOL_V1)
+                        if protocol not in (PROTOCOL_V1, PROTOCOL_V2):
+                            await ws.send_text(f"ERR unsupported protocol {protocol}")
+                            continue
+                        fmt = None
+                        if protocol == PROTOCOL_V2:
+                            fmt = PcmFormat(int(payload["sample_rate"]), int(payload.get("channels") or 1))
 
-                        segments = []
-                        await ws.send_text("ACK START")
+                        # новая запись вместо прежней на этом сокете
+                        if session is not None:
+                            await session.close()
+                            session = None
+                        # rec_id чужой (или своей оборванной) записи: START её не
+                        # перезаписывает — продолжить можно только через RESUME
+                        if rec_id in _sessions or await io_pool.run(SegmentJournal.exists, rec_id):
+                            await ws.send_text("ERR rec_id in use")
+                            continue
+                        session = RecordingSession(ws, user_id, rec_id, protocol, fmt)
+                        _sessions[rec_id] = session
+                        await ws.send_text("ACK START v2" if protocol == PROTOCOL_V2 else "ACK START")
+                    except BudgetExceeded as e:
+                        await ws.send_text(f"ERR busy: {e}")
+                        await ws.close(code=1013)
+                        return
                     except Exception as e:
                         await ws.send_text(f"ERR bad START: {e}")
 
+                # RESUME {"user_id":"...","rec_id":"..."}
+                elif text.startswith("RESUME"):
+                    try:
+                        payload = json.loads(text[6:].strip() or "{}")
+                        user_id = payload.get("user_id")
+                        rec_id = payload.get("rec_id")
+
+                        if session is not None and session.rec_id != rec_id:
+                            await session.close()
+                            session = None
+                        resumed = await _resume(ws, user_id, rec_id) if user_id and rec_id else None
+                        if resumed is None:
+                            session = None
+                            await ws.send_text("ERR unknown rec_id")
+                            continue
+                        session = resumed
+                        # кадры, уже стоящие в очереди, тоже должны попасть в last_seq
+                        await session.queue.drain()
+                        await ws.send_text("ACK RESUME " + json.dumps({
+                            "rec_id": session.rec_id,
+                            "last_seq": session.last_seq,
+                            "protocol": session.protocol,
+                        }))
+                    except BudgetExceeded as e:
+                        # журнал цел — клиент повторит RESUME позже
+                        await ws.send_text(f"ERR busy: {e}")
+                        await ws.close(code=1013)
+                        return
+                    except Exception as e:
+                        await ws.send_text(f"ERR bad RESUME: {e}")
+
                 elif text.startswith("END"):
-                    if not meta.get("user_id"):
+                    if session is None:
                         await ws.send_text("ERR no user/session")
                         continue
-                    if not segments:
-                        await ws.send_text("ERR no segments")
-                        continue
 
                     try:
-                        # --- Склеиваем все WAV-сегменты в один AudioSegment ---
-                        full_audio = segments[0]
-                        for seg in segments[1:]:
-                            full_audio += seg
-
-                        # --- Конвертация в MP3 ---
-                        mp3_buf = io.BytesIO()
-                        full_audio.export(mp3_buf, format="mp3", bitrate="128k")
-                        mp3_buf.seek(0)
-
-                        user_id = meta["user_id"]
-                        rec_id = meta["rec_id"]
-                        filename = f"{rec_id}.mp3"
-                        storage_path = f"{FOLDER}/user-{user_id}/{filename}"
-
-                        # --- Загрузка в Supabase Storage ---
-                        supabase.storage.from_(BUCKET).upload(storage_path, mp3_buf.read())
-                        signed = supabase.storage.from_(BUCKET).create_signed_url(
-                            storage_path,
-                            expires_in=60 * 60 * 24 * 365 * 10  # 10 лет
-                        )
-                        file_url = signed.get("signedURL")
-
-                        # --- Запись в voicerecorder_records ---
-                        supabase.table("voicerecorder_records").insert({
-                            "user_id": user_id,
-                            "rec_id": rec_id,
-                            "file_name": filename,
-                            "file_url": file_url,
-                            "storage_path": storage_path,
-                            "format": "mp3",
-                            "duration_seconds": int(full_audio.duration_seconds),
-                            "size_bytes": len(mp3_buf.getvalue()),
-                            "created_at": datetime.utcnow().isoformat()
-                        }).execute()
+                        payload = json.loads(text[3:].strip() or "{}")
+                        file_url = await session.finalize(payload.get("last_seq"))
+                        if file_url is None:
+                            await ws.send_text("ERR no segments")
+                            continue
+
+                        # запись сохранена: журнал и кодировщик убираем до ответа
+                        await session.close()
+                        session = None
 
                         # Ответ фронту
                         await ws.send_text(json.dumps({"status": "SAVED", "url": file_url}))
                         await ws.close(code=1000)
                         return
 
+                    except FramesMissing as e:
+                        # не всё в журнале — клиент дошлёт кадры и повторит END
+                        await ws.send_text(f"ERR retry {e.seq}: {e}")
+                        continue
+
                     except Exception as e:
+                        # журнал остаётся: можно RESUME и повторить END. Сессию в
+                        # памяти (её кодировщик END уже закрыл) не паркуем —
+                        # RESUME соберёт MP3 заново из журнала
+                        if session is not None:
+                            await session.close(keep_journal=True)
+                            session = None
                         await ws.send_text(f"ERR processing: {e}")
                         await ws.close(code=4000)
                         return
@@ -116,20 +556,25 @@ async def ws_voicerecorder(ws: WebSocket):
                     await ws.send_text("ERR unknown command")
 
             # ---------- BINARY ----------
-            elif "bytes" in msg:
+            elif "bytes" in msg and msg["bytes"] is not None:
                 raw = msg["bytes"]
                 if not raw:
                     continue
-
-                try:
-                    # Каждый бинарный chunk — полноценный WAV-сегмент (2 сек)
-                    seg_audio = AudioSegment.from_file(io.BytesIO(raw), format="wav")
-                    segments.append(seg_audio)
-                except Exception as e:
-                    await ws.send_text(f"ERR bad-segment: {e}")
+                if session is None:
+                    await ws.send_text("ERR no user/session")
+                    continue
+                await session.add_segment(raw)
 
     except WebSocketDisconnect:
         try:
             await ws.close(code=1001)
         except Exception:
             pass
+    finally:
+        _active.dec()
+        # сессию мог подхватить RESUME с другого сокета — тогда она уже не наша
+        if session is not None and session.ws is ws:
+            if session.finalized or session.journal is None:
+                await session.close()
+            else:
+                session.park()
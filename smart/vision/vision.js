@@ -14,6 +14,7 @@ if (!USER_ID) {
 }
 
 const API = "/api/vision";
+const STEPS_PAGE = 50;
 
 // -------------------------------------------------------
 // 2. Получаем ID визии
@@ -61,9 +62,14 @@ function cleanText(str) {
 // -------------------------------------------------------
 // 5. Загрузить визию
 // -------------------------------------------------------
+// Шаги грузим порциями: последние STEPS_PAGE при открытии,
+// более ранние — по кнопке, новые — дельтой по курсору since.
+let loadedSteps = [];
+let stepsCursors = { before: null, since: null };
+
 async function loadVision() {
   try {
-    const res = await fetch(`${API}/${VISION_ID}?user_id=${USER_ID}`);
+    const res = await fetch(`${API}/${VISION_ID}?user_id=${USER_ID}&steps_limit=${STEPS_PAGE}`);
     if (!res.ok) {
       alert("Ошибка загрузки визии");
       return;
@@ -72,7 +78,10 @@ async function loadVision() {
     const data = await res.json();
     renderHeader(data.vision, data.participants);
     renderParticipants(data.participants);
-    renderSteps(data.steps);
+
+    loadedSteps = data.steps;
+    stepsCursors = data.cursors || { before: null, since: null };
+    renderSteps(loadedSteps);
 
   } catch (err) {
     console.error(err);
@@ -80,6 +89,52 @@ async function loadVision() {
   }
 }
 
+async function fetchSteps(cursorParam) {
+  const res = await fetch(
+    `${API}/${VISION_ID}/steps?user_id=${USER_ID}&limit=${STEPS_PAGE}&${cursorParam}`
+  );
+  if (!res.ok) throw new Error(`steps ${res.status}`);
+  return res.json();
+}
+
+// только шаги, добавленные после последней загрузки
+// (сервер повторяет и несколько последних — сливаем по id)
+async function loadNewSteps() {
+  if (!stepsCursors.since) return loadVision();
+
+  let page;
+  do {
+    page = await fetchSteps(`since=${encodeURIComponent(stepsCursors.since)}`);
+    loadedSteps = mergeSteps(loadedSteps, page.steps);
+    stepsCursors.since = page.cursors.since;
+  } while (page.has_more);
+
+  renderSteps(loadedSteps);
+}
+
+function mergeSteps(steps, incoming) {
+  const byId = new Map(steps.map((s) => [s.id, s]));
+  for (const s of incoming) byId.set(s.id, s);
+  return [...byId.values()].sort(
+    (a, b) => new Date(a.created_at) - new Date(b.created_at) || a.id - b.id
+  );
+}
+
+// предыдущая порция истории
+async function loadOlderSteps() {
+  if (!stepsCursors.before) return;
+
+  try {
+    const page = await fetchSteps(`before=${encodeURIComponent(stepsCursors.before)}`);
+    loadedSteps = page.steps.concat(loadedSteps);
+    stepsCursors.before = page.cursors.before;
+    renderSteps(loadedSteps, { keepScroll: true });
+  } catch (err) {
+    console.error(err);
+    alert("Ошибка загрузки шагов");
+  }
+}
+
 // -------------------------------------------------------
 // 6. Рендер заголовка и метаданных
 // -------------------------------------------------------
@@ -130,10 +185,19 @@ function renderParticipants(parts) {
 // -------------------------------------------------------
 // 8. Рендер шагов (user + ai)
 // -------------------------------------------------------
-function renderSteps(steps) {
+function renderSteps(steps, opts = {}) {
   if (!elSteps) return;
+  const prevHeight = elSteps.scrollHeight;
   elSteps.innerHTML = "";
 
+  if (stepsCursors.before) {
+    const more = document.createElement("button");
+    more.className = "steps-load-older";
+    more.textContent = "Показать ранние шаги";
+    more.addEventListener("click", loadOlderSteps);
+    elSteps.appendChild(more);
+  }
+
   steps.forEach(s => {
     const wrapper = document.createElement("div");
     wrapper.className = "step-item";
@@ -160,8 +224,10 @@ function renderSteps(steps) {
     elSteps.appendChild(wrapper);
   });
 
-  // автоскролл вниз
-  elSteps.scrollTop = elSteps.scrollHeight;
+  // автоскролл вниз (при подгрузке истории — остаёмся на месте)
+  elSteps.scrollTop = opts.keepScroll
+    ? elSteps.scrollHeight - prevHeight
+    : elSteps.scrollHeight;
 }
 
 // -------------------------------------------------------
@@ -194,7 +260,7 @@ async function addStep() {
       return;
     }
 
-    await loadVision();
+    await loadNewSteps();
     elAddBtn.disabled = false;
 
   } catch (err) {
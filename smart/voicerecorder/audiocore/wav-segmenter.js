@@ -85,7 +85,7 @@ export default class WavSegmenter {
         const copyLen = Math.min(tail.length, segLen);
         padded.set(tail.subarray(0, copyLen), 0);
         tail = padded;
-        this._emitSegment(tail, this.segmentSeconds);
+        this._emitSegment(tail, this.segmentSeconds, copyLen);
       } else {
         // Режим "как есть" — короткий последний сегмент
         const seconds = this._carry.length / this.sampleRate;
@@ -97,7 +97,7 @@ export default class WavSegmenter {
   }
 
   // ---- internal helpers ----
-  _emitSegment(f32, durationSec) {
+  _emitSegment(f32, durationSec, validSamples = f32.length) {
     const useF32 = this.normalize
       ? this._normalizeToTarget(f32, this.normalizeTarget)
       : f32;
@@ -107,6 +107,7 @@ export default class WavSegmenter {
       sampleRate: this.sampleRate,
       durationSec,
       pcmInt16,
+      validSamples, // без паддинга
       blob: null,
     };
     if (this.emitBlobPerSegment) {
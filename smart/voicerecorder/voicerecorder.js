@@ -29,7 +29,15 @@ let segmenter = null;
 let ws = null;
 let rec_id = null;
 let recording = false;
-let segments = [];
+let segments = [];   // отправленные, но ещё не подтверждённые сегменты
+let ackedSeq = -1;   // последний seq, записанный сервером в журнал
+let lastSeq = -1;    // последний seq, выданный сегментером (для END)
+let retryTimer = null; // ERR retry: повторная отправка неподтверждённых
+let ready = false;   // сервер ответил на START / RESUME — можно слать кадры
+let ending = false;  // нажат STOP, ждём SAVED
+let saved = false;
+let started = false; // сервер принял START — после обрыва шлём RESUME
+let busy = false;    // сервер отказал (ERR busy) — повтор с паузой
 
 // WS URL
 function getWsUrl() {
@@ -68,50 +76,146 @@ startBtn.onclick = async () => {
     });
 
     segments = [];
-    segmenter.onSegment = (seg) => segments.push(seg);
+    ackedSeq = -1;
+    lastSeq = -1;
+    ending = false;
+    saved = false;
+    started = false;
+    busy = false;
+    // сегменты уходят сразу и хранятся до подтверждения сервером (ACK <seq>)
+    segmenter.onSegment = (seg) => {
+        segments.push(seg);
+        lastSeq = seg.seq;
+        sendSegment(seg);
+    };
 
     audioCore.onAudioFrame = (frame) => segmenter.pushFrame(frame);
 
-    const wsUrl = getWsUrl();
-    ws = new WebSocket(wsUrl);
+    rec_id = crypto.randomUUID();
+    connect(false);
 
-    ws.onopen = () => {
-        rec_id = crypto.randomUUID();
+    recording = true;
+    startBtn.disabled = true;
+    pauseBtn.disabled = false;
+    stopBtn.disabled = false;
+};
+
+// -------------------------------------------------------------
+// WS: START / RESUME после обрыва
+// -------------------------------------------------------------
+function connect(resume) {
+    ready = false;
+    ws = new WebSocket(getWsUrl());
 
+    ws.onopen = () => {
+        if (resume) {
+            ws.send("RESUME " + JSON.stringify({ user_id: USER_ID, rec_id }));
+            return;
+        }
         ws.send(
             "START " +
             JSON.stringify({
                 user_id: USER_ID,
                 rec_id,
-                ext: ".wav",
+                // протокол v2: кадры = заголовок (seq, valid_samples) + int16 PCM
+                protocol: 2,
+                sample_rate: audioCore.getContext().sampleRate,
+                channels: 1,
             })
         );
-
         setStatus("Recording…");
     };
 
-    ws.onmessage = (ev) => {
-        try {
-            const data = JSON.parse(ev.data);
-            if (data.status === "SAVED") {
-                player.src = data.url;
-                player.classList.remove("sv-player--disabled");
-                setStatus("Saved ✓");
-
-                // AUTO reload history
-                loadHistory();
-            }
-        } catch {}
+    ws.onmessage = (ev) => onServerMessage(ev.data);
+    ws.onerror = () => setStatus("WebSocket error");
+    ws.onclose = () => {
+        console.log("[WS CLOSED]");
+        // обрыв посреди записи: переподключаемся и досылаем хвост
+        // (если START не был принят — повторяем START, сегменты ждут локально)
+        if (!saved && (recording || ending)) {
+            if (!busy) setStatus("Переподключение…");
+            setTimeout(() => connect(started), busy ? 5000 : 1000);
+        }
     };
+}
 
-    ws.onerror = () => setStatus("WebSocket error");
-    ws.onclose = () => console.log("[WS CLOSED]");
+function onServerMessage(text) {
+    if (/^ACK \d+$/.test(text)) {
+        ackedSeq = Math.max(ackedSeq, Number(text.slice(4)));
+        segments = segments.filter((seg) => seg.seq > ackedSeq);
+        return;
+    }
+    if (text.startsWith("ACK START") || text.startsWith("ACK RESUME ")) {
+        started = true;
+        busy = false;
+        if (text.startsWith("ACK RESUME ")) {
+            ackedSeq = JSON.parse(text.slice("ACK RESUME ".length)).last_seq;
+            segments = segments.filter((seg) => seg.seq > ackedSeq);
+        }
+        // всё, что накопилось до ответа (или не подтверждено до обрыва)
+        ready = true;
+        for (const seg of segments) ws.send(makeFrameV2(seg));
+        if (ending) sendEnd();
+        else setStatus("Recording…");
+        return;
+    }
+    if (text.startsWith("ERR retry")) {
+        // сервер не принял кадр (перегрузка / диск): через паузу шлём
+        // неподтверждённые заново, уже принятые он пропустит по seq
+        if (!retryTimer) {
+            retryTimer = setTimeout(() => {
+                retryTimer = null;
+                if (!ws || !ready || ws.readyState !== WebSocket.OPEN) return;
+                for (const seg of segments) ws.send(makeFrameV2(seg));
+                if (ending) sendEnd();
+            }, 1000);
+        }
+        return;
+    }
+    if (text.startsWith("ERR busy")) {
+        busy = true;
+        setStatus("Сервер занят, повтор…");
+        return;
+    }
+    if (text.startsWith("ERR unknown rec_id")) {
+        ending = false;
+        setStatus("Запись потеряна на сервере");
+        return;
+    }
+    try {
+        const data = JSON.parse(text);
+        if (data.status === "SAVED") {
+            saved = true;
+            ending = false;
+            player.src = data.url;
+            player.classList.remove("sv-player--disabled");
+            setStatus("Saved ✓");
+
+            // AUTO reload history
+            loadHistory();
+        }
+    } catch {}
+}
 
-    recording = true;
-    startBtn.disabled = true;
-    pauseBtn.disabled = false;
-    stopBtn.disabled = false;
-};
+// END с номером последнего кадра: сервер не сохранит запись без всех кадров
+function sendEnd() {
+    ws.send("END " + JSON.stringify({ last_seq: lastSeq }));
+}
+
+function sendSegment(seg) {
+    // до ответа на START / RESUME не шлём: после RESUME хвост уйдёт целиком
+    if (ws && ready && ws.readyState === WebSocket.OPEN) ws.send(makeFrameV2(seg));
+}
+
+// Кадр протокола v2: uint32 seq, uint32 valid_samples (LE), затем int16 PCM
+function makeFrameV2(seg) {
+    const frame = new Uint8Array(8 + seg.pcmInt16.byteLength);
+    const header = new DataView(frame.buffer, 0, 8);
+    header.setUint32(0, seg.seq, true);
+    header.setUint32(4, seg.validSamples, true);
+    frame.set(new Uint8Array(seg.pcmInt16.buffer, seg.pcmInt16.byteOffset, seg.pcmInt16.byteLength), 8);
+    return frame;
+}
 
 // -------------------------------------------------------------
 // PAUSE / RESUME
@@ -141,18 +245,11 @@ stopBtn.onclick = async () => {
     setStatus("Processing…");
 
     audioCore.pauseCapture();
+    // последний (неполный) сегмент уходит через onSegment
     segmenter.stop();
 
-    const toSend = segments.slice();
-    segments = [];
-
-    for (const seg of toSend) {
-        const wavBlob = segmenter._makeWavBlob(seg.pcmInt16, seg.sampleRate, 1);
-        const buf = await wavBlob.arrayBuffer();
-        ws.send(new Uint8Array(buf));
-    }
-
-    ws.send("END");
+    ending = true;
+    if (ws && ready && ws.readyState === WebSocket.OPEN) sendEnd();
 
     recording = false;
     audioCore.stop();